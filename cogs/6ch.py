@@ -1,13 +1,26 @@
 # RT Ext - 6ch
 
+from typing import TYPE_CHECKING, Dict
+
 from aiofiles import open as async_open
-from ujson import load, dumps
+from ujson import loads
 from random import randint
 from datetime import date
+from os import rename
 import reprypt
 
 from discord.ext import commands
 
+from rtlib.ext.message_router import route
+
+if TYPE_CHECKING:
+    from aiomysql import Pool
+
+
+TABLES = ("SixChThread", "SixChChannel", "SixChPost", "SixChNickname")
+OLD_PATH = "data/6ch.json"
+PER_PAGE = 10
+
 
 def rname() -> str:
     chars = ""
@@ -16,21 +29,152 @@ def rname() -> str:
     return chars
 
 
-class SixChannel(commands.Cog):
-    def __init__(self, bot):
-        self.bot, self.rt = bot, bot.data
-        self.data = {"thread": {}, "nickname": {}, "id": {}}
-        self.path = "data/6ch.json"
+class DataManager:
+    def __init__(self, cog: "SixChannel"):
+        self.cog = cog
+        self.pool: "Pool" = cog.bot.mysql.pool
+        self.cog.bot.loop.create_task(self._prepare_table())
+
+    async def _prepare_table(self):
+        # テーブルの準備をする。このクラスのインスタンス化時に自動で実行される。
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"""CREATE TABLE IF NOT EXISTS {TABLES[0]} (
+                        Name VARCHAR(100) PRIMARY KEY NOT NULL,
+                        Author BIGINT, Count INT
+                    );"""
+                )
+                await cursor.execute(
+                    f"""CREATE TABLE IF NOT EXISTS {TABLES[1]} (
+                        ChannelID BIGINT PRIMARY KEY NOT NULL,
+                        Name VARCHAR(100)
+                    );"""
+                )
+                await cursor.execute(
+                    f"""CREATE TABLE IF NOT EXISTS {TABLES[2]} (
+                        Name VARCHAR(100), Number INT, Content TEXT,
+                        PRIMARY KEY (Name, Number)
+                    );"""
+                )
+                await cursor.execute(
+                    f"""CREATE TABLE IF NOT EXISTS {TABLES[3]} (
+                        UserID BIGINT PRIMARY KEY NOT NULL, Nickname TEXT
+                    );"""
+                )
+                await self._migrate(cursor)
+                # キャッシュを用意しておく。ログはキャッシュしない。
+                await cursor.execute(f"SELECT * FROM {TABLES[0]};")
+                for row in await cursor.fetchall():
+                    if row:
+                        self.cog.threads[row[0]] = {
+                            "author": row[1], "count": row[2]
+                        }
+                await cursor.execute(f"SELECT * FROM {TABLES[1]};")
+                for row in await cursor.fetchall():
+                    if row:
+                        self.cog.channels[row[0]] = row[1]
+                await cursor.execute(f"SELECT * FROM {TABLES[3]};")
+                for row in await cursor.fetchall():
+                    if row:
+                        self.cog.nicknames[row[0]] = row[1]
+
+    async def _migrate(self, cursor) -> None:
+        # 以前のJSONのデータをデータベースに移行する。移行後のファイルは名前を変えておく。
         try:
-            with open(self.path, "r") as f:
-                self.data = load(f)
-        except Exception:
-            with open(self.path, "w") as f:
-                f.write(dumps(self.data))
+            async with async_open(OLD_PATH, "r") as f:
+                data = loads(await f.read())
+        except (FileNotFoundError, ValueError):
+            return
+        if not data.get("thread") and not data.get("nickname"):
+            return
+        for name, thread in data.get("thread", {}).items():
+            await cursor.execute(
+                f"INSERT IGNORE INTO {TABLES[0]} VALUES (%s, %s, %s);",
+                (name, thread["author"], thread["count"])
+            )
+            await cursor.executemany(
+                f"INSERT IGNORE INTO {TABLES[1]} VALUES (%s, %s);",
+                [(channel_id, name) for channel_id in thread["channels"]]
+            )
+            await cursor.executemany(
+                f"INSERT IGNORE INTO {TABLES[2]} VALUES (%s, %s, %s);",
+                [(name, number, content)
+                 for number, content in enumerate(thread["log"])]
+            )
+        await cursor.executemany(
+            f"INSERT IGNORE INTO {TABLES[3]} VALUES (%s, %s);",
+            [(int(user_id), nickname)
+             for user_id, nickname in data.get("nickname", {}).items()]
+        )
+        rename(OLD_PATH, f"{OLD_PATH}.migrated")
 
-    async def save(self, path, data, indent):
-        async with async_open(path, "w") as f:
-            await f.write(dumps(data, indent=indent))
+    async def add_thread(self, name: str, author_id: int) -> None:
+        "スレッドを作ります。"
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"INSERT INTO {TABLES[0]} VALUES (%s, %s, %s);",
+                    (name, author_id, 0)
+                )
+        self.cog.threads[name] = {"author": author_id, "count": 0}
+
+    async def connect_channel(self, channel_id: int, name: str) -> None:
+        "チャンネルをスレッドに接続します。"
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"""INSERT INTO {TABLES[1]} VALUES (%s, %s)
+                        ON DUPLICATE KEY UPDATE Name = VALUES(Name);""",
+                    (channel_id, name)
+                )
+        self.cog.channels[channel_id] = name
+
+    async def set_nickname(self, user_id: int, nickname: str) -> None:
+        "ニックネームを設定します。"
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"""INSERT INTO {TABLES[3]} VALUES (%s, %s)
+                        ON DUPLICATE KEY UPDATE Nickname = VALUES(Nickname);""",
+                    (user_id, nickname)
+                )
+        self.cog.nicknames[user_id] = nickname
+
+    async def add_post(self, name: str, number: int, content: str) -> None:
+        "書き込みを追加します。"
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"INSERT INTO {TABLES[2]} VALUES (%s, %s, %s);",
+                    (name, number, content)
+                )
+                await cursor.execute(
+                    f"UPDATE {TABLES[0]} SET Count = %s WHERE Name = %s;",
+                    (number + 1, name)
+                )
+
+    async def get_posts(self, name: str, page: int) -> list:
+        "書き込みを新しい順に取得します。"
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"""SELECT Content FROM {TABLES[2]} WHERE Name = %s
+                        ORDER BY Number DESC LIMIT %s OFFSET %s;""",
+                    (name, PER_PAGE, PER_PAGE * page)
+                )
+                return [row[0] for row in await cursor.fetchall() if row]
+
+
+class SixChannel(commands.Cog, DataManager):
+    def __init__(self, bot):
+        self.bot, self.rt = bot, bot.data
+        self.threads: Dict[str, dict] = {}
+        # チャンネルIDから接続しているスレッドの名前を引くためのものです。
+        self.channels: Dict[int, str] = {}
+        self.nicknames: Dict[int, str] = {}
+        self.ids: Dict[int, str] = {}
+        super(commands.Cog, self).__init__(self)
 
     @commands.group(
         name="6ch", aliases=["ch"], extras={
@@ -49,12 +193,12 @@ class SixChannel(commands.Cog):
         --------
         6ch, BBS。"""
         if not ctx.invoked_subcommand:
-            if self.data["thread"]:
+            if self.threads:
                 n = "".join(
                     (f"{key.replace('@', '＠')}, 作者："
                      + getattr(self.bot.get_user(data["author"]), "name", "???")
                          .replace("@", "＠"))
-                    for key, data in list(self.data["thread"].items())
+                    for key, data in list(self.threads.items())
                 )
                 await ctx.reply(n)
             else:
@@ -79,16 +223,12 @@ class SixChannel(commands.Cog):
         ----------
         name : str
             The name of the thread to be created."""
-        if name in self.data["thread"]:
+        if name in self.threads:
             await ctx.reply("その名前のスレッドは既にあります。")
+        elif len(name) > 100:
+            await ctx.reply("スレッドの名前は100文字以内にしてください。")
         else:
-            self.data["thread"][name] = {
-                "log": [],
-                "author": ctx.author.id,
-                "channels": [],
-                "count": 0
-            }
-            await self.save(self.path, self.data, 4)
+            await self.add_thread(name, ctx.author.id)
             await ctx.reply("設定しました。")
 
     @sixch.command(aliases=["cng"])
@@ -102,12 +242,31 @@ class SixChannel(commands.Cog):
         ----------
         name : str
             接続するスレッドの名前です。"""
-        if name in self.data["thread"]:
-            self.data["thread"][name]["channels"].append(ctx.channel.id)
+        if name in self.threads:
+            await self.connect_channel(ctx.channel.id, name)
             await ctx.reply("設定しました。")
         else:
             await ctx.reply("その名前のスレッドが見つかりませんでした。")
 
+    @sixch.command()
+    async def log(self, ctx, page: int = 1, *, name=None):
+        """!lang ja
+        --------
+        スレッドの書き込みを新しい順に表示します。
+
+        Parameters
+        ----------
+        page : int, default 1
+            ページです。一ページに十件表示されます。
+        name : str, optional
+            スレッドの名前です。指定しない場合は実行したチャンネルのスレッドになります。"""
+        if (name := name or self.channels.get(ctx.channel.id)) not in self.threads:
+            return await ctx.reply("その名前のスレッドが見つかりませんでした。")
+        if (posts := await self.get_posts(name, max(page - 1, 0))):
+            await ctx.reply("\n\n".join(reversed(posts))[:2000])
+        else:
+            await ctx.reply("書き込みがありません。")
+
     @sixch.command(name="del", aliases=["delete", "remove", "rm"])
     async def _del(self, ctx):
         await ctx.reply("`rt!info`からサポートサーバーにて管理者に問い合わせてください。")
@@ -122,39 +281,32 @@ class SixChannel(commands.Cog):
         ----------
         name : str
             ニックネームです。"""
-        self.data["nickname"][str(ctx.author.id)] = name
-        await self.save(self.path, self.data, 4)
+        await self.set_nickname(ctx.author.id, name)
         await ctx.reply("設定しました。")
 
-    @commands.Cog.listener()
+    @route(channels="channels")
     async def on_message(self, message):
-        if message.author.bot or message.content.startswith("rt!"):
+        if message.content.startswith("rt!"):
             return
 
-        for name in self.data["thread"]:
-            chs = self.data["thread"][name]["channels"]
-            if message.channel.id in chs:
-                data = self.data["thread"][name]
-                u = self.data["nickname"].get(
-                    str(message.author.id), message.author.name)
-                # もし通報時用のユーザーIDがなかったら作る。
-                if str(message.author.id) not in self.data:
-                    # Repryptで送信者のIDを暗号化してできたIDを使う。
-                    uid = reprypt.encrypt(
-                        str(message.author.id), "6chの語源はRT")
-                    self.data["id"][str(message.author.id)] = uid
-                # メッセージ作成。
-                uid = self.data["id"][str(message.author.id)]
-                c = f"{data['count']}：**{u}**：{date.today()}：{uid}"
-                c += "\n" + message.clean_content
-                # カウントアップする。
-                self.data["thread"][name]["count"] += 1
-                # 送信する。
-                await message.delete()
-                await message.channel.send(c)
-                self.data["thread"][name]["log"].append(c)
-                await self.save(self.path, self.data, 4)
-                break
+        if (name := self.channels.get(message.channel.id)) in self.threads:
+            data = self.threads[name]
+            u = self.nicknames.get(message.author.id, message.author.name)
+            # もし通報時用のユーザーIDがなかったら作る。
+            if message.author.id not in self.ids:
+                # Repryptで送信者のIDを暗号化してできたIDを使う。
+                self.ids[message.author.id] = reprypt.encrypt(
+                    str(message.author.id), "6chの語源はRT")
+            # メッセージ作成。
+            uid = self.ids[message.author.id]
+            c = f"{data['count']}：**{u}**：{date.today()}：{uid}"
+            c += "\n" + message.clean_content
+            # カウントアップする。
+            number, data["count"] = data["count"], data["count"] + 1
+            # 送信する。
+            await message.delete()
+            await message.channel.send(c)
+            await self.add_post(name, number, c)
 
 
 def setup(bot):
@@ -4,6 +4,7 @@ from discord.ext import commands
 import discord
 
 from rtlib import DatabaseManager, setting
+from rtlib.ext.join_pipeline import JoinContext, join_stage
 
 
 class DataManager(DatabaseManager):
@@ -102,6 +103,7 @@ class AutoRole(commands.Cog, DataManager):
         if onoff:
             if role:
                 await self.write(ctx.guild.id, role.id)
+                self.bot.dispatch("join_config_update", ctx.guild.id)
                 await ctx.reply("Ok")
             else:
                 await ctx.reply(
@@ -110,19 +112,16 @@ class AutoRole(commands.Cog, DataManager):
                 )
         else:
             await self.delete(ctx.guild.id)
+            self.bot.dispatch("join_config_update", ctx.guild.id)
             await ctx.reply("Ok")
 
-    @commands.Cog.listener()
-    async def on_member_join(self, member):
-        row = await self.read(member.guild.id)
-        if row:
-            if (role := member.guild.get_role(row[1])):
-                try:
-                    await member.add_roles(role)
-                except discord.Forbidden:
-                    pass
-            else:
-                await self.delete(member.guild.id)
+    @join_stage(30, loader="read")
+    async def on_join(self, context: JoinContext, row: tuple):
+        if context.member.guild.get_role(row[1]):
+            context.add_roles(row[1])
+        else:
+            await self.delete(context.member.guild.id)
+            self.bot.dispatch("join_config_update", context.member.guild.id)
 
 
 def setup(bot):
@@ -1,5 +1,7 @@
 from discord.ext import commands
 import discord
+
+from rtlib.ext.message_router import route
 from asyncio import sleep
 
 CHP_HELP = {
@@ -29,12 +31,8 @@ class Autopublic(commands.Cog):
                 lang, *CHP_HELP[lang]
             )
         
-    @commands.Cog.listener()
+    @route(topic="rt>autopublic", prefixed=True)
     async def on_message(self, message):
-        if not hasattr(message.channel, "topic"):
-            return
-        if not message.guild or message.author.bot or not message.channel.topic:
-            return
         for line in message.channel.topic.splitlines():
             if line.startswith("rt>autopublic"):
                 await message.publish()
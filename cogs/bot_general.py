@@ -1,6 +1,6 @@
 # RT - Bog General
 
-from typing import Dict
+from typing import Optional, Dict, List
 
 from discord.ext import commands, tasks
 import discord
@@ -14,6 +14,7 @@ from time import time
 
 from .server_tool import PERMISSION_TEXTS
 from rtlib.ext import Embeds, componesy
+from rtutil.bktree import BKTree, get_tolerance
 from rtlib import RT
 
 
@@ -87,8 +88,33 @@ class BotGeneral(commands.Cog):
         self.cache: Dict[int, Dict[str, float]] = defaultdict(dict)
         self.remove_cache.start()
 
+        # コマンドが見つからない時の候補を探すための木です。
+        # コマンドの数が作った時から変わっている場合は次に使う時に作り直す。
+        self.command_index: Optional[BKTree] = None
+        self.command_names: Dict[str, str] = {}
+
         self.make_embed_template()
 
+    def build_command_index(self) -> BKTree:
+        "コマンドの名前とエイリアスから候補を探すための木を作ります。"
+        self.command_names = {
+            name: command.name for command in self.bot.commands
+            for name in chain((command.name,), command.aliases)
+        }
+        self.command_index = BKTree(self.command_names)
+        return self.command_index
+
+    def suggest(self, word: str, length: int = 5) -> List[str]:
+        "打ち間違えたコマンドの名前から近いコマンドの名前を近い順に取得します。"
+        index = self.command_index
+        if index is None or len(self.command_names) != len(self.bot.all_commands):
+            index = self.build_command_index()
+        suggestions = []
+        for _, name in index.search(word.lower(), get_tolerance(word)):
+            if (name := self.command_names[name]) not in suggestions:
+                suggestions.append(name)
+        return suggestions[:length]
+
     def make_embed_template(self):
         # RT情報Embedsを作る。
         embeds = self.info_embeds = []
@@ -134,6 +160,10 @@ class BotGeneral(commands.Cog):
     async def on_ready(self):
         self.on_error_channel = self.bot.get_channel(ERROR_CHANNEL)
 
+    @commands.Cog.listener()
+    async def on_full_ready(self):
+        self.build_command_index()
+
     def _get_ping(self) -> str:
         # pingを返します。
         return "%.1f" % round(self.bot.latency * 1000, 1)
@@ -242,21 +272,14 @@ class BotGeneral(commands.Cog):
     async def on_command_error(self, ctx: commands.Context, error: Exception):
         # エラー時のメッセージ。翻訳はdescriptionのみ。
         kwargs, color = {}, self.bot.colors["error"]
+        if isinstance(error, commands.errors.CommandNotFound) and not self.bot._load:
+            # 起動中は`cogs._first`が起動中であることを伝える。
+            # エクステンションを読み込みながらコマンドを受け付けるため、このコグが先に読み込まれた場合に二重に返信しないようにする。
+            return
         if isinstance(error, commands.errors.CommandNotFound):
             # 実行しようとしたコマンドを考える。
             suggestion = f"`{suggestion}`" if (
-                suggestion := "`, `".join(
-                    command.name for command in self.bot.commands
-                    if any(
-                        any(
-                            len(cmd_name[i:i + 3]) > 2
-                            and cmd_name[i:i + 3] in ctx.message.content
-                            for i in range(3)
-                        ) for cmd_name in chain(
-                            (command.name,), command.aliases
-                        )
-                    )
-                )
+                suggestion := "`, `".join(self.suggest(ctx.invoked_with or ""))
             ) else "?"
             title = "404 Not Found"
             description = {
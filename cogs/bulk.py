@@ -1,31 +1,93 @@
 # RT - Bulk
 
-from typing import Union, Literal, List
+from typing import TYPE_CHECKING, Optional, Union, Literal, Dict, List, Tuple
 
 from discord.ext import commands
 import discord
 
+from ujson import loads, dumps
+
+from rtutil.jobs import Job, RateLimited
 from rtlib import setting
 
+if TYPE_CHECKING:
+    from aiomysql import Pool
+
 
 GuildRole = Union[discord.Role, Literal["everyone"]]
 Mode = Literal["add", "remove"]
+TABLE = "BulkJob"
+MAX_FAILED = 20
+
+
+class DataManager:
+    def __init__(self, cog: "Bulk"):
+        self.cog = cog
+        self.pool: "Pool" = cog.bot.mysql.pool
+        self.cog.bot.loop.create_task(self._prepare_table())
+
+    async def _prepare_table(self):
+        # テーブルの準備をする。このクラスのインスタンス化時に自動で実行される。
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"""CREATE TABLE IF NOT EXISTS {TABLE} (
+                        JobID BIGINT PRIMARY KEY NOT NULL,
+                        GuildID BIGINT, Data JSON
+                    );"""
+                )
+                await cursor.execute(f"SELECT * FROM {TABLE};")
+                rows = await cursor.fetchall()
+        # 再起動前に実行中だった処理を再開する。
+        await self.cog.bot.wait_until_ready()
+        for row in rows:
+            if row and (data := loads(row[2]))["state"] in ("running", "paused"):
+                self.cog.start_job(row[0], row[1], data)
+
+    async def save_job(self, job_id: int, guild_id: int, data: dict) -> None:
+        "処理の状態を保存します。"
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"""INSERT INTO {TABLE} VALUES (%s, %s, %s)
+                        ON DUPLICATE KEY UPDATE Data = VALUES(Data);""",
+                    (job_id, guild_id, dumps(data))
+                )
+
+    async def delete_job(self, job_id: int) -> None:
+        "処理の状態を削除します。"
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"DELETE FROM {TABLE} WHERE JobID = %s;", (job_id,)
+                )
+
 
+class Bulk(commands.Cog, DataManager):
+
+    PROGRESS_INTERVAL = 5.0
+    STATES = {
+        "running": {"ja": "実行中", "en": "Running"},
+        "paused": {"ja": "一時停止中", "en": "Paused"},
+        "cancelled": {"ja": "中止", "en": "Cancelled"},
+        "done": {"ja": "完了", "en": "Completed"}
+    }
 
-class Bulk(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
+        self.jobs: Dict[int, Tuple[Job, dict]] = {}
+        super(commands.Cog, self).__init__(self)
 
     def add_error_field(
-        self, embed: discord.Embed, failed_members: List[discord.Member], t: str
+        self, embed: discord.Embed, failed_members: List[Tuple[int, str]], t: str
     ) -> discord.Embed:
         # ここのtには`送信`とかが入る。
         embed.add_field(
             name={"ja": f"{t}に失敗したメンバー一覧",
                   "en": f"List of members who failed {t}"},
             value=("\n".join(
-                f"{member.mention}\n　{e}"
-                for member, e in failed_members)
+                f"<@{member_id}>\n　{e}"
+                for member_id, e in failed_members)
                 if failed_members else {
                     "ja": f"{t}に失敗したメンバーはいません。",
                     "en": f"No member has failed {t}."
@@ -33,6 +95,122 @@ class Bulk(commands.Cog):
         )
         return embed
 
+    @staticmethod
+    def get_targets(guild: discord.Guild, data: dict) -> List[int]:
+        "処理の対象のメンバーのIDを昇順で取得します。"
+        return sorted(
+            member.id for member in guild.members
+            if not member.bot and member.id != data.get("exclude")
+            and (data["target"] == "everyone"
+                 or member.get_role(data["target"]) is not None)
+        )
+
+    def make_action(self, guild: discord.Guild, data: dict):
+        "メンバーごとに実行する処理を作ります。"
+        async def action(member_id: int) -> None:
+            if (member := guild.get_member(member_id)) is None:
+                return
+            try:
+                if data["mode"] == "send":
+                    await member.send(data["content"])
+                elif data["mode"] == "add":
+                    await member.add_roles(discord.Object(data["role"]))
+                else:
+                    await member.remove_roles(discord.Object(data["role"]))
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    raise RateLimited(float(
+                        e.response.headers.get("Retry-After", 1)
+                    ))
+                raise Exception(
+                    "権限不足またはメンバーがDMを許可していません。"
+                    if data["mode"] == "send" else
+                    "権限が足りないかなんかでできませんでした。"
+                )
+        return action
+
+    def make_embed(self, job: Job, data: dict) -> discord.Embed:
+        "処理の進捗のEmbedを作ります。"
+        processed = data["processed"] + job.processed
+        total = data["processed"] + job.total
+        embed = discord.Embed(
+            title={
+                "ja": "メッセージ一括送信" if data["mode"] == "send" else "役職の一括付与/剥奪",
+                "en": "Bulk send" if data["mode"] == "send" else "Bulk role add/remove"
+            }, description=(
+                f"{processed}/{total} "
+                f"`{'#' * int(processed / (total or 1) * 20):.<20}`"
+            ), color=self.bot.colors["normal"]
+        )
+        embed.add_field(name="State", value=self.STATES[job.state])
+        embed.set_footer(text=f"JobID: {data['id']}")
+        return self.add_error_field(
+            embed, data["failed"] + job.failed[:MAX_FAILED - len(data["failed"])],
+            "送信" if data["mode"] == "send" else "役職の付与/剥奪"
+        )
+
+    def start_job(self, job_id: int, guild_id: int, data: dict) -> Optional[Job]:
+        "処理を開始します。"
+        if (guild := self.bot.get_guild(guild_id)) is None:
+            self.bot.loop.create_task(self.delete_job(job_id))
+            return
+        data["id"] = job_id
+
+        async def on_progress(job: Job):
+            # 進捗を保存してEmbedを編集する。
+            saved = dict(
+                data, cursor=job.cursor, state=job.state,
+                processed=data["processed"] + job.processed, failed=(data["failed"] + job.failed)[:MAX_FAILED]
+            )
+            if job.state in ("done", "cancelled"):
+                await self.delete_job(job_id)
+                del self.jobs[job_id]
+            else:
+                await self.save_job(job_id, guild_id, saved)
+            if (channel := guild.get_channel(data["channel"])) and data["message"]:
+                try:
+                    await channel.get_partial_message(data["message"]) \
+                        .edit(embed=self.make_embed(job, data))
+                except discord.HTTPException:
+                    pass
+
+        job = Job(
+            self.get_targets(guild, data), self.make_action(guild, data),
+            data["cursor"], on_progress=on_progress,
+            interval=self.PROGRESS_INTERVAL
+        )
+        if data["state"] == "paused":
+            job.pause()
+        self.jobs[job_id] = (job, data)
+        self.bot.loop.create_task(job.run())
+        return job
+
+    async def create_job(self, ctx, data: dict) -> None:
+        "処理を作成して開始します。"
+        job_id = discord.utils.time_snowflake(discord.utils.utcnow())
+        data.update(
+            cursor=0, state="running", failed=[], processed=0,
+            channel=getattr(ctx.channel, "id", 0), message=0
+        )
+        await self.save_job(job_id, ctx.guild.id, data)
+        if (job := self.start_job(job_id, ctx.guild.id, data)) is None:
+            return
+        if isinstance(ctx.channel, discord.TextChannel):
+            data["message"] = (
+                await ctx.channel.send(embed=self.make_embed(job, data))
+            ).id
+        await ctx.reply(
+            {"ja": f"一括処理を開始しました。JobID: `{job_id}`\n"
+                   f"`{ctx.prefix}bulk job pause/resume/cancel {job_id}`で操作できます。",
+             "en": f"Started the bulk job. JobID: `{job_id}`\n"
+                   f"You can control it with `{ctx.prefix}bulk job pause/resume/cancel {job_id}`."}
+        )
+
+    def get_job(self, ctx, job_id: int) -> Optional[Tuple[Job, dict]]:
+        "実行したサーバーの処理を取得します。"
+        if (job := self.jobs.get(job_id)) and job[1].get("guild") == ctx.guild.id:
+            return job
+
     @commands.group(
         extras={
             "headding": {
@@ -111,31 +289,10 @@ class Bulk(commands.Cog):
         ```
         """
         await ctx.trigger_typing()
-
-        failed_members = []
-
-        for member in ctx.guild.members:
-            if member.id != ctx.author.id and not member.bot:
-                # もし送信対象が役職でmemberが役職を持っていないならcontinueする。
-                if isinstance(target, discord.Role):
-                    if member.get_role(target.id) is None:
-                        continue
-
-                try:
-                    await member.send(content)
-                except (discord.HTTPException, discord.Forbidden) as e:
-                    failed_members.append(
-                        (member, "権限不足またはメンバーがDMを許可していません。"))
-                except Exception as e:
-                    failed_members.append(
-                        (member, f"何らかの理由で送れませんでした。`{e}`"))
-
-        embed = discord.Embed(
-            title={"ja": "メッセージ一括送信が完了しました。", "en": "It has completed to send the message to the members collectively."},
-            color=self.bot.colors["normal"]
-        )
-        embed = self.add_error_field(embed, failed_members, "送信")
-        await ctx.reply(embed=embed)
+        await self.create_job(ctx, {
+            "mode": "send", "content": content, "guild": ctx.guild.id,
+            "target": getattr(target, "id", "everyone"), "exclude": ctx.author.id
+        })
 
     @bulk.group()
     @commands.has_guild_permissions(manage_roles=True)
@@ -226,35 +383,78 @@ class Bulk(commands.Cog):
             A role witch adds or removes.
         """
         await ctx.trigger_typing()
+        await self.create_job(ctx, {
+            "mode": mode, "role": role.id, "guild": ctx.guild.id,
+            "target": getattr(target, "id", "everyone")
+        })
 
-        failed_members = []
+    @bulk.group()
+    @commands.has_guild_permissions(administrator=True)
+    async def job(self, ctx):
+        """!lang ja
+        --------
+        実行中の一括処理を操作するコマンドグループです。
 
-        for member in ctx.guild.members:
-            if not member.bot:
-                # もし対象者が特定の役職を持っている人でその役職をmemberが持ってないならcontinueする。
-                if isinstance(target, discord.Role):
-                    if member.get_role(target.id) is None:
-                        continue
-                try:
-                    if mode == "add":
-                        await member.add_roles(role)
-                    else:
-                        await member.remove_roles(role)
-                except (discord.Forbidden, discord.HTTPException):
-                    failed_members.append(
-                        (member, "権限が足りないかなんかでできませんでした。")
-                    )
-                except Exception as e:
-                    failed_members.append(
-                        (member, f"なんらかの原因でできませんでした。`{e}`")
-                    )
+        !lang en
+        --------
+        This is the command group to control running bulk jobs."""
+        if not ctx.invoked_subcommand:
+            await ctx.reply(
+                "\n".join(
+                    f"`{job_id}` {data['mode']} {job.state} {job.processed}/{job.total}"
+                    for job_id, (job, data) in self.jobs.items()
+                    if data.get("guild") == ctx.guild.id
+                ) or {"ja": "実行中の一括処理はありません。",
+                      "en": "There are no bulk jobs running."}
+            )
 
-        embed = discord.Embed(
-            title={"ja": "役職付与/剥奪の一括送信が完了しました。", "en": "It has completed to add/remove a role to the members collectively."},
-            color=self.bot.colors["normal"]
-        )
-        embed = self.add_error_field(embed, failed_members, "役職の付与/剥奪")
-        await ctx.reply(embed=embed)
+    async def _control(self, ctx, job_id: int, method: str):
+        # 一括処理を一時停止/再開/中止する。
+        if (job := self.get_job(ctx, job_id)) is None:
+            return await ctx.reply(
+                {"ja": "その一括処理は見つかりませんでした。",
+                 "en": "That bulk job was not found."}
+            )
+        getattr(job[0], method)()
+        if job[0].state != "cancelled":
+            # 中止した場合は処理の終了時に削除される。
+            await self.save_job(job_id, ctx.guild.id, dict(
+                job[1], cursor=job[0].cursor, state=job[0].state
+            ))
+        await ctx.reply("Ok")
+
+    @job.command()
+    async def pause(self, ctx, job_id: int):
+        """!lang ja
+        --------
+        一括処理を一時停止します。
+
+        !lang en
+        --------
+        Pauses the bulk job."""
+        await self._control(ctx, job_id, "pause")
+
+    @job.command()
+    async def resume(self, ctx, job_id: int):
+        """!lang ja
+        --------
+        一時停止した一括処理を再開します。
+
+        !lang en
+        --------
+        Resumes the paused bulk job."""
+        await self._control(ctx, job_id, "resume")
+
+    @job.command()
+    async def cancel(self, ctx, job_id: int):
+        """!lang ja
+        --------
+        一括処理を中止します。
+
+        !lang en
+        --------
+        Cancels the bulk job."""
+        await self._control(ctx, job_id, "cancel")
 
 
 def setup(bot):
@@ -7,6 +7,7 @@ import discord
 
 from rtutil import DatabaseManager as RUDatabaseManager
 from rtlib import RT, DatabaseManager, websocket
+from rtlib.ext.join_pipeline import JoinContext, join_stage
 
 from aiomysql import Pool, Cursor
 from ujson import loads, dumps
@@ -282,6 +283,7 @@ class Captcha(commands.Cog, DataManager, TimeoutDataManager):
         Also, if you want to set a timeout for authentication, use something like `rt!ct <how many minutes to timeout> <kick (on/off)>`. (Default is `rt!ct 60 off`)"""
         if role is None:
             await self.delete(ctx.channel)
+            self.bot.dispatch("join_config_update", ctx.guild.id)
         elif mode == "click":
             return await ctx.send(
                 str(role.id), embed=discord.Embed(
@@ -296,6 +298,7 @@ class Captcha(commands.Cog, DataManager, TimeoutDataManager):
                 extras = mode
                 mode = "word"
             await self.save(ctx.channel, mode, role.id, extras)
+            self.bot.dispatch("join_config_update", ctx.guild.id)
         await ctx.reply("Ok")
 
     @commands.command()
@@ -316,14 +319,13 @@ class Captcha(commands.Cog, DataManager, TimeoutDataManager):
         )
         await self.init_table()
 
-    @commands.Cog.listener()
-    async def on_member_join(self, member: discord.Member):
-        if (not self.bot.is_ready() or member.bot
-                or (key := f"{member.guild.id}-{member.id}") in self.cache):
-            # 準備中,Botまたは既に認証を送信したのなら何もしない。
+    @join_stage(10, loader="load")
+    async def on_join(self, context: JoinContext, row: tuple):
+        member = context.member
+        if member.bot or (key := f"{member.guild.id}-{member.id}") in self.cache:
+            # Botまたは既に認証を送信したのなら何もしない。
             return
 
-        row = await self.load(member.guild.id)
         if len(row) >= 4:
             captcha = self.captchas[row[2]]
             channel = discord.utils.get(member.guild.text_channels, id=row[1])
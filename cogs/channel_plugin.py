@@ -3,6 +3,8 @@
 from discord.ext import commands
 import discord
 
+from rtlib.ext.message_router import route
+from rtlib.media import append_urls
 from rtlib import RT
 
 from inspect import cleandoc
@@ -10,6 +12,9 @@ from asyncio import sleep
 from re import findall
 
 
+TOPIC_DIRECTIVES = ("rt>asp", "rt>ce", "rt>embed", "rt>kick ")
+
+
 HELPS = {
     "ChannelPluginGeneral": {
         "ja": (
@@ -71,87 +76,88 @@ class ChannelPluginGeneral(commands.Cog):
                     HELPS[command_name][lang][1]
                 )
 
-    @commands.Cog.listener()
+    @route(topic=TOPIC_DIRECTIVES, bots=True, prefixed=True)
     async def on_message(self, message: discord.Message):
-        if isinstance(message.channel, discord.Thread):
-            return
-        if not message.guild or message.author.discriminator == "0000":
+        if message.author.discriminator == "0000":
             return
 
-        if message.channel.topic:
-            for cmd in message.channel.topic.splitlines():
-                if cmd.startswith("rt>asp"):
-                    # Auto Spoiler
-                    content = message.clean_content
+        for cmd in message.channel.topic.splitlines():
+            if cmd.startswith("rt>asp"):
+                # Auto Spoiler
+                content = message.clean_content
+
+                # urlをスポイラーにする。
+                for url in findall(self.URL_PATTERN, content):
+                    content = content.replace(url, f"||{url}||", 1)
+                # もしスポイラーワードが設定されているならそれもスポイラーにする。
+                for word in cmd.split()[1:]:
+                    content = content.replace(word, f"||{word}||")
+                # Embedに画像が設定されているなら外してスポイラーを付けた画像URLをフィールドに入れて追加する。
+                e = False
+                for index in range(len(message.embeds)):
+                    if message.embeds[index].image.url is not message.embeds[index].Empty:
+                        message.embeds[index].add_field(
+                            name="この埋め込みに設定されている画像",
+                            value=f"||{message.embeds[index].image.url}||"
+                        )
+                        message.embeds[index].set_image(url=message.embeds[index].Empty)
+                        e = True
 
+                # 送信し直す。
+                if ((message.content and message.clean_content != content)
+                        or message.attachments or (message.embeds and e)):
                     # 添付ファイルをスポイラーにする。
-                    new = []
-                    for attachment in message.attachments:
-                        attachment.filename = f"SPOILER_{attachment.filename}"
-                        new.append(await attachment.to_file())
-                    # urlをスポイラーにする。
-                    for url in findall(self.URL_PATTERN, content):
-                        content = content.replace(url, f"||{url}||", 1)
-                    # もしスポイラーワードが設定されているならそれもスポイラーにする。
-                    for word in cmd.split()[1:]:
-                        content = content.replace(word, f"||{word}||")
-                    # Embedに画像が設定されているなら外してスポイラーを付けた画像URLをフィールドに入れて追加する。
-                    e = False
-                    for index in range(len(message.embeds)):
-                        if message.embeds[index].image.url is not message.embeds[index].Empty:
-                            message.embeds[index].add_field(
-                                name="この埋め込みに設定されている画像",
-                                value=f"||{message.embeds[index].image.url}||"
-                            )
-                            message.embeds[index].set_image(url=message.embeds[index].Empty)
-                            e = True
-
-                    # 送信し直す。
-                    if ((message.content and message.clean_content != content)
-                            or message.attachments or (message.embeds and e)):
-                        # 送信しなおす。
+                    async with self.bot.media.fetch(
+                        message.attachments, message.guild.id,
+                        message.guild.filesize_limit
+                    ) as (medias, skipped):
                         if message.reference:
                             content = f"返信先：{message.reference.jump_url}\n{content}"
                         await message.channel.webhook_send(
-                            content, files=new, embeds=message.embeds,
+                            append_urls(content, skipped, True),
+                            files=[media.to_file(True) for media in medias],
+                            embeds=message.embeds,
                             username=message.author.display_name + " RT's Auto Spoiler",
                             avatar_url=message.author.avatar.url,
                         )
-                        try:
-                            await message.delete()
-                        except (discord.NotFound, discord.Forbidden):
-                            pass
-                elif cmd.startswith("rt>ce"):
-                    # Can't Edit
+                    try:
+                        await message.delete()
+                    except (discord.NotFound, discord.Forbidden):
+                        pass
+            elif cmd.startswith("rt>ce"):
+                # Can't Edit
+                async with self.bot.media.fetch(
+                    message.attachments, message.guild.id,
+                    message.guild.filesize_limit
+                ) as (medias, skipped):
                     await message.channel.webhook_send(
-                        message.clean_content, files=[
-                            await at.to_file()
-                            for at in message.attachments
-                        ], username=message.author.display_name,
+                        append_urls(message.clean_content, skipped),
+                        files=[media.to_file() for media in medias],
+                        username=message.author.display_name,
                         avatar_url=message.author.avatar.url
                     )
-                    await message.delete()
-                elif cmd.startswith("rt>embed"):
-                    # Auto Embed
-                    await self.bot.cogs["ServerTool"].embed(
-                        await self.bot.get_context(message), "null",
-                        content=message.content
-                    )
-                    await message.delete()
-                elif cmd.startswith("rt>kick "):
-                    # Kick
-                    for word in cmd.split()[1:]:
-                        if word not in message.content:
-                            try:
-                                await message.author.kick(
-                                    reason=f"[ChannelPlugin]{word}がメッセージになかったため。"
-                                )
-                            except discord.Forbidden:
-                                await message.reply(
-                                    "必要なメッセージがないのでキックしようとしましたが権限がないのでできませんでした。"
-                                )
-                            finally:
-                                break
+                await message.delete()
+            elif cmd.startswith("rt>embed"):
+                # Auto Embed
+                await self.bot.cogs["ServerTool"].embed(
+                    await self.bot.get_context(message), "null",
+                    content=message.content
+                )
+                await message.delete()
+            elif cmd.startswith("rt>kick "):
+                # Kick
+                for word in cmd.split()[1:]:
+                    if word not in message.content:
+                        try:
+                            await message.author.kick(
+                                reason=f"[ChannelPlugin]{word}がメッセージになかったため。"
+                            )
+                        except discord.Forbidden:
+                            await message.reply(
+                                "必要なメッセージがないのでキックしようとしましたが権限がないのでできませんでした。"
+                            )
+                        finally:
+                            break
 
 
 def setup(bot):
@@ -1,12 +1,21 @@
 # RT - Delay Delete Message
 
-from discord.ext import commands, tasks
+from typing import Optional, Dict, List, Tuple
+
+from discord.ext import commands
 import discord
 
+from rtlib.ext.message_router import route
 from rtlib import RT, DatabaseManager, setting
+from rtutil.deadline import DeadlineHeap
+from datetime import datetime, timedelta, timezone
 from time import time
 
 
+# 一括削除ができるのは作られてから十四日以内のメッセージです。余裕を持たせておく。
+BULK_LIMIT = timedelta(days=13, hours=23)
+
+
 class DataManager(DatabaseManager):
 
     DB = "DelayDelete"
@@ -32,15 +41,19 @@ class DataManager(DatabaseManager):
         )
         return await cursor.cursor.fetchall()
 
-    async def write(self, cursor, channel_id: int, message_id: int, delay: int) -> None:
+    async def write(
+        self, cursor, channel_id: int, message_id: int, delete_time: int
+    ) -> Optional[int]:
+        "書き込みます。覚えられる数を超えた場合は忘れたメッセージのIDを返します。"
         target = {"ChannelID": channel_id}
-        delete_target = target
+        delete_target, removed = target, None
         if len(rows := await self._gets(cursor, channel_id)) >= self._maxsize:
-            delete_target["MessageID"] = rows[-1][1]
+            delete_target["MessageID"] = removed = rows[-1][1]
             await cursor.delete(self.DB, delete_target)
         delete_target["MessageID"] = message_id
-        delete_target["DeleteTime"] = int(time() + delay)
+        delete_target["DeleteTime"] = delete_time
         await cursor.insert_data(self.DB, delete_target)
+        return removed
 
     async def reads(self, cursor) -> list:
         return [row async for row in cursor.get_datas(self.DB, {})
@@ -51,16 +64,34 @@ class DataManager(DatabaseManager):
         if await cursor.exists(self.DB, target):
             await cursor.delete(self.DB, target)
 
+    async def deletes(self, cursor, keys: List[Tuple[int, int]]) -> None:
+        await cursor.cursor.executemany(
+            f"DELETE FROM {self.DB} WHERE ChannelID = %s AND MessageID = %s;",
+            keys
+        )
+
 
 class DelayDelete(commands.Cog, DataManager):
     def __init__(self, bot: RT):
         self.bot = bot
+        self.deadlines = DeadlineHeap(
+            self.delete_due, self.bot.loop, self.bot.on_error
+        )
         self.bot.loop.create_task(self.init_database())
 
     async def init_database(self):
         super(commands.Cog, self).__init__(self.bot.mysql)
         await self.init_table()
-        self.delete_loop.start()
+        for row in await self.reads():
+            self.deadlines.push((row[0], row[1]), row[2])
+        self.deadlines.start()
+
+    async def add(self, channel_id: int, message_id: int, delay: int) -> None:
+        "遅延削除するメッセージを追加します。"
+        delete_time = int(time() + delay)
+        if (removed := await self.write(channel_id, message_id, delete_time)):
+            self.deadlines.remove((channel_id, removed))
+        self.deadlines.push((channel_id, message_id), delete_time)
 
     @commands.command(
         aliases=["dd", "遅延削除"], extras={
@@ -129,20 +160,15 @@ class DelayDelete(commands.Cog, DataManager):
             avatar_url=getattr(ctx.author.avatar, "url", None),
             wait=True, content=content.replace("@", "＠")
         )
-        await self.write(ctx.channel.id, new.id, 60 * minutes)
+        await self.add(ctx.channel.id, new.id, 60 * minutes)
         await ctx.message.delete()
 
-    @commands.Cog.listener()
+    @route(topic="rt>delaydelete ", prefixed=True)
     async def on_message(self, message: discord.Message):
-        if (not message.guild or message.author.bot
-                or isinstance(message.channel, discord.Thread)
-                or not message.channel.topic):
-            return
-
         for line in message.channel.topic.splitlines():
             if line.startswith("rt>delaydelete "):
                 try:
-                    await self.write(
+                    await self.add(
                         message.channel.id, message.id,
                         60 * int(line.replace("rt>delaydelete ", ""))
                     )
@@ -152,22 +178,40 @@ class DelayDelete(commands.Cog, DataManager):
                     )
 
     def cog_unload(self):
-        self.delete_loop.cancel()
-
-    @tasks.loop(seconds=30)
-    async def delete_loop(self):
-        now = time()
-        for row in await self.reads():
-            if row[-1] <= now:
-                channel = self.bot.get_channel(row[0])
-                if channel:
-                    try:
-                        message = await channel.fetch_message(row[1])
-                        await message.delete()
-                    except Exception as e:
-                        if self.bot.test:
-                            print("Error on Delay Delete:", e)
-                await self.delete(row[0], row[1])
+        self.deadlines.close()
+
+    async def _delete(self, channel: discord.TextChannel, message_ids: List[int]) -> None:
+        # 十四日以内のメッセージは百個ずつまとめて削除して、それ以外は一つずつ削除する。
+        limit = datetime.now(timezone.utc) - BULK_LIMIT
+        bulk, singles = [], []
+        for message_id in message_ids:
+            (bulk if discord.utils.snowflake_time(message_id) > limit else singles) \
+                .append(message_id)
+        for i in range(0, len(bulk), 100):
+            if len(chunk := bulk[i:i + 100]) == 1:
+                singles.extend(chunk)
+                continue
+            try:
+                await channel.delete_messages(list(map(discord.Object, chunk)))
+            except discord.HTTPException:
+                # 既に消されているメッセージがあるなどで失敗した場合は一つずつ削除する。
+                singles.extend(chunk)
+        for message_id in singles:
+            try:
+                await channel.get_partial_message(message_id).delete()
+            except Exception as e:
+                if self.bot.test:
+                    print("Error on Delay Delete:", e)
+
+    async def delete_due(self, items: List[Tuple[Tuple[int, int], None]]) -> None:
+        # 期限が来たメッセージをチャンネルごとにまとめて削除する。
+        channels: Dict[int, List[int]] = {}
+        for (channel_id, message_id), _ in items:
+            channels.setdefault(channel_id, []).append(message_id)
+        for channel_id, message_ids in channels.items():
+            if (channel := self.bot.get_channel(channel_id)):
+                await self._delete(channel, message_ids)
+        await self.deletes([key for key, _ in items])
 
 
 def setup(bot):
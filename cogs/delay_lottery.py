@@ -1,15 +1,19 @@
 # RT - Delay Lottery
 
-from discord.ext import commands, tasks
+from typing import Dict, List, Tuple
+
+from discord.ext import commands
 import discord
 
 from rtlib import RT, DatabaseManager, setting
+from rtutil.deadline import DeadlineHeap
 from time import time
 
 
 class DataManager(DatabaseManager):
 
     DB = "DelayLottery"
+    ENTRANT_DB = "DelayLotteryEntrant"
 
     def __init__(self, db, maxsize=30):
         self.db = db
@@ -19,16 +23,29 @@ class DataManager(DatabaseManager):
         await cursor.create_table(
             self.DB, {
                 "GuildID": "BIGINT", "Date": "BIGINT",
-                "ChannelID": "BIGINT", "MessageID": "BIGINT"
+                "ChannelID": "BIGINT", "MessageID": "BIGINT",
+                "Count": "INT"
             }
         )
+        # 当選者の数の列がない以前のテーブルには列を追加する。
+        await cursor.cursor.execute(f"SHOW COLUMNS FROM {self.DB} LIKE 'Count';")
+        if not await cursor.cursor.fetchone():
+            await cursor.cursor.execute(f"ALTER TABLE {self.DB} ADD Count INT;")
+        await cursor.cursor.execute(
+            f"""CREATE TABLE IF NOT EXISTS {self.ENTRANT_DB} (
+                MessageID BIGINT, UserID BIGINT, PRIMARY KEY (MessageID, UserID)
+            );"""
+        )
 
     async def write(
         self, cursor, guild_id: int, date: int,
-        channel_id: int, message_id: int
+        channel_id: int, message_id: int, count: int
     ) -> None:
         target = {"GuildID": guild_id}
-        change = {"Date": date, "ChannelID": channel_id, "MessageID": message_id}
+        change = {
+            "Date": date, "ChannelID": channel_id, "MessageID": message_id,
+            "Count": count
+        }
         if len(
             [row async for row in cursor.get_datas(self.DB, target)
              if row]
@@ -47,10 +64,29 @@ class DataManager(DatabaseManager):
         }
         if await cursor.exists(self.DB, target):
             await cursor.delete(self.DB, target)
+        await cursor.cursor.execute(
+            f"DELETE FROM {self.ENTRANT_DB} WHERE MessageID = %s;", (message_id,)
+        )
 
     async def delete_guild(self, cursor, guild_id: int) -> None:
         await cursor.delete(self.DB, {"GuildID": guild_id})
 
+    async def add_entrant(self, cursor, message_id: int, user_id: int) -> None:
+        await cursor.cursor.execute(
+            f"INSERT IGNORE INTO {self.ENTRANT_DB} VALUES (%s, %s);",
+            (message_id, user_id)
+        )
+
+    async def remove_entrant(self, cursor, message_id: int, user_id: int) -> None:
+        await cursor.cursor.execute(
+            f"DELETE FROM {self.ENTRANT_DB} WHERE MessageID = %s AND UserID = %s;",
+            (message_id, user_id)
+        )
+
+    async def read_entrants(self, cursor) -> List[Tuple[int, int]]:
+        await cursor.cursor.execute(f"SELECT * FROM {self.ENTRANT_DB};")
+        return [row for row in await cursor.cursor.fetchall() if row]
+
     async def reads(self, cursor) -> dict:
         data = {}
         async for row in cursor.get_datas(self.DB, {}):
@@ -70,12 +106,34 @@ class DelayLottery(commands.Cog, DataManager):
 
     def __init__(self, bot: RT):
         self.bot = bot
+        # 抽選のメッセージのIDから抽選の情報と参加者のIDを引くためのものです。
+        self.lotteries: Dict[int, dict] = {}
+        self.deadlines = DeadlineHeap(
+            self.draw, self.bot.loop, self.bot.on_error
+        )
         self.bot.loop.create_task(self.init_database())
 
     async def init_database(self):
         super(commands.Cog, self).__init__(self.bot.mysql)
         await self.init_table()
-        self.lottery_worker.start()
+        for guild_id, rows in (await self.reads()).items():
+            for date, channel_id, message_id, count in rows:
+                self.add_lottery(guild_id, date, channel_id, message_id, count)
+        for message_id, user_id in await self.read_entrants():
+            if message_id in self.lotteries:
+                self.lotteries[message_id]["entrants"].add(user_id)
+        self.deadlines.start()
+
+    def add_lottery(
+        self, guild_id: int, date: int, channel_id: int, message_id: int,
+        count: int
+    ) -> None:
+        "抽選を追加して期限が来たら抽選を行うようにします。"
+        self.lotteries[message_id] = {
+            "guild": guild_id, "channel": channel_id, "count": count,
+            "entrants": set()
+        }
+        self.deadlines.push(message_id, date)
 
     @commands.command(
         aliases=["dl", "期限抽選"], extras={
@@ -160,8 +218,8 @@ class DelayLottery(commands.Cog, DataManager):
         )
         try:
             await self.write(
-                mes.guild.id, int(time() + 60 * minutes),
-                mes.channel.id, mes.id
+                mes.guild.id, (date := int(time() + 60 * minutes)),
+                mes.channel.id, mes.id, count
             )
         except OverflowError:
             await ctx.reply(
@@ -170,43 +228,60 @@ class DelayLottery(commands.Cog, DataManager):
             )
             await mes.delete()
         else:
+            self.add_lottery(mes.guild.id, date, mes.channel.id, mes.id, count)
             for emoji in self.EMOJIS.values():
                 await mes.add_reaction(emoji)
 
-    @tasks.loop(seconds=31)
-    async def lottery_worker(self):
-        now = time()
-        for guild_id, rows in (await self.reads()).items():
-            guild = self.bot.get_guild(guild_id)
-            if guild:
-                for row in rows:
-                    if row[0] < now:
-                        if (channel := guild.get_channel(row[1])):
-                            message = await channel.fetch_message(row[2])
-                            if message.reactions:
-                                members = (await message.reactions[0].users().flatten())[1:]
-                                await self.bot.cogs["ServerTool"].lottery(
-                                    await self.bot.get_context(message),
-                                    (length if (
-                                        c := int(message.content)
-                                    ) > (length := len(members))
-                                    else c),
-                                    target=members
-                                )
-                    else:
-                        continue
-                    await self.delete(guild_id, row[1], row[2])
-            else:
-                await self.delete_guild(guild_id)
+    async def _draw(self, message_id: int, data: dict) -> None:
+        # 参加者の中から`lottery`コマンドで当選者を選んで発表する。
+        if (guild := self.bot.get_guild(data["guild"])) is None \
+                or (channel := guild.get_channel(data["channel"])) is None:
+            return
+        message = await channel.fetch_message(message_id)
+        if data["count"] is None:
+            # 当選者の数が保存されていない以前の抽選はメッセージから参加者を取得する。
+            count, members = int(message.content), [
+                member async for user in message.reactions[0].users()
+                if not user.bot and (member := guild.get_member(user.id))
+            ] if message.reactions else []
+        else:
+            count, members = data["count"], [
+                member for user_id in data["entrants"]
+                if (member := guild.get_member(user_id)) is not None
+            ]
+        if members:
+            await self.bot.cogs["ServerTool"].lottery(
+                await self.bot.get_context(message),
+                min(count, len(members)), target=members
+            )
+
+    async def draw(self, items: List[Tuple[int, None]]) -> None:
+        # 期限が来た抽選を行う。
+        for message_id, _ in items:
+            if (data := self.lotteries.pop(message_id, None)) is None:
+                continue
+            try:
+                await self._draw(message_id, data)
+            except Exception as e:
+                if self.bot.test:
+                    print("Error on Delay Lottery:", e)
+            await self.delete(data["guild"], data["channel"], message_id)
 
     @commands.Cog.listener()
     async def on_full_reaction_add(self, payload):
-        if (not hasattr(payload, "message") or not payload.message.guild
-                or not payload.message.author.bot):
+        if (data := self.lotteries.get(payload.message_id)) is None:
             return
 
-        if str(payload.emoji) == self.EMOJIS["error"]:
+        if str(payload.emoji) == self.EMOJIS["check"]:
+            if payload.member is not None and not payload.member.bot \
+                    and payload.user_id not in data["entrants"]:
+                data["entrants"].add(payload.user_id)
+                await self.add_entrant(payload.message_id, payload.user_id)
+        elif str(payload.emoji) == self.EMOJIS["error"] \
+                and hasattr(payload, "message") and payload.member is not None:
             if str(payload.member.id) in payload.message.author.name:
+                del self.lotteries[payload.message_id]
+                self.deadlines.remove(payload.message_id)
                 await self.delete(
                     payload.guild_id, payload.channel_id, payload.message_id
                 )
@@ -215,8 +290,16 @@ class DelayLottery(commands.Cog, DataManager):
                     f"{payload.member.mention}, 抽選をキャンセルしました。 / Canceled!"
                 )
 
+    @commands.Cog.listener()
+    async def on_full_reaction_remove(self, payload):
+        if str(payload.emoji) == self.EMOJIS["check"] \
+                and (data := self.lotteries.get(payload.message_id)) is not None \
+                and payload.user_id in data["entrants"]:
+            data["entrants"].discard(payload.user_id)
+            await self.remove_entrant(payload.message_id, payload.user_id)
+
     def cog_unload(self):
-        self.lottery_worker.cancel()
+        self.deadlines.close()
 
 
 def setup(bot):
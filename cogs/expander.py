@@ -1,15 +1,24 @@
 # RT - Message Link Expander
 
-from typing import Literal
+from typing import Literal, Optional, Dict
 
 from discord.ext import commands
 import discord
 
 from rtlib import RT, DatabaseManager, setting
+from rtlib.http_manager import ResponseCache
 
+from asyncio import Task, gather, shield
 from re import findall
 
 
+# メッセージのEmbedをキャッシュする秒数と最大の数です。
+CACHE_TTL = 300
+CACHE_SIZE = 2048
+# 読み上げのコグが読み込まれていなくても使えるように同じ絵文字をここにも置いておく。
+ERROR_EMOJI = "<:error:878914351338246165>"
+
+
 class DataManager(DatabaseManager):
 
     DB = "ExpandMessage"
@@ -28,20 +37,11 @@ class DataManager(DatabaseManager):
             self.IGNORE_DB, {"ChannelID": "BIGINT", "OnOff": "TINYINT"}
         )
 
-    async def read(self, cursor, guild_id: int, channel_id: int) -> tuple:
-        target = {"GuildID": guild_id}
-        ignore_target = {"ChannelID": channel_id}
-        if await cursor.exists(self.DB, target):
-            if (guild := await cursor.get_data(self.DB, target))[1]:
-                if await cursor.exists(self.IGNORE_DB, ignore_target):
-                    if (row := await cursor.get_data(self.IGNORE_DB, ignore_target)):
-                        return bool(row[1])
-                    return False
-                else:
-                    return guild[1]
-            return False
-        else:
-            return True
+    async def reads(self, cursor) -> tuple:
+        return (
+            [row async for row in cursor.get_datas(self.DB, {}) if row],
+            [row async for row in cursor.get_datas(self.IGNORE_DB, {}) if row]
+        )
 
     async def write(self, cursor, guild_id: int, onoff: bool) -> None:
         target = {"GuildID": guild_id}
@@ -71,6 +71,11 @@ class Expander(commands.Cog, DataManager):
 
     def __init__(self, bot: RT):
         self.bot = bot
+        self.guilds: Dict[int, bool] = {}
+        self.ignores: Dict[int, bool] = {}
+        self.cache = ResponseCache(CACHE_SIZE)
+        self.requests: Dict[int, Task] = {}
+        self.loaded = False
         self.bot.loop.create_task(self.on_ready())
 
     async def on_ready(self):
@@ -79,6 +84,16 @@ class Expander(commands.Cog, DataManager):
             self.bot.mysql
         )
         await self.init_table()
+        guilds, ignores = await self.reads()
+        self.guilds = {row[0]: bool(row[1]) for row in guilds}
+        self.ignores = {row[0]: bool(row[1]) for row in ignores}
+        self.loaded = True
+
+    def is_enabled(self, guild_id: int, channel_id: int) -> bool:
+        "メッセージリンクの展開が有効かどうかを調べます。"
+        if guild_id not in self.guilds:
+            return True
+        return self.guilds[guild_id] and self.ignores.get(channel_id, True)
 
     @commands.command(
         extras={
@@ -129,19 +144,76 @@ class Expander(commands.Cog, DataManager):
         If you don't need this feature, you can use `rt!expand off`, which is on by default."""
         if mode == "g":
             await self.write(ctx.guild.id, onoff)
+            self.guilds[ctx.guild.id] = onoff
         else:
             await self.set_ignore(ctx.channel.id, onoff)
+            self.ignores[ctx.channel.id] = onoff
         await ctx.reply("Ok")
 
+    def make_embed(self, message: discord.Message) -> discord.Embed:
+        "メッセージを展開したEmbedを作ります。"
+        embed = discord.Embed(
+            description=message.content,
+            color=message.author.color
+        ).set_author(
+            name=message.author.display_name,
+            icon_url=getattr(message.author.avatar, "url", "")
+        ).set_footer(
+            text=message.guild.name,
+            icon_url=getattr(message.guild.icon, "url", "")
+        )
+        if message.attachments:
+            embed.set_image(url=message.attachments[0].url)
+        return embed
+
+    async def _fetch(self, channel, message_id: int) -> Optional[discord.Embed]:
+        # メッセージを取得してEmbedをキャッシュします。
+        try:
+            embed = self.make_embed(await channel.fetch_message(message_id))
+        except discord.NotFound:
+            return None
+        self.cache.set(message_id, embed, CACHE_TTL)
+        return embed
+
+    async def get_embed(self, channel, message_id: int) -> Optional[discord.Embed]:
+        """メッセージを展開したEmbedを取得します。キャッシュがある場合はそれを返します。
+        同じメッセージを同時に取得しようとした場合は一度だけ取得されます。"""
+        embed, found, _ = self.cache.get(message_id)
+        if found:
+            return embed
+        if message_id not in self.requests:
+            self.requests[message_id] = task = self.bot.loop.create_task(
+                self._fetch(channel, message_id)
+            )
+            task.add_done_callback(lambda _: self.requests.pop(message_id, None))
+            # 誰も待たずに失敗した場合に警告が出ないようにする。
+            task.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return await shield(self.requests[message_id])
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        self.cache.remove(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self.cache.remove(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(
+        self, payload: discord.RawBulkMessageDeleteEvent
+    ):
+        for message_id in payload.message_ids:
+            self.cache.remove(message_id)
+
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
-        if not message.guild or message.author.bot:
+        if not self.loaded or not message.guild or message.author.bot:
             return
 
         datas = findall(self.PATTERN, message.content)
         if datas:
-            if await self.read(message.guild.id, message.channel.id):
-                embeds = []
+            if self.is_enabled(message.guild.id, message.channel.id):
+                targets = []
                 for data in datas:
                     data, channel = data[2:], None
 
@@ -155,26 +227,15 @@ class Expander(commands.Cog, DataManager):
                         channel = get_channel(int(data[1]))
 
                     if channel:
-                        try:
-                            fetched_message = await channel.fetch_message(int(data[2]))
-                        except discord.Forbidden:
-                            await message.add_reaction(
-                                self.bot.cogs["TTS"].EMOJIS["error"]
-                            )
-                        else:
-                            embed = discord.Embed(
-                                description=fetched_message.content,
-                                color=fetched_message.author.color
-                            ).set_author(
-                                name=fetched_message.author.display_name,
-                                icon_url=getattr(fetched_message.author.avatar, "url", "")
-                            ).set_footer(
-                                text=fetched_message.guild.name,
-                                icon_url=getattr(fetched_message.guild.icon, "url", "")
-                            )
-                            if fetched_message.attachments:
-                                embed.set_image(url=fetched_message.attachments[0].url)
-                            embeds.append(embed)
+                        targets.append(self.get_embed(channel, int(data[2])))
+
+                # 全てのメッセージを同時に取得する。
+                embeds = []
+                for embed in await gather(*targets, return_exceptions=True):
+                    if isinstance(embed, discord.Forbidden):
+                        await message.add_reaction(ERROR_EMOJI)
+                    elif isinstance(embed, discord.Embed):
+                        embeds.append(embed)
 
                 if embeds:
                     try:
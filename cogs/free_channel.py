@@ -1,21 +1,45 @@
 # RT - Free Channel
 
-from typing import Literal
+from typing import Literal, Optional, Dict, Set, Tuple
 
 from discord.ext import commands
 import discord
 
 from rtlib import RT, setting
 
+from collections import Counter
 from asyncio import sleep
+import re
+
+
+PANEL = re.compile(r"RTフリーチャンネル\n作成可能チャンネル数：(\d+)")
+TEXT_OWNER = re.compile(r"RTフリーチャンネル, 作成者：(\d+)")
+VOICE_OWNER = re.compile(r"-(\d+)$")
+
+
+def parse_panel(channel: discord.abc.GuildChannel) -> Optional[int]:
+    "フリーチャンネル作成用チャンネルなら作成可能チャンネル数を返します。"
+    if isinstance(channel, discord.TextChannel) and channel.category_id \
+            and (match := PANEL.match(channel.topic or "")):
+        return int(match.group(1))
+
+
+def parse_owner(channel: discord.abc.GuildChannel) -> Optional[int]:
+    "フリーチャンネルの作成者のIDをトピックまたは名前から取得します。"
+    if isinstance(channel, discord.TextChannel):
+        match = TEXT_OWNER.search(channel.topic or "")
+    elif isinstance(channel, discord.VoiceChannel):
+        match = VOICE_OWNER.search(channel.name)
+    else:
+        return None
+    return int(match.group(1)) if match else None
 
 
 async def freechannel(ctx: commands.Context) -> bool:
     # フリーチャンネルか確かめるためのコマンドに付けるデコレータです。
     if isinstance(ctx.channel, discord.TextChannel):
-        return (ctx.channel.topic and "RTフリーチャンネル" in ctx.channel.topic
-                and str(ctx.author.id) in ctx.channel.topic
-                and "作成者" in ctx.channel.topic and ctx.channel.category)
+        data = ctx.cog.channels.get(ctx.channel.id)
+        return data is not None and data[0][1] == ctx.author.id
     else:
         return ctx.category is not None
 
@@ -28,6 +52,94 @@ class FreeChannel(commands.Cog):
             "remove": {},
             "rename": {}
         }
+        # フリーチャンネル作成用チャンネルのIDからカテゴリーのIDと作成可能チャンネル数を引くためのものです。
+        self.panels: Dict[int, Tuple[int, int]] = {}
+        # フリーチャンネル作成用チャンネルがあるカテゴリーのIDとそのチャンネルの数です。
+        self.categories: Counter = Counter()
+        # カテゴリーのIDと作成者のIDから作成したチャンネルのIDを種類ごとに引くためのものです。
+        self.owners: Dict[Tuple[int, int], Dict[str, Set[int]]] = {}
+        # フリーチャンネルのIDからカテゴリーのIDと作成者のIDと種類を引くためのものです。
+        self.channels: Dict[int, Tuple[Tuple[int, int], str]] = {}
+        self.bot.loop.create_task(self.build_index())
+
+    async def build_index(self) -> None:
+        "チャンネルのトピックと名前からフリーチャンネルの情報を作ります。"
+        await self.bot.wait_until_ready()
+        for guild in self.bot.guilds:
+            for channel in guild.text_channels:
+                if (max_channel := parse_panel(channel)) is not None:
+                    self.add_panel(channel, max_channel)
+
+    def add_panel(self, channel: discord.TextChannel, max_channel: int) -> None:
+        "フリーチャンネル作成用チャンネルを追加します。"
+        if channel.id in self.panels:
+            self.remove_panel(channel.id)
+        self.panels[channel.id] = (channel.category_id, max_channel)
+        self.categories[channel.category_id] += 1
+        if self.categories[channel.category_id] == 1:
+            for target in channel.category.channels:
+                self.add_channel(target)
+
+    def remove_panel(self, channel_id: int) -> None:
+        "フリーチャンネル作成用チャンネルを削除します。"
+        category_id, _ = self.panels.pop(channel_id)
+        self.categories[category_id] -= 1
+        if not self.categories[category_id]:
+            del self.categories[category_id]
+            for target_id, ((target_category_id, _), _) in list(self.channels.items()):
+                if target_category_id == category_id:
+                    self.remove_channel(target_id)
+
+    def add_channel(self, channel: discord.abc.GuildChannel) -> None:
+        "フリーチャンネル作成用チャンネルがあるカテゴリーのチャンネルなら作成者を記録します。"
+        if channel.category_id in self.categories and channel.id not in self.channels \
+                and (owner := parse_owner(channel)) is not None:
+            key = (channel.category_id, owner)
+            mode = "text" if isinstance(channel, discord.TextChannel) else "voice"
+            self.owners.setdefault(key, {"text": set(), "voice": set()})[mode] \
+                .add(channel.id)
+            self.channels[channel.id] = (key, mode)
+
+    def remove_channel(self, channel_id: int) -> None:
+        "作成者の記録を削除します。"
+        if (data := self.channels.pop(channel_id, None)) is not None:
+            key, mode = data
+            self.owners[key][mode].discard(channel_id)
+            if not any(self.owners[key].values()):
+                del self.owners[key]
+
+    def owned(self, category_id: int, user_id: int, mode: str) -> Set[int]:
+        "ユーザーがカテゴリーに作ったチャンネルのIDを取得します。"
+        return self.owners.get((category_id, user_id), {}).get(mode, set())
+
+    @commands.Cog.listener()
+    async def on_guild_channel_create(self, channel: discord.abc.GuildChannel):
+        if (max_channel := parse_panel(channel)) is not None:
+            self.add_panel(channel, max_channel)
+        self.add_channel(channel)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_update(
+        self, before: discord.abc.GuildChannel, after: discord.abc.GuildChannel
+    ):
+        # フリーチャンネル作成用チャンネルの設定の変更を反映する。
+        max_channel = parse_panel(after)
+        if after.id in self.panels and self.panels[after.id] != (
+            after.category_id, max_channel
+        ):
+            self.remove_panel(after.id)
+        if max_channel is not None and after.id not in self.panels:
+            self.add_panel(after, max_channel)
+        # 作成者はトピックが編集されても変えないが、カテゴリーが変わった場合は記録し直す。
+        if before.category_id != after.category_id:
+            self.remove_channel(after.id)
+        self.add_channel(after)
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        if channel.id in self.panels:
+            self.remove_panel(channel.id)
+        self.remove_channel(channel.id)
 
     @commands.group(
         extras={
@@ -111,8 +223,7 @@ class FreeChannel(commands.Cog):
                  "en": "You can run this command on only channel that have category."}
             )
             return
-        if (ctx.channel.topic and "RTフリーチャンネル" in ctx.channel.topic
-                and "作成者" not in ctx.channel.topic):
+        if ctx.channel.id in self.panels:
             await ctx.send(
                 {"ja": f"既にフリーチャンネル作成用チャンネルとなっています。",
                  "en": f"It is already a channel for creating free channels."},
@@ -176,8 +287,7 @@ The name of the created voice channel will include the ID of the person who crea
         channel=discord.TextChannel
     )
     async def remove_(self, ctx):
-        if (ctx.channel.topic and "RTフリーチャンネル" in ctx.channel.topic
-                and "作成者" not in ctx.channel.topic):
+        if ctx.channel.id in self.panels:
             await ctx.channel.edit(topic=None)
             await ctx.send(
                 {"ja": f"{ctx.author.mention}, フリーチャンネル作成用チャンネルを無効化しました。",
@@ -240,9 +350,7 @@ The name of the created voice channel will include the ID of the person who crea
                 or not message.content or not message.channel.topic):
             return
 
-        topic = message.channel.topic if message.channel.topic else ""
-        if ("RTフリーチャンネル" in topic and "作成者" not in topic
-                and message.channel.category):
+        if message.channel.id in self.panels:
             # フリーチャンネルでのユーザーへの返信の場合は
             if not (message.author.id == self.bot.user.id
                     and ">," in message.content):
@@ -255,22 +363,14 @@ The name of the created voice channel will include the ID of the person who crea
                 await message.channel.trigger_typing()
 
             # 作成に必要な情報を変数に入れる。max_channelは最大チャンネル数。
-            max_channel = int(topic[22:topic.find("\nこ")])
+            category_id, max_channel = self.panels[message.channel.id]
             user_id = str(message.author.id)
-            now = {
-                "text": [channel
-                         for channel in message.channel.category.text_channels
-                         if channel.topic and user_id in channel.topic],
-                "voice": [channel
-                          for channel in message.channel.category.voice_channels
-                          if channel.name.endswith("-" + user_id)]
-            }
 
             if message.content.startswith(("text ", "voice ")):
                 # チャンネルの作成。
                 mode = "text" if message.content[0] == "t" else "voice"
 
-                if len(now[mode]) >= max_channel:
+                if len(self.owned(category_id, message.author.id, mode)) >= max_channel:
                     await message.channel.send(
                         {"ja": f"{message.author.mention}, あなたはチャンネルをこれ以上作れません。",
                          "en": f"{message.author.mention}, ..."},
@@ -289,7 +389,8 @@ The name of the created voice channel will include the ID of the person who crea
                     )
                     mode = ("ボイス", "voice")
 
-                await coro
+                # 作成イベントを待たずに記録しておく。
+                self.add_channel(await coro)
                 await message.channel.send(
                     {"ja": f"{message.author.mention}, {mode[0]}チャンネルを作成しました。",
                      "en": f"{message.author.mention}, {mode[1]}..."},
@@ -5,12 +5,18 @@ import discord
 
 from rtlib import mysql, DatabaseManager
 from rtlib.ext import componesy, Embeds
+from rtlib.ext.join_pipeline import JoinContext, join_stage
 from .bot_general import INFO_SS
-from typing import Optional
+from typing import Optional, Dict, List, Set
+from asyncio import Semaphore, gather
 from random import choice
 from data import is_admin
 
 
+PER_PAGE = 10
+CONCURRENCY = 10
+
+
 class DataManager(DatabaseManager):
     def __init__(self, db):
         self.db: mysql.MySQLManager = db
@@ -55,10 +61,19 @@ class DataManager(DatabaseManager):
     async def get_onoff(self, cursor, guild_id: int) -> bool:
         return not await cursor.exists("gbanOff", {"GuildID": guild_id})
 
+    async def get_offs(self, cursor) -> list:
+        return [row async for row in cursor.get_datas("gbanOff", {})]
+
 
 class GlobalBan(commands.Cog, DataManager):
     def __init__(self, bot):
         self.bot = bot
+        # GBANされているユーザーのIDと理由とGBANをオフにしているサーバーのIDです。
+        # 参加する度にデータベースを見ないようにキャッシュしておく。
+        self.users: Dict[int, str] = {}
+        self.off: Set[int] = set()
+        # GBANリストで表示するユーザー名のキャッシュです。
+        self.names: Dict[int, str] = {}
         self.bot.loop.create_task(self.on_ready())
 
     async def on_ready(self):
@@ -66,6 +81,8 @@ class GlobalBan(commands.Cog, DataManager):
             self.bot.mysql
         )
         await self.init_table()
+        self.users = {row[0]: row[1] for row in await self.getall() if row}
+        self.off = {row[0] for row in await self.get_offs() if row}
 
     def get_channel(self, guild: discord.Guild) -> Optional[discord.TextChannel]:
         if guild.system_channel:
@@ -73,17 +90,57 @@ class GlobalBan(commands.Cog, DataManager):
         else:
             return choice(guild.text_channels)
 
-    @commands.Cog.listener()
-    async def on_member_join(self, member: discord.Member):
-        if not self.bot.is_ready() or await self.get_onoff(member.guild.id):
-            return
-        if (row := await self.get(member.id)):
-            await member.ban(reason=row[1])
+    def is_banned(self, member: discord.Member) -> bool:
+        "メンバーがGBANの対象かどうかを確認します。"
+        return member.id in self.users and member.guild.id not in self.off
+
+    async def ban_member(self, member: discord.Member) -> None:
+        "GBANされているメンバーをBANします。"
+        reason = self.users[member.id]
+        await member.ban(reason=reason)
+        if (channel := self.get_channel(member.guild)):
+            await channel.send(
+                f"{member.name}をBANしました。\n理由：\n{reason}"
+            )
+
+    @join_stage(0)
+    async def on_join(self, context: JoinContext, _):
+        if self.is_banned(context.member):
+            # BANするメンバーには他の処理をしない。
+            context.stop()
+            await self.ban_member(context.member)
 
-            if (channel := self.get_channel(member.guild)):
-                await channel.send(
-                    f"{member.name}をBANしました。\n理由：\n{row[1]}"
-                )
+    async def resolve_names(self, user_ids: List[int]) -> None:
+        "ユーザー名を並列で取得してキャッシュします。"
+        semaphore = Semaphore(CONCURRENCY)
+
+        async def resolve(user_id: int):
+            if (user := self.bot.get_user(user_id)) is None:
+                async with semaphore:
+                    try:
+                        user = await self.bot.fetch_user(user_id)
+                    except discord.NotFound:
+                        user = None
+            self.names[user_id] = "Unknown" if user is None else user.name
+
+        await gather(*(
+            resolve(user_id) for user_id in user_ids
+            if user_id not in self.names
+        ))
+
+    async def make_page(self, rows: list, start: int) -> discord.Embed:
+        "GBANリストのページを作ります。"
+        await self.resolve_names([row[0] for row in rows])
+        embed = discord.Embed(
+            title={"ja": "GBANリスト", "en": "GBan list"},
+            color=self.bot.colors["normal"]
+        )
+        for i, (user_id, reason) in enumerate(rows, start):
+            embed.add_field(
+                name=f"{i} {self.names[user_id]}",
+                value=f"ID:{user_id}\n{reason}", inline=False
+            )
+        return embed
 
     @commands.group(extras={
         "headding": {
@@ -134,7 +191,12 @@ class GlobalBan(commands.Cog, DataManager):
         --------
         Gban Enable/Disable Switch Command."""
         await ctx.trigger_typing()
-        await self.onoff_guild(ctx.guild.id, not await self.get_onoff(ctx.guild.id))
+        onoff = ctx.guild.id in self.off
+        await self.onoff_guild(ctx.guild.id, onoff)
+        if onoff:
+            self.off.discard(ctx.guild.id)
+        else:
+            self.off.add(ctx.guild.id)
         await ctx.reply("Ok")
 
     @gban.command("list")
@@ -148,18 +210,18 @@ class GlobalBan(commands.Cog, DataManager):
         --------
         Show you gban list."""
         embeds = Embeds("GbanList", target=ctx.author.id)
-
-        for i, row in enumerate(await self.getall()):
-            if row:
-                user = await self.bot.fetch_user(row[0])
-                if user:
-                    embeds.add_embed(
-                        discord.Embed(
-                            title=f"{i} {user.name}",
-                            description=f"ID:{user.id}\n{row[1]}",
-                            color=self.bot.colors["normal"]
-                        )
-                    )
+        rows = list(self.users.items())
+
+        for start in range(0, len(rows), PER_PAGE):
+            page = rows[start:start + PER_PAGE]
+            if start == 0:
+                await ctx.trigger_typing()
+                embeds.add_embed(await self.make_page(page, start))
+            else:
+                # 二ページ目以降はページが開かれた時にユーザー名を取得する。
+                async def make_page(_, __, page=page, start=start):
+                    return await self.make_page(page, start)
+                embeds.add_embed(make_page)
 
         if embeds.embeds:
             await ctx.reply(embeds=embeds)
@@ -174,41 +236,50 @@ class GlobalBan(commands.Cog, DataManager):
     async def add_user_(self, ctx, user_id: int, *, reason):
         await ctx.trigger_typing()
         await self.add_user(user_id, reason)
+        self.users[user_id] = reason
+        await self.sweep([user_id])
+        await ctx.reply("追加しました。")
 
+    async def sweep(self, user_ids: List[int]) -> int:
+        "全てのサーバーからGBANされているユーザーを探してBANします。BANした数を返します。"
+        count = 0
         for guild in self.bot.guilds:
-            if not self.get_onoff(guild.id):
+            if guild.id in self.off:
                 # オフに設定してるサーバーは無視する。
                 continue
-            for member in guild.members:
-                if member.id == user_id:
+            for user_id in user_ids:
+                if (member := guild.get_member(user_id)):
                     try:
-                        await member.ban(reason=reason)
-                        if (channel := self.get_channel(guild)):
-                            await channel.send(
-                                f"{member.name}をBANしました。\n理由：\n{reason}"
-                            )
+                        await self.ban_member(member)
                     except Exception as e:
                         print("Error on gban :", e)
+                    else:
+                        count += 1
+        return count
 
-        await ctx.reply("追加しました。")
+    @gban.command("sweep")
+    @is_admin()
+    async def sweep_(self, ctx):
+        await ctx.trigger_typing()
+        await ctx.reply(f"{await self.sweep(list(self.users))}人をBANしました。")
 
     @gban.command("remove")
     @is_admin()
     async def remove_user_(self, ctx, user_id: int):
         await ctx.trigger_typing()
         await self.remove_user(user_id)
+        self.users.pop(user_id, None)
 
         for guild in self.bot.guilds:
-            for member in guild.members:
-                if member.id == user_id:
-                    try:
-                        await member.unban()
-                        if (channel := self.get_channel(guild)):
-                            await channel.send(
-                                f"{member.name}のBANを解除しました。"
-                            )
-                    except Exception as e:
-                        print("Error on ungban :", e)
+            if (member := guild.get_member(user_id)):
+                try:
+                    await member.unban()
+                    if (channel := self.get_channel(guild)):
+                        await channel.send(
+                            f"{member.name}のBANを解除しました。"
+                        )
+                except Exception as e:
+                    print("Error on ungban :", e)
 
         await ctx.reply("削除しました。")
 
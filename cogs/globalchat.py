@@ -7,6 +7,7 @@ import discord
 
 from collections import defaultdict
 from rtlib import DatabaseManager
+from rtlib.media import append_urls
 from functools import wraps
 from time import time
 
@@ -329,33 +330,37 @@ class GlobalChat(commands.Cog, DataManager):
                         .set_footer(text="添付されたスタンプ")
                 )
 
-        # 送る。
-        for _, channel_id, _ in rows:
-            if message.channel.id == channel_id:
-                continue
-            else:
-                channel = self.bot.get_channel(channel_id)
-                if channel:
-                    if channel.guild.id not in self.ban_cache:
-                        for entry in await channel.guild.bans():
-                            self.ban_cache[channel.guild.id].append(
-                                entry.user.id
-                            )
-                    if all(
-                        user_id != message.author.id
-                        for user_id in self.ban_cache[channel.guild.id]
-                    ):
-                        try:
-                            await channel.webhook_send(
-                                username=f"{message.author.name} {message.author.id}",
-                                avatar_url=message.author.avatar.url,
-                                content=message.clean_content, embeds=embeds, files=[
-                                    await attachment.to_file()
-                                    for attachment in message.attachments
-                                ]
-                            )
-                        except Exception as e:
-                            print("Error on global chat :", e)
+        # 送る。添付ファイルは一度だけダウンロードして全てのチャンネルで使い回す。
+        # 送信先のサーバーの上限が分からないので大きさの上限はデフォルトのものにする。
+        async with self.bot.media.fetch(
+            message.attachments, message.guild.id
+        ) as (medias, skipped):
+            content = append_urls(message.clean_content, skipped)
+            for _, channel_id, _ in rows:
+                if message.channel.id == channel_id:
+                    continue
+                else:
+                    channel = self.bot.get_channel(channel_id)
+                    if channel:
+                        if channel.guild.id not in self.ban_cache:
+                            for entry in await channel.guild.bans():
+                                self.ban_cache[channel.guild.id].append(
+                                    entry.user.id
+                                )
+                        if all(
+                            user_id != message.author.id
+                            for user_id in self.ban_cache[channel.guild.id]
+                        ):
+                            try:
+                                await channel.webhook_send(
+                                    username=f"{message.author.name} {message.author.id}",
+                                    avatar_url=message.author.avatar.url,
+                                    content=content, embeds=embeds, files=[
+                                        media.to_file() for media in medias
+                                    ]
+                                )
+                            except Exception as e:
+                                print("Error on global chat :", e)
 
     @commands.Cog.listener()
     async def on_message(self, message: discord.Message):
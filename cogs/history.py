@@ -0,0 +1,304 @@
+# RT - History
+
+from typing import TYPE_CHECKING, Optional, Dict, Tuple, Set
+
+from discord.ext import commands, tasks
+import discord
+
+from collections import OrderedDict, defaultdict
+from asyncio import Lock
+from datetime import datetime
+
+from rtlib import RT
+
+if TYPE_CHECKING:
+    from aiomysql import Pool
+
+
+TABLE = "HistoryCounter"
+LIMIT = 5000
+MAX_SEEKS = 512
+
+
+class ChannelCounter:
+    "チャンネルのメッセージ数のカウンターです。"
+
+    __slots__ = ("count", "capped", "first_id", "last_id", "synced")
+
+    def __init__(
+        self, count: int = 0, capped: bool = False,
+        last_id: int = 0, synced: bool = False, first_id: int = 0
+    ):
+        self.count, self.capped = count, capped
+        # 数えた範囲の最初と最後のメッセージのIDです。
+        # 上限に達していない場合は最初から数えているので`first_id`は0です。
+        self.first_id, self.last_id = first_id, last_id
+        # 起動してから取りこぼしなくメッセージを数えているかどうかです。
+        self.synced = synced
+
+
+class DataManager:
+    def __init__(self, cog: "History"):
+        self.cog = cog
+        self.pool: "Pool" = cog.bot.mysql.pool
+        self.cog.bot.loop.create_task(self._prepare_table())
+
+    async def _prepare_table(self):
+        # テーブルの準備をする。このクラスのインスタンス化時に自動で実行される。
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"""CREATE TABLE IF NOT EXISTS {TABLE} (
+                        ChannelID BIGINT PRIMARY KEY NOT NULL,
+                        Count INT, Capped BOOLEAN, LastID BIGINT,
+                        FirstID BIGINT
+                    );"""
+                )
+                # キャッシュを用意しておく。
+                await cursor.execute(
+                    f"SELECT ChannelID, Count, Capped, LastID, FirstID FROM {TABLE};"
+                )
+                for row in await cursor.fetchall():
+                    if row and row[0] not in self.cog.counters:
+                        self.cog.counters[row[0]] = ChannelCounter(
+                            row[1], bool(row[2]), row[3], first_id=row[4]
+                        )
+
+    async def save(self, channel_ids: Set[int]) -> None:
+        "指定されたチャンネルのカウンターを保存します。"
+        rows = [
+            (
+                channel_id, counter.count, counter.capped,
+                counter.last_id, counter.first_id
+            ) for channel_id in channel_ids
+            if (counter := self.cog.counters.get(channel_id))
+        ]
+        if rows:
+            async with self.pool.acquire() as conn:
+                async with conn.cursor() as cursor:
+                    await cursor.executemany(
+                        f"""INSERT INTO {TABLE}
+                                (ChannelID, Count, Capped, LastID, FirstID)
+                            VALUES (%s, %s, %s, %s, %s)
+                            ON DUPLICATE KEY UPDATE Count = VALUES(Count),
+                            Capped = VALUES(Capped), LastID = VALUES(LastID),
+                            FirstID = VALUES(FirstID);""",
+                        rows
+                    )
+
+    async def delete(self, channel_id: int) -> None:
+        "チャンネルのカウンターを削除します。"
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"DELETE FROM {TABLE} WHERE ChannelID = %s;",
+                    (channel_id,)
+                )
+
+
+class History(commands.Cog, DataManager):
+    """チャンネルの履歴を扱うためのコグです。
+    チャンネルのメッセージ数は一度数えた後は`on_message`などから差分で更新されます。
+    また日時からのメッセージの検索はメッセージのIDに含まれる時間を使って行います。"""
+
+    def __init__(self, bot: RT):
+        self.bot = bot
+        self.counters: Dict[int, ChannelCounter] = {}
+        self.dirty: Set[int] = set()
+        self.locks: Dict[int, Lock] = defaultdict(Lock)
+        self.seeks: "OrderedDict[Tuple[int, int], discord.Message]" = OrderedDict()
+        super(commands.Cog, self).__init__(self)
+        self.save_counters.start()
+
+    @staticmethod
+    async def stream_count(
+        channel: discord.TextChannel, content: Optional[str] = None,
+        **kwargs
+    ) -> Tuple[int, int, int]:
+        """メッセージをリストにせずに数えます。
+        `(数, 最古のメッセージのID, 最新のメッセージのID)`を返します。"""
+        count = first_id = last_id = 0
+        async for message in channel.history(**kwargs):
+            if content is None or content in message.content:
+                count += 1
+            if message.id > last_id:
+                last_id = message.id
+            if not first_id or message.id < first_id:
+                first_id = message.id
+        return count, first_id, last_id
+
+    async def _baseline(self, channel: discord.TextChannel) -> ChannelCounter:
+        # チャンネルのメッセージを最初から数え直します。
+        # 数えている間に送信されたメッセージは`on_message`で数えられる。
+        self.counters[channel.id] = counter = ChannelCounter(synced=True)
+        now = discord.utils.time_snowflake(discord.utils.utcnow())
+        count, first_id, last_id = await self.stream_count(
+            channel, limit=LIMIT, before=discord.Object(now)
+        )
+        counter.count += count
+        counter.capped = count >= LIMIT
+        if counter.capped:
+            counter.first_id = first_id
+        counter.last_id = max(counter.last_id, last_id)
+        self.dirty.add(channel.id)
+        return counter
+
+    async def count(
+        self, channel: discord.TextChannel, content: Optional[str] = None
+    ) -> Tuple[int, bool]:
+        """チャンネルのメッセージ数を数えます。
+        `(数, 上限に達していて実際はそれ以上あるかどうか)`を返します。
+
+        Parameters
+        ----------
+        channel : discord.TextChannel
+            数える対象のチャンネルです。
+        content : str, optional
+            この文字列を含むメッセージのみを数えます。
+            指定した場合はキャッシュされずに最新の5000件が数えられます。"""
+        if content is not None:
+            count, _, _ = await self.stream_count(channel, content, limit=LIMIT)
+            return count, count >= LIMIT
+
+        async with self.locks[channel.id]:
+            counter = self.counters.get(channel.id)
+            if counter is not None and not counter.synced:
+                # 前回の起動時以降に送信されたメッセージを追加で数える。
+                count, _, last_id = await self.stream_count(
+                    channel, limit=LIMIT, after=discord.Object(counter.last_id)
+                )
+                if count >= LIMIT:
+                    counter = None
+                else:
+                    counter.count += count
+                    counter.last_id = max(counter.last_id, last_id)
+                    counter.synced = True
+                    self.dirty.add(channel.id)
+            if counter is None or (counter.capped and counter.count < LIMIT):
+                counter = await self._baseline(channel)
+        return counter.count, counter.capped
+
+    async def seek(
+        self, channel: discord.TextChannel, when: datetime
+    ) -> Optional[discord.Message]:
+        """指定された日時の直前に送信されたメッセージを取得します。
+        メッセージのIDには時間が含まれているのでメッセージを遡る必要はありません。
+
+        Parameters
+        ----------
+        channel : discord.TextChannel
+            対象のチャンネルです。
+        when : datetime.datetime
+            日時です。"""
+        snowflake = discord.utils.time_snowflake(when)
+        # 同じ分への移動はキャッシュから返す。
+        key = (channel.id, (snowflake >> 22) // 60000)
+        if key in self.seeks:
+            self.seeks.move_to_end(key)
+            return self.seeks[key]
+        async for message in channel.history(
+            limit=1, before=discord.Object(snowflake)
+        ):
+            self.seeks[key] = message
+            if len(self.seeks) > MAX_SEEKS:
+                self.seeks.popitem(last=False)
+            return message
+
+    @staticmethod
+    def to_snowflake(value) -> Optional[int]:
+        "`channel.history`の`before`などに渡すものをIDにします。"
+        if value is None:
+            return None
+        if isinstance(value, datetime):
+            return discord.utils.time_snowflake(value)
+        return value.id
+
+    async def search(
+        self, channel: discord.TextChannel, original: discord.Message,
+        content: str, **kwargs
+    ) -> Optional[discord.Message]:
+        """指定された文字列を含むメッセージを探します。
+        Botがキャッシュしているメッセージから探し、見つからなかった場合は履歴を遡ります。
+        キーワード引数は`channel.history`に渡され、キャッシュから探す際にも同じ範囲が使われます。"""
+        limit = kwargs.get("limit", 100)
+        before, after = (
+            self.to_snowflake(kwargs.get(key)) for key in ("before", "after")
+        )
+        oldest_first = kwargs.get("oldest_first")
+        messages = [
+            message for message in self.bot.cached_messages
+            if message.channel.id == channel.id
+            and (before is None or message.id < before)
+            and (after is None or message.id > after)
+        ]
+        if not (after is not None if oldest_first is None else oldest_first):
+            messages.reverse()
+        for message in messages[:limit]:
+            if message.id != original.id and content in message.clean_content:
+                return message
+        async for message in channel.history(**kwargs):
+            if message.id != original.id and content in message.clean_content:
+                return message
+
+    def _forget_seeks(self, channel_id: int, message_ids: Set[int]) -> None:
+        # 削除または編集されたメッセージのキャッシュを消します。
+        for key, message in list(self.seeks.items()):
+            if key[0] == channel_id and message.id in message_ids:
+                del self.seeks[key]
+
+    def _on_delete(self, channel_id: int, message_ids: Set[int]) -> None:
+        # メッセージが削除された際に数えた範囲のメッセージならカウンターを減らす。
+        if (counter := self.counters.get(channel_id)):
+            deleted = sum(
+                counter.first_id <= message_id <= counter.last_id
+                for message_id in message_ids
+            )
+            if deleted:
+                counter.count = max(counter.count - deleted, 0)
+                self.dirty.add(channel_id)
+        self._forget_seeks(channel_id, message_ids)
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        # 起動前のデータのままのカウンターは次に数える時に差分を数える。
+        if (counter := self.counters.get(message.channel.id)) and counter.synced:
+            counter.count += 1
+            counter.last_id = max(counter.last_id, message.id)
+            self.dirty.add(message.channel.id)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        self._on_delete(payload.channel_id, {payload.message_id})
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(
+        self, payload: discord.RawBulkMessageDeleteEvent
+    ):
+        self._on_delete(payload.channel_id, payload.message_ids)
+
+    @commands.Cog.listener()
+    async def on_raw_message_edit(self, payload: discord.RawMessageUpdateEvent):
+        self._forget_seeks(payload.channel_id, {payload.message_id})
+
+    @commands.Cog.listener()
+    async def on_guild_channel_delete(self, channel: discord.abc.GuildChannel):
+        if channel.id in self.counters:
+            del self.counters[channel.id]
+            self.dirty.discard(channel.id)
+            await self.delete(channel.id)
+
+    @tasks.loop(seconds=60)
+    async def save_counters(self):
+        # 変更されたカウンターを保存する。
+        if self.dirty:
+            dirty, self.dirty = self.dirty, set()
+            await self.save(dirty)
+
+    def cog_unload(self):
+        self.save_counters.cancel()
+        if self.dirty:
+            self.bot.loop.create_task(self.save(self.dirty))
+
+
+def setup(bot):
+    bot.add_cog(History(bot))
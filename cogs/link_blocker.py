@@ -5,6 +5,7 @@ from typing import TYPE_CHECKING, List
 from discord.ext import commands
 import discord
 
+from rtlib.ext.message_router import route
 from rtlib import RT, setting
 
 if TYPE_CHECKING:
@@ -247,10 +248,9 @@ class LinkBlocker(commands.Cog, DataManager):
 
     SCHEMES = ("https://", "http://")
 
-    @commands.Cog.listener()
+    @route(guilds="guilds", bots=True, prefixed=True)
     async def on_message(self, message: discord.Message):
-        if (message.guild and message.guild.id in self.guilds
-                and any(scheme in message.content for scheme in self.SCHEMES)
+        if (any(scheme in message.content for scheme in self.SCHEMES)
                 and message.channel.id not in self.ignores):
             await message.delete()
             content = {
@@ -1,10 +1,11 @@
 # RT - Locker
 
-from discord.ext import commands, tasks
+from discord.ext import commands
 import discord
 
 from rtlib import mysql, DatabaseManager
-from typing import List
+from rtutil.deadline import DeadlineHeap
+from typing import List, Tuple
 from time import time
 
 
@@ -38,6 +39,9 @@ class DataManager(DatabaseManager):
 class Locker(commands.Cog, DataManager):
     def __init__(self, bot):
         self.bot = bot
+        self.deadlines = DeadlineHeap(
+            self.auto_unlock, self.bot.loop, self.bot.on_error
+        )
         self.bot.loop.create_task(self.on_ready())
 
     async def on_ready(self):
@@ -45,7 +49,10 @@ class Locker(commands.Cog, DataManager):
             self.bot.mysql
         )
         await self.init_table()
-        self.auto_unlock_loop.start()
+        for row in await self.loads():
+            if row:
+                self.deadlines.push(row[0], row[1])
+        self.deadlines.start()
 
     async def channel_lock(
         self, channel: discord.TextChannel, lock: bool,
@@ -116,6 +123,7 @@ class Locker(commands.Cog, DataManager):
         time_ = time() + auto_unload * 60 if auto_unload else 0
         if time_ and not await self.exists(ctx.channel.id):
             await self.save(ctx.channel.id, time_)
+            self.deadlines.push(ctx.channel.id, time_)
         await ctx.reply(
             embed=self.make_result_embed(
                 {"ja": "ロックしました。", "en": "I have locked."},
@@ -148,6 +156,7 @@ class Locker(commands.Cog, DataManager):
         await ctx.trigger_typing()
         if await self.exists(ctx.channel.id):
             await self.delete(ctx.channel.id)
+            self.deadlines.remove(ctx.channel.id)
         await ctx.reply(
             embed=self.make_result_embed(
                 {"ja": "アンロックしました。", "en": "I have unlocked."},
@@ -156,21 +165,17 @@ class Locker(commands.Cog, DataManager):
         )
 
     def cog_unload(self):
-        self.auto_unlock_loop.cancel()
+        self.deadlines.close()
 
-    @tasks.loop(seconds=30)
-    async def auto_unlock_loop(self):
+    async def auto_unlock(self, items: List[Tuple[int, None]]) -> None:
         # 自動で解除するように設定されているものを解除する。
-        now = time()
-        for row in await self.loads():
-            if row:
-                channel = self.bot.get_channel(row[0])
-                if channel:
-                    if row[1] <= now:
-                        await self.channel_lock(channel, False)
-                    else:
-                        continue
-                await self.delete(channel.id)
+        for channel_id, _ in items:
+            if (channel := self.bot.get_channel(channel_id)):
+                try:
+                    await self.channel_lock(channel, False)
+                except discord.HTTPException:
+                    pass
+            await self.delete(channel_id)
 
 
 def setup(bot):
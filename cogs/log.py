@@ -1,8 +1,10 @@
 # RT - Log Extension
 
+from typing import Optional, Dict, List, Tuple
+
 from discord.ext import commands
 import discord
-from asyncio import sleep
+from asyncio import AbstractEventLoop, TimerHandle, sleep
 
 from datetime import datetime, timedelta
 from functools import wraps
@@ -14,6 +16,63 @@ CHP_HELP = {
 例：`rt>log` (これをトピックに入れたチャンネルにログが送られます)"""),
     "en": ("...", """...""")
 }
+# 一つのメッセージに入れられるEmbedの数と文字数の上限です。
+MAX_EMBEDS = 10
+MAX_LENGTH = 6000
+
+
+class LogBuffer:
+    """ログのEmbedをチャンネルごとに溜めておき、まとめて一つのメッセージで送信するクラスです。
+    荒らしなどでログが大量に出た際に一つずつ送信しないようにするために使います。
+
+    Parameters
+    ----------
+    loop : asyncio.AbstractEventLoop
+        イベントループです。
+    delay : float, default 2.0
+        最初のEmbedが追加されてから送信するまで待つ秒数です。"""
+
+    def __init__(self, loop: AbstractEventLoop, delay: float = 2.0):
+        self.loop, self.delay = loop, delay
+        self.queues: Dict[int, Tuple[discord.TextChannel, List[discord.Embed]]] = {}
+        self.timers: Dict[int, TimerHandle] = {}
+
+    def add(self, channel: discord.TextChannel, embed: discord.Embed) -> None:
+        "送信するEmbedを追加します。"
+        if (queue := self.queues.get(channel.id)) and (
+            sum(map(len, queue[1])) + len(embed) > MAX_LENGTH
+        ):
+            self.flush(channel.id)
+        embeds = self.queues.setdefault(channel.id, (channel, []))[1]
+        embeds.append(embed)
+        if len(embeds) >= MAX_EMBEDS:
+            self.flush(channel.id)
+        elif channel.id not in self.timers:
+            self.timers[channel.id] = self.loop.call_later(
+                self.delay, self.flush, channel.id
+            )
+
+    def flush(self, channel_id: int) -> None:
+        "溜まっているEmbedを送信します。"
+        if (timer := self.timers.pop(channel_id, None)) is not None:
+            timer.cancel()
+        if (queue := self.queues.pop(channel_id, None)):
+            self.loop.create_task(self._send(*queue))
+
+    async def _send(
+        self, channel: discord.TextChannel, embeds: List[discord.Embed]
+    ) -> None:
+        try:
+            await channel.send(embeds=embeds, paginate=False)
+        except (discord.errors.Forbidden,
+                discord.errors.HTTPException):
+            pass
+
+    def close(self) -> None:
+        "溜まっているEmbedを全て送信します。"
+        for channel_id in list(self.queues):
+            self.flush(channel_id)
+
 
 def log(mode: str = "normal"):
     # ログ用のデコレータです。
@@ -30,12 +89,7 @@ def log(mode: str = "normal"):
                 guild = first_arg.guild
 
             if guild:
-                channel = discord.utils.find(
-                    lambda ch: (
-                        "log-rt" in ch.name
-                        or (ch.topic and "rt>log" in ch.topic)),
-                        guild.text_channels
-                )
+                channel = self.get_log_channel(guild)
 
                 if channel:
                     embed = await func(self, first_arg, *args, **kwargs)
@@ -43,11 +97,7 @@ def log(mode: str = "normal"):
                         embed.set_footer(
                             text=f"RTログ | {datetime.now().strftime('%Y-%m-%d %H:%M')}"
                         )
-                        try:
-                            await channel.send(embed=embed)
-                        except (discord.errors.Forbidden,
-                                discord.errors.HTTPException):
-                            pass
+                        self.buffer.add(channel, embed)
         return new_function
     return decorator
 
@@ -62,8 +112,41 @@ class Log(commands.Cog):
         self.bot, self.data = bot, bot.data
         self.team_id = self.data["admins"]
         self.c = self.bot.colors["normal"]
+        # サーバーIDとログチャンネルのIDのキャッシュです。ログチャンネルがない場合はNoneです。
+        self.channels: Dict[int, Optional[int]] = {}
+        self.buffer = LogBuffer(self.bot.loop)
         self.bot.loop.create_task(self.on_command_added())
 
+    def get_log_channel(self, guild: discord.Guild) -> Optional[discord.TextChannel]:
+        "ログチャンネルを取得します。"
+        if guild.id not in self.channels:
+            self.channels[guild.id] = getattr(discord.utils.find(
+                lambda ch: (
+                    "log-rt" in ch.name
+                    or (ch.topic and "rt>log" in ch.topic)),
+                    guild.text_channels
+            ), "id", None)
+        if self.channels[guild.id] is not None:
+            return guild.get_channel(self.channels[guild.id])
+
+    # チャンネルが変更された際にログチャンネルのキャッシュを消す。
+    # ログを送るリスナーより先に実行されるようにここに置いておく。
+    @commands.Cog.listener("on_guild_channel_create")
+    @commands.Cog.listener("on_guild_channel_delete")
+    async def _reset_log_channel(self, channel):
+        self.channels.pop(channel.guild.id, None)
+
+    @commands.Cog.listener("on_guild_channel_update")
+    async def _reset_log_channel_on_update(self, _, after):
+        self.channels.pop(after.guild.id, None)
+
+    @commands.Cog.listener("on_guild_remove")
+    async def _reset_log_channel_on_remove(self, guild):
+        self.channels.pop(guild.id, None)
+
+    def cog_unload(self):
+        self.buffer.close()
+
     async def on_command_added(self):
         await sleep(1.5)
         for lang in CHP_HELP:
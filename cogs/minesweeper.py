@@ -8,6 +8,9 @@ from rtutil import Minesweeper as Ms
 
 
 class Mines(commands.Cog):
+
+    MAX_DESCRIPTION = 4000
+
     def __init__(self, bot):
         self.bot = bot
         self.games = {}
@@ -37,14 +40,32 @@ class Mines(commands.Cog):
         -------
         ms, MS
         """
-        self.games[str(ctx.author.id)] = Ms(x, y, bomb)
-        kek, mes, me = 200, ctx.message, False
         l = len(ctx.message.content.split())
         if l != 3 and l != 1:
             return
+        if x < 1 or y < 1 or not 0 < bomb < x * y:
+            return await ctx.reply(
+                {"ja": "盤面の大きさまたは爆弾の数が不正です。",
+                 "en": "The board size or the number of bombs is invalid."}
+            )
+        game = Ms(x, y, bomb)
+        if len(game.get(" ")) > self.MAX_DESCRIPTION:
+            return await ctx.reply(
+                {"ja": "盤面が大きすぎて表示できません。",
+                 "en": "The board is too large to display."}
+            )
+
+        self.games[str(ctx.author.id)] = game
+        try:
+            return await self._play(ctx, game)
+        finally:
+            if self.games.get(str(ctx.author.id)) is game:
+                del self.games[str(ctx.author.id)]
 
+    async def _play(self, ctx, game):
+        # ゲームを進めます。
+        kek, mes, me = 200, ctx.message, False
         while kek == 200:
-            game = self.games[str(ctx.author.id)]
             embed = discord.Embed(
                 title="マインスイーパー",
                 description="".join(("`1 4`のように横何番目と何行目で送信してください。\n爆弾数：",
@@ -93,11 +114,11 @@ class Mines(commands.Cog):
             return await ctx.reply(embed=embed)
 
     @commands.command()
-    async def msd(self, ctx, a: discord.Member):
+    async def msd(self, ctx, a: discord.Member = None):
         if not a:
             return await ctx.reply("```\n" + str(len(self.games)) + "\n```")
         else:
-            return ctx.reply("```\n" + self.games[str(a.id)].get() + "\n```")
+            return await ctx.reply("```\n" + self.games[str(a.id)].get() + "\n```")
 
 
 def setup(bot):
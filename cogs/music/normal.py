@@ -177,7 +177,7 @@ class MusicNormal(commands.Cog, DataManager):
         `rt!play https://www.youtube.com/watch?v=Th-Z6le3bHA`
         `rt!play Never Gonna Give You Up`
         `/play We are number one`"""
-        if ctx.guild.id in self.bot.cogs["TTS"].now:
+        if ctx.guild.id in getattr(self.bot.get_cog("TTS"), "now", ()):
             return await ctx.reply(
                 content={
                     "ja": "読み上げと同時に使用することはできません。\nサブのRTであるりつたんを使用してください。",
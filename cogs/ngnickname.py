@@ -1,9 +1,19 @@
 # RT - Ng Nickname
 
+from typing import Optional, Pattern, Dict, List
+
 from discord.ext import commands
 import discord
 
 from aiomysql import Pool
+import re
+
+
+def compile_words(words: List[str]) -> Pattern:
+    "NGワードのどれかに一致する正規表現を作ります。"
+    return re.compile("|".join(
+        map(re.escape, sorted(set(words), key=len, reverse=True))
+    ))
 
 
 class NGNickName(commands.Cog):
@@ -13,6 +23,8 @@ class NGNickName(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.pool: Pool = self.bot.mysql.pool
+        self.words: Dict[int, List[str]] = {}
+        self.matchers: Dict[int, Pattern] = {}
         self.bot.loop.create_task(self.init_database())
 
     async def init_database(self):
@@ -23,38 +35,55 @@ class NGNickName(commands.Cog):
                         GuildID BIGINT, Word TEXT
                     );"""
                 )
-
-    async def getall(self, guild_id: int):
-        async with self.pool.acquire() as conn:
-            async with conn.cursor() as cursor:
-                await cursor.execute(
-                    f"""SELECT Word FROM {self.DB}
-                    WHERE GuildID = %s;""",
-                    (guild_id,)
-                )
-                return [row[0] for row in await cursor.fetchall() if row]
+                # NGワードをキャッシュしておく。
+                await cursor.execute(f"SELECT GuildID, Word FROM {self.DB};")
+                for row in await cursor.fetchall():
+                    if row:
+                        self.words.setdefault(row[0], []).append(row[1])
+        for guild_id in list(self.words):
+            self.update_matcher(guild_id)
+
+    def update_matcher(self, guild_id: int) -> None:
+        "サーバーのNGワードの正規表現を作り直します。"
+        if self.words.get(guild_id):
+            self.matchers[guild_id] = compile_words(self.words[guild_id])
+        else:
+            self.words.pop(guild_id, None)
+            self.matchers.pop(guild_id, None)
+
+    def search(self, guild_id: int, nick: str) -> Optional[str]:
+        "ニックネームに含まれているNGワードを返します。"
+        if (matcher := self.matchers.get(guild_id)) is not None \
+                and (match := matcher.search(nick)) is not None:
+            return match.group()
+
+    async def sweep(self, guild: discord.Guild, matcher: Pattern) -> None:
+        "既にニックネームに`matcher`に一致するものが入っている人のニックネームを元に戻します。"
+        for member in guild.members:
+            if member.nick and matcher.search(member.nick):
+                try:
+                    await member.edit(nick=member.name)
+                except discord.Forbidden:
+                    pass
 
     @commands.Cog.listener()
     async def on_member_update(self, before, after):
         if before.nick is None:
             before.nick = ""
         if after.nick:
-            if before.nick != after.nick:
-                for word in await self.getall(after.guild.id):
-                    if word in after.nick:
-                        try:
-                            await after.edit(nick=before.nick, reason="NGニックネームにひっかかったため。")
-                        except discord.Forbidden:
-                            pass
-                        else:
-                            await after.send(
-                                "<:error:878914351338246165> あなたのそのニックネームは" \
-                                f"`{after.guild.name}`で有効ではありません。\n" \
-                                "お手数ですが別のものにしてください。\n" \
-                                f"検知した禁止ワード：`{word}`"
-                            )
-                        finally:
-                            break
+            if before.nick != after.nick \
+                    and (word := self.search(after.guild.id, after.nick)):
+                try:
+                    await after.edit(nick=before.nick, reason="NGニックネームにひっかかったため。")
+                except discord.Forbidden:
+                    pass
+                else:
+                    await after.send(
+                        "<:error:878914351338246165> あなたのそのニックネームは" \
+                        f"`{after.guild.name}`で有効ではありません。\n" \
+                        "お手数ですが別のものにしてください。\n" \
+                        f"検知した禁止ワード：`{word}`"
+                    )
 
     @commands.group(
         aliases=["NGニックネーム", "nn"], extras={
@@ -91,7 +120,7 @@ class NGNickName(commands.Cog):
                     title="NGニックネームリスト",
                     description=(
                         "`" + "`, `".join(words) + "`"
-                        if (words := await self.getall(ctx.guild.id))
+                        if (words := self.words.get(ctx.guild.id))
                         else "まだありません。"
                     ), color=self.bot.colors["normal"]
                 )
@@ -138,11 +167,11 @@ class NGNickName(commands.Cog):
                     f"""INSERT INTO {self.DB} (GuildID, Word) VALUES (%s, %s);""",
                     (ctx.guild.id, word)
                 )
+        self.words.setdefault(ctx.guild.id, []).append(word)
+        self.update_matcher(ctx.guild.id)
 
         # 既にニックネームにwordが入ってる人は訂正する。
-        for member in ctx.guild.members:
-            if member.nick and word in member.nick:
-                await member.edit(nick=member.name)
+        await self.sweep(ctx.guild, compile_words([word]))
 
         await ctx.reply(
             {"ja": "追加しました。",
@@ -187,8 +216,12 @@ class NGNickName(commands.Cog):
                             f"DELETE FROM {self.DB} WHERE GuildID = %s AND Word = %s;",
                             (ctx.guild.id, word)
                         )
+                        self.words[ctx.guild.id] = [
+                            w for w in self.words.get(ctx.guild.id, ()) if w != word
+                        ]
                     else:
                         failed.append(word)
+        self.update_matcher(ctx.guild.id)
         b = ', '.join(failed)
         await ctx.reply(
             {"ja": "削除しました。" \
@@ -5,18 +5,33 @@ import discord
 
 from typing import Optional, Tuple, List
 
-from aiohttp import ClientSession
 from datetime import timedelta
 from bs4 import BeautifulSoup
 from random import randint
 import asyncio
 
 
+def parse_yahoo(html: str) -> List[Tuple[str, str]]:
+    # Yahooの検索結果のHTMLから検索結果を取り出します。
+    results = []
+    for d in BeautifulSoup(html, "html.parser").find_all("section"):
+        k = d.find("h3")
+        if k:
+            k = k.find("span")
+            d = d.find("a")
+            results.append(
+                (getattr(k, "text", None),
+                 d.get("href") if d else None)
+            )
+    return [k for k in results[1:] if k[1] is not None]
+
+
 class Person(commands.Cog):
 
     HEADERS = {
         'User-Agent': 'Mozilla/5.0 (Windows NT 6.2; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/32.0.1667.0 Safari/537.36'
     }
+    SEARCH_CACHE_TTL = 600
     YAHOO_ICON = "http://tasuren.syanari.com/RT/yahoo_favicon.PNG"
     QUESTIONS = ("とは", "とは?", "とは？", "って何", "って何？",
                  "って何?", "ってなに", "ってなに？", "ってなに?")
@@ -29,13 +44,15 @@ class Person(commands.Cog):
 
     def __init__(self, bot):
         self.bot = bot
-        self.session = ClientSession()
 
     async def search_message(
         self, channel: discord.TextChannel,
         original: discord.Message,
         content: str, **kwargs
     ) -> Optional[discord.Message]:
+        if (history := self.bot.get_cog("History")) is not None:
+            return await history.search(channel, original, content, **kwargs)
+        # 履歴のコグが読み込まれていない場合は履歴を遡る。
         async for message in channel.history(**kwargs):
             if message.id != original.id and content in message.clean_content:
                 return message
@@ -71,12 +88,17 @@ class Person(commands.Cog):
         message = await ctx.reply(
             f"{self.bot.cogs['MusicNormal'].EMOJIS['loading']} Counting..."
         )
-        count = len(
-            [mes async for mes in ctx.channel.history(limit=5000)
-             if content is None or content in mes.content]
-        )
+        if (history := self.bot.get_cog("History")) is not None:
+            count, capped = await history.count(ctx.channel, content)
+        else:
+            # 履歴のコグが読み込まれていない場合はその場で数える。
+            count = 0
+            async for mes in ctx.channel.history(limit=5000):
+                if content is None or content in mes.content:
+                    count += 1
+            capped = count == 5000
         await message.edit(
-            f"メッセージ数：{'5000件以上' if count == 5000 else f'{count}件'}"
+            f"メッセージ数：{f'{count}件以上' if capped else f'{count}件'}"
         )
 
 
@@ -313,26 +335,12 @@ class Person(commands.Cog):
 
     async def yahoo(self, keyword: str) -> Tuple[str, List[Tuple[str, str]]]:
         # yahooで検索を行います。
-        results = []
         url = 'https://search.yahoo.co.jp/search?p=' + \
             keyword.replace(" ", "+").replace("　", "+")
-
-        async with self.session.get(url, headers=self.HEADERS) as r:
-            html = await r.text()
-
-        soup = BeautifulSoup(html, "html.parser")
-        soup = soup.find_all("section")
-        for d in soup:
-            k = d.find("h3")
-            if k:
-                k = k.find("span")
-                d = d.find("a")
-                results.append(
-                    (getattr(k, "text", None),
-                     d.get("href") if d else None)
-                )
-
-        return url, [k for k in results[1:] if k[1] is not None]
+        return url, await self.bot.http_manager.get(
+            url, headers=self.HEADERS, parser=parse_yahoo,
+            ttl=self.SEARCH_CACHE_TTL, stale=self.SEARCH_CACHE_TTL
+        )
 
     async def search(self, word: str, max_: int = 5) -> Optional[discord.Embed]:
         # self.yahooを使ってYahooで検索をした結果をEmbedにします。
@@ -433,17 +441,6 @@ class Person(commands.Cog):
                     )
                 )
 
-    def cog_unload(self, loop=None):
-        if loop is None:
-            loop = self.bot.loop
-        if loop and self.session is not None:
-            loop.create_task(self.session.close())
-            self.session = None
-
-    @commands.Cog.listener()
-    async def on_close(self, loop):
-        self.cog_unload(loop=loop)
-
     @commands.Cog.listener()
     async def on_message(self, message):
         if not message.guild or message.author.bot:
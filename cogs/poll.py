@@ -1,19 +1,203 @@
 # RT - Poll (Vote)
 
+from typing import TYPE_CHECKING, Callable, Optional, Tuple, List, Dict, Set
+
 from discord.ext import commands, tasks
 import discord
 
-from typing import Callable, Tuple, List, Dict
 from emoji import UNICODE_EMOJI_ENGLISH
 from asyncio import create_task
+from datetime import timedelta
+from ujson import loads, dumps
+
+if TYPE_CHECKING:
+    from aiomysql import Pool
+
+
+TABLES = ("PollPanel", "PollVote")
+# 作成されてからこの日数が経った投票パネルの台帳は削除します。
+# 削除された後にリアクションがされた場合はその時にリアクションから台帳を作り直します。
+POLL_TTL = 30
+# 起動時にリアクションと照合するのは作成されてからこの日数以内の投票パネルのみです。
+RECONCILE_DAYS = 3
+
+
+def days_ago(days: int) -> int:
+    "指定された日数前に作成されたメッセージのIDの最小値を返します。"
+    return discord.utils.time_snowflake(
+        discord.utils.utcnow() - timedelta(days=days)
+    )
+
+
+class PollData:
+    "投票パネルの票の台帳です。"
+
+    __slots__ = (
+        "message_id", "channel_id", "only_one", "emojis",
+        "embed", "header", "votes", "counts"
+    )
+
+    def __init__(
+        self, message_id: int, channel_id: int, only_one: bool,
+        emojis: List[str], embed: dict, header: str
+    ):
+        self.message_id, self.channel_id = message_id, channel_id
+        self.only_one, self.emojis = only_one, emojis
+        # 投票パネルのEmbedの辞書とメッセージの一行目です。
+        self.embed, self.header = embed, header
+        # 投票者のIDとその人が投票した絵文字です。
+        self.votes: Dict[int, Set[str]] = {}
+        self.counts: Dict[str, int] = dict.fromkeys(emojis, 0)
+
+    def add(self, user_id: int, emoji: str) -> bool:
+        "票を追加します。一人一票で既に他に投票している場合は`False`を返します。"
+        choices = self.votes.setdefault(user_id, set())
+        if emoji in choices:
+            return True
+        if self.only_one and choices:
+            return False
+        choices.add(emoji)
+        self.counts[emoji] += 1
+        return True
+
+    def remove(self, user_id: int, emoji: str) -> bool:
+        "票を削除します。削除した場合は`True`を返します。"
+        if emoji in (choices := self.votes.get(user_id, ())):
+            choices.remove(emoji)
+            if not choices:
+                del self.votes[user_id]
+            self.counts[emoji] -= 1
+            return True
+        return False
 
+    def clear(self) -> None:
+        "票を全て削除します。"
+        self.votes.clear()
+        self.counts = dict.fromkeys(self.emojis, 0)
+
+
+class DataManager:
+    def __init__(self, cog: "Poll"):
+        self.cog = cog
+        self.pool: "Pool" = cog.bot.mysql.pool
+        self.cog.bot.loop.create_task(self._prepare_table())
+
+    async def _prepare_table(self):
+        # テーブルの準備をする。このクラスのインスタンス化時に自動で実行される。
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"""CREATE TABLE IF NOT EXISTS {TABLES[0]} (
+                        MessageID BIGINT PRIMARY KEY NOT NULL,
+                        ChannelID BIGINT, OnlyOne BOOLEAN, Data JSON
+                    );"""
+                )
+                await cursor.execute(
+                    f"""CREATE TABLE IF NOT EXISTS {TABLES[1]} (
+                        MessageID BIGINT, UserID BIGINT, Emoji VARCHAR(100),
+                        PRIMARY KEY (MessageID, UserID, Emoji)
+                    );"""
+                )
+                await self._prune(cursor)
+                # 台帳を用意しておく。
+                await cursor.execute(f"SELECT * FROM {TABLES[0]};")
+                for row in await cursor.fetchall():
+                    if row:
+                        data = loads(row[3])
+                        self.cog.polls[row[0]] = PollData(
+                            row[0], row[1], bool(row[2]), data["emojis"],
+                            data["embed"], data["header"]
+                        )
+                await cursor.execute(f"SELECT * FROM {TABLES[1]};")
+                for row in await cursor.fetchall():
+                    if row and row[0] in self.cog.polls:
+                        self.cog.polls[row[0]].add(row[1], row[2])
+        await self.cog.reconcile()
+
+    async def _prune(self, cursor) -> None:
+        # 古い投票パネルの台帳を削除します。
+        for table in TABLES:
+            await cursor.execute(
+                f"DELETE FROM {table} WHERE MessageID < %s;", (days_ago(POLL_TTL),)
+            )
+
+    async def prune(self) -> None:
+        "古い投票パネルの台帳を削除します。"
+        for message_id in [
+            message_id for message_id in self.cog.polls
+            if message_id < days_ago(POLL_TTL)
+        ]:
+            del self.cog.polls[message_id]
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await self._prune(cursor)
+
+    async def save_poll(self, poll: PollData) -> None:
+        "投票パネルとその票を保存します。"
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                await cursor.execute(
+                    f"""INSERT INTO {TABLES[0]} VALUES (%s, %s, %s, %s)
+                        ON DUPLICATE KEY UPDATE Data = VALUES(Data);""",
+                    (poll.message_id, poll.channel_id, poll.only_one, dumps({
+                        "emojis": poll.emojis, "embed": poll.embed,
+                        "header": poll.header
+                    }))
+                )
+                await cursor.execute(
+                    f"DELETE FROM {TABLES[1]} WHERE MessageID = %s;",
+                    (poll.message_id,)
+                )
+                rows = [
+                    (poll.message_id, user_id, emoji)
+                    for user_id, choices in poll.votes.items()
+                    for emoji in choices
+                ]
+                if rows:
+                    await cursor.executemany(
+                        f"INSERT INTO {TABLES[1]} VALUES (%s, %s, %s);", rows
+                    )
 
-class Poll(commands.Cog):
+    async def save_vote(
+        self, message_id: int, user_id: int, emoji: str, add: bool
+    ) -> None:
+        "票を保存または削除します。"
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                if add:
+                    await cursor.execute(
+                        f"INSERT IGNORE INTO {TABLES[1]} VALUES (%s, %s, %s);",
+                        (message_id, user_id, emoji)
+                    )
+                else:
+                    await cursor.execute(
+                        f"""DELETE FROM {TABLES[1]}
+                            WHERE MessageID = %s AND UserID = %s AND Emoji = %s;""",
+                        (message_id, user_id, emoji)
+                    )
+
+    async def delete_poll(self, message_id: int) -> None:
+        "投票パネルを削除します。"
+        self.cog.polls.pop(message_id, None)
+        async with self.pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                for table in TABLES:
+                    await cursor.execute(
+                        f"DELETE FROM {table} WHERE MessageID = %s;",
+                        (message_id,)
+                    )
+
+
+class Poll(commands.Cog, DataManager):
     def __init__(self, bot):
         self.bot, self.rt = bot, bot.data
         self.emojis = [chr(0x1f1e6 + i) for i in range(26)]
-        self.queue: Dict[str, discord.RawReactionActionEvent] = {}
+        self.queue: Set[int] = set()
+        self.polls: Dict[int, PollData] = {}
+        self.webhooks: Dict[int, discord.Webhook] = {}
+        super(commands.Cog, self).__init__(self)
         self.panel_updater.start()
+        self.pruner.start()
 
     @commands.command(
         extras={"headding": {"ja": "投票パネルを作成します。", "en": "..."},
@@ -102,6 +286,19 @@ class Poll(commands.Cog):
             wait=True, embed=embed, username=ctx.author.display_name,
             avatar_url=getattr(ctx.author.avatar, "url", ""),
         )
+        # リアクションが付けられる前に台帳を作っておく。
+        poll = PollData(
+            mes.id, mes.channel.id, only_one, emojis,
+            mes.embeds[0].to_dict(), mes.content[:mes.content.find("\n")]
+        )
+        if (adopted := self.polls.get(mes.id)) is not None:
+            # 送信の完了より先にリアクションから台帳が作られていた場合はその票を引き継ぐ。
+            for user_id, choices in adopted.votes.items():
+                for emoji in choices:
+                    if emoji in poll.counts:
+                        poll.add(user_id, emoji)
+        self.polls[mes.id] = poll
+        await self.save_poll(poll)
         for emoji in emojis:
             try:
                 await mes.add_reaction(emoji)
@@ -170,72 +367,146 @@ class Poll(commands.Cog):
                 r += '>'
         return r + ']'
 
-    async def update_panel(self, payload: discord.RawReactionActionEvent):
-        # RTの投票パネルをアップデートする。
-        embed = payload.message.embeds[0]
-        emojis = {str(reaction.emoji): reaction.count - 1
-                  for reaction in payload.message.reactions}
+    async def _get_webhook(self, channel: discord.TextChannel) -> Optional[discord.Webhook]:
+        # 投票パネルの編集に使うウェブフックを取得します。
+        if channel.id not in self.webhooks:
+            if (wb := discord.utils.get(await channel.webhooks(), name="RT-Tool")) is None:
+                return None
+            self.webhooks[channel.id] = wb
+        return self.webhooks[channel.id]
+
+    async def update_panel(self, poll: PollData):
+        # RTの投票パネルを台帳からアップデートする。
+        if (channel := self.bot.get_channel(poll.channel_id)) is None:
+            return
+        embed = discord.Embed.from_dict(poll.embed)
+        emojis = dict(poll.counts)
         # 最大桁数を数える。
-        before = 1
-        for key in emojis:
-            if before < (now := len(str(emojis[key]))):
-                before = now
+        before = max((len(str(count)) for count in emojis.values()), default=1)
         # Embedを編集する。
-        description, _ = self.make_description(
-            embed.description, lambda emoji: str(emojis[emoji]).zfill(before)
+        embed.description, _ = self.make_description(
+            embed.description, lambda emoji: str(emojis.get(emoji, 0)).zfill(before)
         )
-        if description != embed.description:
-            # もしカウントが変わっているならメッセージを編集する。
-            embed.description = description
-            wb = discord.utils.get(
-                await payload.message.channel.webhooks(), name="RT-Tool"
-            )
-            if wb:
+        if (wb := await self._get_webhook(channel)):
+            try:
+                await wb.edit_message(
+                    poll.message_id, embed=embed,
+                    content="".join((poll.header, "\n📊 ", self.graph(emojis), ""))
+                )
+            except discord.NotFound:
+                # ウェブフックかメッセージが削除された場合はキャッシュを消す。
+                del self.webhooks[channel.id]
+            except discord.InvalidArgument:
+                pass
+
+    async def reconcile(self, poll: Optional[PollData] = None, message=None):
+        # リアクションから台帳を作り直します。起動時に一度だけ最近の投票パネルに対して実行されます。
+        await self.bot.wait_until_ready()
+        for poll in ((poll,) if poll else [
+            poll for poll in self.polls.values()
+            if poll.message_id >= days_ago(RECONCILE_DAYS)
+        ]):
+            if message is None:
+                if (channel := self.bot.get_channel(poll.channel_id)) is None:
+                    await self.delete_poll(poll.message_id)
+                    continue
                 try:
-                    await wb.edit_message(
-                        payload.message_id, embed=embed,
-                        content="".join(
-                            (payload.message.content[:payload.message.content.find("\n")],
-                            "\n📊 ", self.graph(emojis), ""))
-                    )
-                except discord.InvalidArgument:
-                    pass
-        del description, emojis
+                    message = await channel.fetch_message(poll.message_id)
+                except discord.NotFound:
+                    await self.delete_poll(poll.message_id)
+                    continue
+                except discord.HTTPException:
+                    continue
+
+            reactors: Dict[str, Set[int]] = {}
+            for reaction in message.reactions:
+                if (emoji := str(reaction.emoji)) in poll.counts:
+                    reactors[emoji] = {
+                        user.id async for user in reaction.users() if not user.bot
+                    }
+            before = {
+                user_id: set(choices) for user_id, choices in poll.votes.items()
+            }
+            poll.clear()
+            # 一人一票の場合は既に台帳にある票を優先する。
+            for user_id, choices in before.items():
+                for emoji in choices:
+                    if user_id in reactors.get(emoji, ()):
+                        poll.add(user_id, emoji)
+            for emoji, users in reactors.items():
+                for user_id in users:
+                    poll.add(user_id, emoji)
+
+            if before != poll.votes:
+                await self.save_poll(poll)
+                self.queue.add(poll.message_id)
+            message = None
 
     def cog_unload(self):
         self.panel_updater.cancel()
+        self.pruner.cancel()
+
+    @tasks.loop(hours=24)
+    async def pruner(self):
+        await self.prune()
 
     @tasks.loop(seconds=4)
     async def panel_updater(self):
-        # キューにあるpayloadからパネルを更新する。
+        # キューにある投票パネルを更新する。
         # 連打された際に連打全部に対応して編集するようなことが起きないように。
-        for cmid in list(self.queue.keys()):
-            create_task(self.update_panel(self.queue[cmid]))
-            del self.queue[cmid]
+        queue, self.queue = self.queue, set()
+        for message_id in queue:
+            if message_id in self.polls:
+                create_task(self.update_panel(self.polls[message_id]))
 
     @commands.Cog.listener()
-    async def on_full_reaction_add(self, payload: discord.RawReactionActionEvent):
-        if self.bot.is_ready() and hasattr(payload, "message"):
-            if self.check_panel(payload):
-                cmid = f"{payload.channel_id}.{payload.message_id}"
-                if payload.event_type == "REACTION_ADD":
-                    # もし一人一票までなら投票できるかチェックをする。
-                    if "一" in payload.message.content:
-                        users = len(
-                            [reaction for reaction in payload.message.reactions
-                             if any(user.id == payload.member.id
-                                    for user in await reaction.users().flatten())]
-                        )
-                        if users > 1:
-                            await payload.message.remove_reaction(
-                                payload.emoji, payload.member
-                            )
-                            return
-                self.queue[cmid] = payload
+    async def on_raw_reaction_add(self, payload: discord.RawReactionActionEvent):
+        if (poll := self.polls.get(payload.message_id)) is None \
+                or (payload.member and payload.member.bot) \
+                or (emoji := str(payload.emoji)) not in poll.counts:
+            return
+        if poll.add(payload.user_id, emoji):
+            self.queue.add(poll.message_id)
+            await self.save_vote(poll.message_id, payload.user_id, emoji, True)
+        elif (channel := self.bot.get_channel(payload.channel_id)):
+            # 一人一票で既に投票している場合はリアクションを外す。
+            try:
+                await channel.get_partial_message(payload.message_id) \
+                    .remove_reaction(payload.emoji, discord.Object(payload.user_id))
+            except discord.HTTPException:
+                pass
 
     @commands.Cog.listener()
-    async def on_full_reaction_remove(self, payload: discord.RawReactionActionEvent):
-        await self.on_full_reaction_add(payload)
+    async def on_raw_reaction_remove(self, payload: discord.RawReactionActionEvent):
+        if (poll := self.polls.get(payload.message_id)) is not None \
+                and poll.remove(payload.user_id, (emoji := str(payload.emoji))):
+            self.queue.add(poll.message_id)
+            await self.save_vote(poll.message_id, payload.user_id, emoji, False)
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        if payload.message_id in self.polls:
+            await self.delete_poll(payload.message_id)
+
+    @commands.Cog.listener()
+    async def on_full_reaction_add(self, payload: discord.RawReactionActionEvent):
+        # 台帳がない古い投票パネルは一度だけリアクションから台帳を作る。
+        if (self.bot.is_ready() and payload.message_id not in self.polls
+                and hasattr(payload, "message") and payload.member
+                and self.check_panel(payload)):
+            content = payload.message.content
+            poll = PollData(
+                payload.message_id, payload.channel_id, "一" in content,
+                [str(reaction.emoji) for reaction in payload.message.reactions],
+                payload.message.embeds[0].to_dict(), content[:content.find("\n")]
+            )
+            self.polls[poll.message_id] = poll
+            await self.reconcile(poll, payload.message)
+            if self.polls.get(poll.message_id) is not poll:
+                # 作成中の投票パネルでコマンドの方の台帳に置き換えられた場合。
+                return
+            await self.save_poll(poll)
+            self.queue.add(poll.message_id)
 
 
 def setup(bot):
@@ -1,6 +1,6 @@
 # RT - Require Send
 
-from typing import TYPE_CHECKING, Union, Tuple, Dict, List
+from typing import TYPE_CHECKING, Union, Tuple, Dict, List, Set
 
 from discord.ext import commands, tasks
 import discord
@@ -8,8 +8,10 @@ import discord
 from asyncio import Event
 from time import time
 
+from rtutil.deadline import DeadlineHeap
+
 if TYPE_CHECKING:
-    from aiomysql import Pool, Cursor
+    from aiomysql import Pool
     from rtlib import Backend
 
 
@@ -29,7 +31,7 @@ class DataManager:
 
     async def _prepare_table(self):
         # クラスのインスタンス化時に自動で実行される関数です。
-        # テーブルの準備をする。
+        # テーブルの準備をしてキャッシュを作る。
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cursor:
                 await cursor.execute(
@@ -43,195 +45,170 @@ class DataManager:
                         GuildID BIGINT, ChannelID BIGINT, UserID BIGINT
                     );"""
                 )
-                await self._update_cache(cursor)
+                await cursor.execute(f"SELECT * FROM {self.TABLES[0]};")
+                for row in await cursor.fetchall():
+                    if row:
+                        self.channels.setdefault(row[0], {})[row[1]] = row[2]
+                # キューにはチャンネルIDが0の行と送信済みのチャンネルの行が保存されている。
+                await cursor.execute(f"SELECT * FROM {self.TABLES[1]};")
+                queues: Dict[Tuple[int, int], Set[int]] = {}
+                for row in await cursor.fetchall():
+                    if row:
+                        queues.setdefault((row[0], row[2]), set()).add(row[1])
+        await self.bot.wait_until_ready()
+        now = time()
+        for (guild_id, user_id), sent in queues.items():
+            if (guild := self.bot.get_guild(guild_id)) is None \
+                    or (member := guild.get_member(user_id)) is None:
+                # サーバーやメンバーがいないならキューを削除しておく。
+                self.queue_write("delete", (guild_id, user_id))
+                continue
+            self.add_pending(
+                member, {
+                    channel_id: timeout
+                    for channel_id, timeout in self.channels.get(guild_id, {}).items()
+                    if channel_id not in sent
+                }, member.joined_at.timestamp() if member.joined_at else now
+            )
+        self.deadlines.start()
         self.ready.set()
 
-    async def _update_cache(self, cursor):
-        await cursor.execute(f"SELECT * FROM {self.TABLES[0]};")
-        for row in await cursor.fetchall():
-            if row:
-                if row[0] not in self.cache:
-                    self.cache[row[0]] = []
-                self.cache[row[0]].append(row[1])
-
     async def write(self, guild_id: int, channel_id: int, timeout: int) -> None:
         "送信必須チャンネルを追加します。"
+        assert len(
+            [id_ for id_ in self.channels.get(guild_id, ()) if id_ != channel_id]
+        ) <= self.MAX_CHANNELS, "追加しすぎです。"
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cursor:
-                await cursor.execute(
-                    f"SELECT * FROM {self.TABLES[0]} WHERE GuildID = %s;",
-                    (guild_id,)
-                )
-                assert len(
-                    [row for row in await cursor.fetchall()
-                     if row[1] != channel_id]
-                ) <= self.MAX_CHANNELS, "追加しすぎです。"
                 await cursor.execute(
                     f"""INSERT INTO {self.TABLES[0]} VALUES (%s, %s, %s)
                         ON DUPLICATE KEY UPDATE Timeout = %s;""",
                     (guild_id, channel_id, timeout, timeout)
                 )
-                await self._update_cache(cursor)
+        self.channels.setdefault(guild_id, {})[channel_id] = timeout
 
     async def delete(self, guild_id: int, channel_id: int) -> None:
         "送信必須チャンネルを削除します。"
+        assert channel_id in self.channels.get(guild_id, ()), "その設定はありません。"
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cursor:
-                await cursor.execute(
-                    f"SELECT * FROM {self.TABLES[0]} WHERE ChannelID = %s;",
-                    (channel_id,)
-                )
-                assert await cursor.fetchone(), "その設定はありません。"
                 await cursor.execute(
                     f"DELETE FROM {self.TABLES[0]} WHERE ChannelID = %s;",
                     (channel_id,)
                 )
                 # もしキューが存在するのならそれも削除しておく。
                 await cursor.execute(
-                    f"SELECT * FROM {self.TABLES[1]} WHERE ChannelID = %s;",
+                    f"DELETE FROM {self.TABLES[1]} WHERE ChannelID = %s;",
                     (channel_id,)
                 )
-                if await cursor.fetchone():
-                    await cursor.execute(
-                        f"DELETE FROM {self.TABLES[1]} WHERE ChannelID = %s;",
-                        (channel_id,)
-                    )
-                await self._update_cache(cursor)
-
-    async def reads(self, guild_id: int) -> List[Tuple[int, float]]:
+        del self.channels[guild_id][channel_id]
+        if not self.channels[guild_id]:
+            del self.channels[guild_id]
+        # 送信を待っているメンバーからもそのチャンネルを消す。
+        for (pending_guild_id, user_id), channels in list(self.pending.items()):
+            if pending_guild_id == guild_id and channel_id in channels:
+                self.deadlines.remove((guild_id, user_id, channel_id))
+                self.sent(guild_id, user_id, channel_id, False)
+
+    def queue_write(self, mode: str, args: tuple) -> None:
+        "キューのテーブルへの書き込みを溜めておきます。`flush`でまとめて書き込まれます。"
+        self.writes.append((mode, args))
+
+    async def flush(self) -> None:
+        "溜まっているキューのテーブルへの書き込みを行います。"
+        if not self.writes:
+            return
+        writes, self.writes = self.writes, []
         async with self.pool.acquire() as conn:
             async with conn.cursor() as cursor:
-                await cursor.execute(
-                    f"SELECT ChannelID, Timeout FROM {self.TABLES[0]} WHERE GuildID = %s;",
-                    (guild_id,)
-                )
-                return [row for row in await cursor.fetchall() if row]
-
-    async def add_queue(
-        self, cursor: "Cursor", guild_id: int, channel_id: int, user_id: int
+                # 順番を守りつつ同じ種類の書き込みが続いている部分はまとめて実行する。
+                index = 0
+                try:
+                    while index < len(writes):
+                        mode, end = writes[index][0], index
+                        while end < len(writes) and writes[end][0] == mode:
+                            end += 1
+                        await cursor.executemany(
+                            f"INSERT INTO {self.TABLES[1]} VALUES (%s, %s, %s);"
+                            if mode == "insert" else
+                            f"DELETE FROM {self.TABLES[1]} WHERE GuildID = %s AND UserID = %s;",
+                            [args for _, args in writes[index:end]]
+                        )
+                        index = end
+                except Exception:
+                    # 書き込めなかったものは次回に書き込む。
+                    self.writes[:0] = writes[index:]
+                    raise
+
+    def add_pending(
+        self, member: discord.Member, channels: Dict[int, float], joined_at: float
     ) -> None:
-        "キューに追加します。"
-        await cursor.execute(
-            f"""SELECT * FROM {self.TABLES[1]}
-                WHERE GuildID = %s AND ChannelID = %s AND UserID = %s;""",
-            (guild_id, channel_id, user_id)
-        )
-        if not await cursor.fetchone():
-            await cursor.execute(
-                f"INSERT INTO {self.TABLES[1]} VALUES (%s, %s, %s);",
-                (guild_id, channel_id, user_id)
-            )
-
-    async def process_check(self, message: discord.Message) -> None:
-        "渡されたメッセージから参加者がキューにいるならもう入力必須に送信したと追加したりします。"
-        async with self.pool.acquire() as conn:
-            async with conn.cursor() as cursor:
-                await cursor.execute(
-                    f"SELECT * FROM {self.TABLES[0]} WHERE ChannelID = %s;",
-                    (message.channel.id,)
+        "メンバーを送信を待つメンバーに追加します。"
+        if channels:
+            self.pending[(member.guild.id, member.id)] = set(channels)
+            for channel_id, timeout in channels.items():
+                self.deadlines.push(
+                    (member.guild.id, member.id, channel_id), joined_at + timeout
                 )
-                if await cursor.fetchone():
-                    await cursor.execute(
-                        f"SELECT * FROM {self.TABLES[1]} WHERE GuildID = %s AND UserID = %s;",
-                        (message.guild.id, message.author.id)
-                    )
-                    if await cursor.fetchone():
-                        await self.add_queue(
-                            cursor, message.guild.id,
-                            message.channel.id, message.author.id
-                        )
-
-    async def _remove_queue(self, cursor, guild_id, channel_id, user_id):
-        await cursor.execute(
-            f"""DELETE FROM {self.TABLES[1]}
-                WHERE ChannelID = %s AND UserID = %s;""",
-            (channel_id, user_id)
-        )
-        await cursor.execute(
-            f"SELECT * FROM {self.TABLES[1]} WHERE GuildID = %s AND UserID = %s;",
-            (guild_id, user_id)
-        )
-        if len(await cursor.fetchall()) <= 1:
-            await self._remove_queue_guild(cursor, guild_id, user_id)
+        else:
+            self.queue_write("delete", (member.guild.id, member.id))
 
-    async def _remove_queue_guild(self, cursor, guild_id, user_id):
-        await cursor.execute(
-            f"DELETE FROM {self.TABLES[1]} WHERE GuildID = %s AND UserID = %s;",
-            (guild_id, user_id)
-        )
+    def remove_pending(self, guild_id: int, user_id: int) -> None:
+        "メンバーを送信を待つメンバーから削除します。"
+        for channel_id in self.pending.pop((guild_id, user_id), ()):
+            self.deadlines.remove((guild_id, user_id, channel_id))
+        self.queue_write("delete", (guild_id, user_id))
 
-    async def clean_queue(self) -> None:
-        "キューをお掃除します。"
-        await self.ready.wait()
-        async with self.pool.acquire() as conn:
-            async with conn.cursor() as cursor:
-                await cursor.execute(
-                    f"SELECT * FROM {self.TABLES[1]};"
-                )
-                # キューを整理して辞書にする。
-                queues = {}
-                for row in await cursor.fetchall():
-                    if (guild := self.bot.get_guild(row[0])):
-                        if guild not in queues:
-                            queues[guild] = {}
-                        if row[2] not in queues[guild]:
-                            queues[guild][row[2]] = []
-                        queues[guild][row[2]].append(row[1])
-                    else:
-                        # サーバーが見つからないのならキューを削除しておく。
-                        await cursor.execute(
-                            f"DELETE FROM {self.TABLES[1]} WHERE GuildID = %s;",
-                            (row[0],)
-                        )
-                # キューにあるユーザーでタイムアウトしているユーザーはキックする。
-                now = time()
-                for guild in queues:
-                    await cursor.execute(
-                        f"SELECT * FROM {self.TABLES[0]} WHERE GuildID = %s;",
-                        (guild.id,)
+    def sent(
+        self, guild_id: int, user_id: int, channel_id: int, write: bool = True
+    ) -> None:
+        "送信済みにします。全てのチャンネルに送信した場合はキューから削除します。"
+        channels = self.pending[(guild_id, user_id)]
+        channels.discard(channel_id)
+        if not channels:
+            self.remove_pending(guild_id, user_id)
+        elif write:
+            self.queue_write("insert", (guild_id, channel_id, user_id))
+
+    async def on_timeout(self, items: List[Tuple[Tuple[int, int, int], None]]) -> None:
+        "送信されずにタイムアウトしたメンバーをキックします。"
+        for (guild_id, user_id, channel_id), _ in items:
+            if channel_id not in self.pending.get((guild_id, user_id), ()):
+                continue
+            self.remove_pending(guild_id, user_id)
+            if (guild := self.bot.get_guild(guild_id)) \
+                    and (member := guild.get_member(user_id)):
+                try:
+                    await member.kick(
+                        reason="入力必須チャンネルを入力せずに放置したため。"
                     )
-                    for row in await cursor.fetchall():
-                        for user_id in queues[guild]:
-                            if (member := guild.get_member(user_id)):
-                                for channel_id in queues[guild][user_id]:
-                                    if channel_id == row[1]:
-                                        # もし入力し終わっているなら削除キューに追加する。
-                                        await self._remove_queue(
-                                            cursor, guild.id, channel_id, user_id
-                                        )
-                                        break
-                                else:
-                                    # もしまだ何も送信していないチャンネルがあるならタイムアウトしていないか確かめる。
-                                    if now - member.joined_at.timestamp() > row[2]:
-                                        # タイムアウトしているならキックを行う。
-                                        if queues[guild][user_id]:
-                                            # そしてもしキューに何か存在するならキューを全て削除する。
-                                            await self._remove_queue_guild(
-                                                cursor, guild.id, user_id
-                                            )
-                                        await member.kick(
-                                            reason="入力必須チャンネルを入力せずに放置したため。"
-                                        )
-                            else:
-                                # メンバーがいないなら問答無用でキューのデータを削除する。
-                                await self._remove_queue_guild(cursor, guild.id, user_id)
-                del queues
+                except discord.HTTPException:
+                    pass
 
 
 class RequireSend(commands.Cog, DataManager):
     def __init__(self, bot: "Backend"):
         self.bot = bot
-        self.cache: Dict[int, List[int]] = {}
+        # サーバーIDから送信必須チャンネルのIDとタイムアウトの秒数を引くためのものです。
+        self.channels: Dict[int, Dict[int, float]] = {}
+        # サーバーIDとユーザーIDからまだ送信していないチャンネルのIDを引くためのものです。
+        self.pending: Dict[Tuple[int, int], Set[int]] = {}
+        self.writes: List[Tuple[str, tuple]] = []
+        self.deadlines = DeadlineHeap(
+            self.on_timeout, self.bot.loop, self.bot.on_error
+        )
         super(commands.Cog, self).__init__(self.bot)
-        self.process_queue.start()
+        self.flush_queue.start()
 
-    @tasks.loop(seconds=30)
-    async def process_queue(self):
-        # キューにあるユーザーのキックや削除を行うループです。
-        await self.clean_queue()
+    @tasks.loop(seconds=5)
+    async def flush_queue(self):
+        # キューへの書き込みをまとめて行うループです。
+        await self.flush()
 
     def cog_unload(self):
-        self.process_queue.cancel()
+        self.flush_queue.cancel()
+        self.deadlines.close()
+        self.bot.loop.create_task(self.flush())
 
     @commands.group(
         aliases=["rs", "入力必須"], extras={
@@ -391,26 +368,34 @@ class RequireSend(commands.Cog, DataManager):
             embed=discord.Embed(
                 title="Require Send",
                 description="\n".join(
-                    f"<#{row[0]}>：{row[1] / 60}分"
-                    for row in await self.reads(ctx.guild.id)
+                    f"<#{channel_id}>：{timeout / 60}分"
+                    for channel_id, timeout in self.channels.get(ctx.guild.id, {}).items()
                 ), color=self.bot.colors["normal"]
             )
         )
 
     @commands.Cog.listener()
     async def on_member_join(self, member: discord.Member):
-        if not member.bot:
-            if await self.reads(member.guild.id):
-                # キックするかもしれないキューに追加する。
-                async with self.pool.acquire() as conn:
-                    async with conn.cursor() as cursor:
-                        await self.add_queue(cursor, member.guild.id, 0, member.id)
+        if not member.bot and self.ready.is_set() \
+                and (channels := self.channels.get(member.guild.id)):
+            # キックするかもしれないキューに追加する。
+            self.queue_write("insert", (member.guild.id, 0, member.id))
+            self.add_pending(member, channels, time())
 
     @commands.Cog.listener()
-    async def on_message(self, message: discord.Message):
-        if message.guild and message.channel.id in self.cache.get(message.guild.id, ()):
-            await self.process_check(message)
+    async def on_member_remove(self, member: discord.Member):
+        if (member.guild.id, member.id) in self.pending:
+            self.remove_pending(member.guild.id, member.id)
 
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        if message.guild and message.channel.id in self.pending.get(
+            (message.guild.id, message.author.id), ()
+        ):
+            self.deadlines.remove(
+                (message.guild.id, message.author.id, message.channel.id)
+            )
+            self.sent(message.guild.id, message.author.id, message.channel.id)
 
 def setup(bot):
     bot.add_cog(RequireSend(bot))
\ No newline at end of file
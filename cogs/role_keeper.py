@@ -7,6 +7,8 @@ import discord
 
 from time import time
 
+from rtlib.ext.join_pipeline import JoinContext, join_stage
+
 if TYPE_CHECKING:
     from aiomysql import Pool
     from rtlib import Backend
@@ -179,19 +181,21 @@ class RoleKeeper(commands.Cog, DataManager):
         if not ctx.invoked_subcommand:
             await ctx.trigger_typing()
             onoff = await self.toggle(ctx.guild.id)
+            self.bot.dispatch("join_config_update", ctx.guild.id)
             await ctx.reply(
                 {"ja": f"ロールキーパーを{'ON' if onoff else 'OFF'}にしました。",
                  "en": f"RoleKeeper is {'en' if onoff else 'dis'}abled."}
             )
 
-    @commands.Cog.listener()
-    async def on_member_join(self, member: discord.Member):
+    @join_stage(20, loader="check")
+    async def on_join(self, context: JoinContext, _):
         # メンバーが参加した際にもしロールデータがあるならそのロールを付与しておく。
+        member = context.member
         try:
             for role in await self.read_roledata(member.guild.id, member.id):
                 if (role := member.guild.get_role(role)):
                     if role.name != "@everyone":
-                        await member.add_roles(role)
+                        context.add_roles(role.id)
         except AssertionError:
             pass
 
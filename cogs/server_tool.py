@@ -241,9 +241,17 @@ class ServerTool(commands.Cog):
 
         if 0 < day:
             try:
-                async for message in ctx.channel.history(
-                        limit=1, before=datetime.now() - timedelta(days=day)
-                    ):
+                when = datetime.now() - timedelta(days=day)
+                if (history := self.bot.get_cog("History")) is not None:
+                    message = await history.seek(ctx.channel, when)
+                else:
+                    # 履歴のコグが読み込まれていない場合は直接取得する。
+                    message = next(iter([
+                        message async for message in ctx.channel.history(
+                            limit=1, before=when
+                        )
+                    ]), None)
+                if message:
                     e = discord.Embed(
                         description=f"{message.content}\n[メッセージに行く]({message.jump_url})",
                         color=self.bot.colors["normal"]
@@ -254,7 +262,6 @@ class ServerTool(commands.Cog):
                     )
                     e.set_footer(text=f"{day}日前のメッセージ | タイムマシン機能")
                     await ctx.reply(embed=e)
-                    break
                 else:
                     raise discord.HTTPException("さかのぼりすぎた。")
             except discord.HTTPException:
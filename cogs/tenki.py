@@ -1,14 +1,14 @@
 # RT - Tenki
 
-from discord.ext import commands, easy, tasks
+from discord.ext import commands, easy
 import discord
 
+from rtutil.scheduler import Scheduler, parse_time
 from rtlib import DatabaseManager
 
-from datetime import datetime, timedelta
-from asyncio import sleep
+from collections import defaultdict
+from datetime import datetime
 from ujson import loads
-from pytz import utc
 
 
 with open("data/area_code.json", "r") as f:
@@ -58,7 +58,10 @@ PREFECTURES = [(data["@title"], i)
 class Tenki(commands.Cog, DataManager):
     def __init__(self, bot):
         self.bot = bot
-        self.tenki_notification.start()
+        # 天気通知は通知する時刻ごとにまとめて持っておく。
+        self.scheduler = Scheduler(
+            "tenki", self.tenki_notification, loop=self.bot.loop
+        )
 
         self.view = easy.View("TenkiPrefectureSelect")
         add_item = lambda options, true_count: self.view.add_item(
@@ -89,6 +92,13 @@ class Tenki(commands.Cog, DataManager):
             self.bot.mysql
         )
         await self.init_table()
+        for row in await self.reads():
+            if row:
+                try:
+                    self.scheduler.add(parse_time(row[2]), row[0], row[1])
+                except ValueError:
+                    pass
+        self.scheduler.start()
 
     @commands.command(
         slash_command=True, aliases=["天気"],
@@ -116,10 +126,10 @@ class Tenki(commands.Cog, DataManager):
 
     async def make_embed(self, code: str) -> discord.Embed:
         # 天気予報を取得してEmbedを作る。
-        async with self.bot.session.get(
-            f"https://weather.tsukumijima.net/api/forecast/city/{code}"
-        ) as r:
-            data = loads(await r.read())
+        data = await self.bot.http_manager.get(
+            f"https://weather.tsukumijima.net/api/forecast/city/{code}",
+            json=True, ttl=600
+        )
 
         embed = discord.Embed(
             title=data["title"],
@@ -208,35 +218,43 @@ class Tenki(commands.Cog, DataManager):
             except KeyError:
                 await ctx.reply("あなたはまだ設定していません。")
             else:
+                self.scheduler.remove(ctx.author.id)
                 await ctx.reply("Ok")
         elif time:
+            try:
+                minute = parse_time(time)
+            except ValueError:
+                return await ctx.reply("時刻は`HH:MM`の形式で指定してください。")
             await self.write(ctx.author.id, code, time)
+            self.scheduler.add(minute, ctx.author.id, code)
             await ctx.reply("Ok")
         else:
             await ctx.reply("引数が正しくありません。")
 
-    @tasks.loop(minutes=1)
-    async def tenki_notification(self):
-        # 天気通知を送るループです。
-        if not self.bot.is_ready():
-            await self.bot.wait_until_ready()
-            await sleep(3)
+    async def tenki_notification(self, _: datetime, items: list):
+        # 天気通知を送ります。天気予報は地域ごとに一度だけ取得する。
+        users = defaultdict(list)
+        for user_id, code in items:
+            users[code].append(user_id)
 
-        now = (datetime.now(utc) + timedelta(hours=9)).strftime('%H:%M')
-        for row in await self.reads():
-            if row and row[2] == now:
-                user = self.bot.get_user(row[0])
-                if user:
-                    embed = await self.make_embed(row[1])
-                    try:
-                        await user.send(embed=embed)
-                    except Exception as e:
-                        print("Error on tenki's notification", e)
+        for code, user_ids in users.items():
+            try:
+                embed = await self.make_embed(code)
+            except Exception as e:
+                print("Error on tenki's notification", e)
+                continue
+
+            async def send(user_id: int):
+                if (user := self.bot.get_user(user_id)):
+                    await user.send(embed=embed)
                 else:
-                    await self.delete(row[0])
+                    self.scheduler.remove(user_id)
+                    await self.delete(user_id)
+
+            await self.scheduler.run_all(send, user_ids)
 
     def cog_unload(self):
-        self.tenki_notification.cancel()
+        self.scheduler.close()
 
 
 def setup(bot):
@@ -1,11 +1,12 @@
 # RT - What day is today
 
-from discord.ext import commands, tasks
+from discord.ext import commands
 import discord
 
+from rtutil.scheduler import Scheduler, parse_time
 from rtlib import DatabaseManager
 from bs4 import BeautifulSoup
-from datetime import datetime, timedelta
+from datetime import datetime
 
 
 class DataManager(DatabaseManager):
@@ -50,17 +51,22 @@ class DataManager(DatabaseManager):
 class Today(commands.Cog, DataManager):
 
     YAHOO_ICON = "http://www.google.com/s2/favicons?domain=www.yahoo.co.jp"
+    NOTIFICATION_TIME = parse_time("09:00")
 
     def __init__(self, bot):
         self.bot = bot
-        self.yet = True
+        self.scheduler = Scheduler(
+            "today", self.today_notification, loop=self.bot.loop
+        )
         self.bot.loop.create_task(self.init_database())
 
     async def init_database(self):
         await self.bot.wait_until_ready()
         super(commands.Cog, self).__init__(self.bot.mysql)
         await self.init_table()
-        self.today_notification.start()
+        for row in await self.reads():
+            self.scheduler.add(self.NOTIFICATION_TIME, (row[0], row[1]))
+        self.scheduler.start()
 
     async def get_today(self) -> discord.Embed:
         # 今日はなんの日をyahooから持ってくる。
@@ -118,36 +124,39 @@ class Today(commands.Cog, DataManager):
                     )
             except (KeyError, OverflowError) as e:
                 await self.delete(ctx.guild.id, ctx.channel.id)
+                self.scheduler.remove((ctx.guild.id, ctx.channel.id))
                 if isinstance(e, OverflowError):
                     return await ctx.reply(
                         "一つのサーバーにつき四つまで設定が可能です。"
                     )
+            else:
+                self.scheduler.add(
+                    self.NOTIFICATION_TIME, (ctx.guild.id, ctx.channel.id)
+                )
             await ctx.reply("Ok")
         else:
             await ctx.reply("チャンネル管理権限がないと通知の設定はできません。")
 
     def cog_unload(self):
-        self.today_notification.cancel()
-
-    @tasks.loop(seconds=30)
-    async def today_notification(self):
-        # 今日はなんの日通知をする。
-        if self.yet and (
-            datetime.now() + timedelta(hours=9)
-        ).strftime("%H:%M") == "09:00":
-            for row in await self.reads():
-                channel = self.bot.get_channel(row[1])
-                if channel:
-                    try:
-                        await channel.send(embed=await self.get_today())
-                    except (discord.HTTPException, discord.Forbidden):
-                        pass
-                else:
-                    # もしチャンネルが見つからないなら設定を削除する。
-                    await self.delete(row[0], row[1])
-            self.yet = False
-        else:
-            self.yet = True
+        self.scheduler.close()
+
+    async def today_notification(self, _: datetime, items: list):
+        # 今日はなんの日通知をする。今日はなんの日は一度だけ取得する。
+        embed = await self.get_today()
+
+        async def send(item: tuple):
+            guild_id, channel_id = item[0]
+            if (channel := self.bot.get_channel(channel_id)):
+                try:
+                    await channel.send(embed=embed)
+                except (discord.HTTPException, discord.Forbidden):
+                    pass
+            else:
+                # もしチャンネルが見つからないなら設定を削除する。
+                self.scheduler.remove(item[0])
+                await self.delete(guild_id, channel_id)
+
+        await self.scheduler.run_all(send, items)
 
 
 def setup(bot):
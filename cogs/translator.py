@@ -3,14 +3,16 @@
 from discord.ext import commands
 import discord
 
-from jishaku.functools import executor_function
 from asyncio import sleep
 from typing import List
 import deep_translator
 
+from rtutil.translator import Translator as TranslateManager, is_linguistic
+from rtlib.ext.message_router import route
 from rtlib import RT
 
 
+TOPIC_DIRECTIVES = ("rt>translate", "rt>tran", "rt>翻訳", "rt>ほんやく")
 CHP_HELP = {
     "ja": ("翻訳専用チャンネル機能。",
 """# 翻訳チャンネルプラグイン - translate
@@ -52,11 +54,12 @@ It's in the personal category with the `translate` command.""")
 class Translator(commands.Cog):
     def __init__(self, bot: RT):
         self.bot = bot
+        # 同じ文章を何度も翻訳しないように翻訳結果はキャッシュする。
+        self.manager = TranslateManager(loop=self.bot.loop)
         self.bot.loop.create_task(self.on_command_added())
 
-    @executor_function
-    def translate(self, text: str, target: str) -> str:
-        return deep_translator.GoogleTranslator(target=target).translate(text)
+    async def translate(self, text: str, target: str) -> str:
+        return await self.manager.translate(text, target)
 
     async def on_command_added(self):
         # ヘルプにチャンネルプラグイン版翻訳を追加するだけ。
@@ -149,18 +152,18 @@ class Translator(commands.Cog):
         except deep_translator.exceptions.LanguageNotSupportedException:
             await ctx.reply("その言語は対応していません。")
 
-    @commands.Cog.listener()
+    @route(topic=TOPIC_DIRECTIVES, bots=True, prefixed=True)
     async def on_message(self, message: discord.Message):
-        if isinstance(message.channel, discord.Thread):
-            return
-        if ((message.author.bot and not (
+        if message.author.bot and not (
             message.author.discriminator == "0000" and " #" in message.author.name
-        )) or not message.guild or not message.channel.topic):
+        ):
             return
 
         for line in message.channel.topic.splitlines():
-            if line.startswith(("rt>translate", "rt>tran", "rt>翻訳", "rt>ほんやく")):
-                if 1 < len((splited := line.split())):
+            if line.startswith(TOPIC_DIRECTIVES):
+                # 絵文字だけなどの翻訳する必要のないメッセージは無視する。
+                if 1 < len((splited := line.split())) \
+                        and is_linguistic(message.content):
                     try:
                         message.content = f"{splited[1]} {message.content}"
                         await self.translate_.invoke(
@@ -58,7 +58,9 @@ class TTS(commands.Cog, VoiceManager, DataManager):
         self.bot = bot
         self.cache: Dict[int, dict] = {}
         self.now: Dict[int, dict] = {}
-        super(commands.Cog, self).__init__(bot.session, VOICES)
+        super(commands.Cog, self).__init__(
+            bot.session, VOICES, http=bot.http_manager
+        )
         self.bot.loop.create_task(self.on_ready())
 
     async def on_ready(self):
@@ -124,7 +126,7 @@ class TTS(commands.Cog, VoiceManager, DataManager):
                 "ja": "ボイスチャンネルに接続してください。",
                 "en": "..."
             }
-        elif ctx.guild.id in self.bot.cogs["MusicNormal"].now:
+        elif ctx.guild.id in getattr(self.bot.get_cog("MusicNormal"), "now", ()):
             data = {
                 "ja": "音楽プレイヤーと同時に使用することはできません。\nサブのRTであるりつたんを使用してください。",
                 "en": "..."
@@ -6,7 +6,7 @@ from ujson import loads, load, dumps
 from aiohttp import ClientSession
 from bs4 import BeautifulSoup
 from os import listdir, path
-from typing import Optional
+from typing import TYPE_CHECKING, Optional
 from alkana import get_kana
 from pykakasi import kakasi
 from re import findall, sub
@@ -15,6 +15,9 @@ from . import aquestalk
 from . import openjtalk
 from . import voiceroid
 
+if TYPE_CHECKING:
+    from rtlib import HTTPManager
+
 
 # 辞書を読み込む。
 with open("cogs/tts/dic/allow_characters.csv") as f:
@@ -25,6 +28,12 @@ with open("cogs/tts/dic/dictionary.json", "r") as f:
 kks = kakasi()
 
 
+def parse_e2k(html: str) -> str:
+    # sljfaqのページから英単語のカタカナ読みを取り出します。
+    return BeautifulSoup(html, "html.parser") \
+        .find(class_='katakana-string').string.replace('\n', '')
+
+
 class VoiceManager:
     """音声合成を簡単に行うためのクラスです。"""
 
@@ -36,8 +45,12 @@ class VoiceManager:
     NULL_CHARS = ("ー", "、", "。", "っ", "ゃ", "ゅ", "ょ",
                   "ッ", "ャ", "ュ", "ョ")
 
-    def __init__(self, session: ClientSession, voices: dict):
+    def __init__(
+        self, session: ClientSession, voices: dict,
+        http: Optional["HTTPManager"] = None
+    ):
         self.session: ClientSession = session
+        self.http: Optional["HTTPManager"] = http
         self.voices: dict = voices
 
         aquestalk.load_libs(
@@ -159,10 +172,13 @@ class VoiceManager:
             if not after:
                 # もしalkanaにも辞書にもないなら読み方を取得する。
                 url = f"https://www.sljfaq.org/cgi/e2k_ja.cgi?word={result.replace(' ', '+')}"
-                async with self.session.get(url, headers=self.HEADERS) as r:
-                    soup = BeautifulSoup(await r.text(), "html.parser")
-
-                after = soup.find(class_='katakana-string').string.replace('\n', '')
+                if self.http is None:
+                    async with self.session.get(url, headers=self.HEADERS) as r:
+                        after = parse_e2k(await r.text())
+                else:
+                    after = await self.http.get(
+                        url, headers=self.HEADERS, parser=parse_e2k
+                    )
                 dic[result] = after
 
                 async with async_open("cogs/tts/dic/dictionary.json", "w") as f:
@@ -6,6 +6,7 @@ from discord.ext import commands
 import discord
 
 from rtutil import securl, DatabaseManager
+from rtlib.ext.message_router import route
 from re import findall
 
 if TYPE_CHECKING:
@@ -114,7 +115,7 @@ class UrlChecker(commands.Cog, DataManager):
             self.runnings.append(ctx.author.id)
             await ctx.trigger_typing()
         try:
-            data = await securl.check(self.bot.session, url)
+            data = await securl.check(self.bot.http_manager, url)
         except ValueError:
             await ctx.reply("そのウェブページへのアクセスに失敗しました。")
         else:
@@ -185,16 +186,14 @@ class UrlChecker(commands.Cog, DataManager):
 
     EMOJI = "<:search:876360747440017439>"
 
-    @commands.Cog.listener()
+    @route(guilds="cache", bots=True)
     async def on_message(self, message: discord.Message):
-        if (not message.guild or message.author.id == self.bot.user.id
-                or message.guild.id not in self.cache):
+        if message.author.id == self.bot.user.id:
             return
 
         if (("http://" in message.content or "https://" in message.content
                 ) and "https://discord.com" not in message.content
-                and message.channel.id not in self.channel_runnings
-                and not message.content.startswith(tuple(self.bot.command_prefix))):
+                and message.channel.id not in self.channel_runnings):
             try:
                 await message.add_reaction(self.EMOJI)
             except discord.NotFound:
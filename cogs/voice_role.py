@@ -1,6 +1,6 @@
 # RT - Voice Role
 
-from typing import Union
+from typing import Union, Dict, Set
 
 from discord.ext import commands, tasks
 import discord
@@ -41,14 +41,8 @@ class DataManager(DatabaseManager):
             await cursor.insert_data(self.DB, target)
             return "追加 / add"
 
-    async def read(
-        self, cursor, guild_id: int, channel_id: int
-    ) -> tuple:
-        target = {"GuildID": guild_id, "ChannelID": channel_id}
-        if await cursor.exists(self.DB, target):
-            return await cursor.get_data(self.DB, target)
-        else:
-            return ()
+    async def reads(self, cursor) -> list:
+        return [row async for row in cursor.get_datas(self.DB, {}) if row]
 
     async def _get_length(self, cursor, guild_id: int) -> int:
         target = {"GuildID": guild_id}
@@ -61,14 +55,30 @@ class DataManager(DatabaseManager):
 class VoiceRole(commands.Cog, DataManager):
     def __init__(self, bot: RT):
         self.bot = bot
+        # チャンネルIDからそのチャンネルに設定されている役職のIDを引くためのものです。
+        self.roles: Dict[int, Set[int]] = {}
+        # サーバーIDとメンバーIDから接続または切断があったチャンネルのIDを引くためのものです。
+        self.queue: Dict[int, Dict[int, Set[int]]] = {}
         self.bot.loop.create_task(self.init_database())
-        self.queue = {}
 
     async def init_database(self) -> None:
         super(commands.Cog, self).__init__(self.bot.mysql)
         await self.init_table()
+        for row in await self.reads():
+            self.roles.setdefault(row[1], set()).add(row[2])
         self.worker.start()
 
+    async def toggle(self, guild_id: int, channel_id: int, role_id: int) -> str:
+        "設定を追加または削除します。"
+        mode = await self.write(guild_id, channel_id, role_id)
+        if mode.startswith("追加"):
+            self.roles.setdefault(channel_id, set()).add(role_id)
+        else:
+            self.roles[channel_id].discard(role_id)
+            if not self.roles[channel_id]:
+                del self.roles[channel_id]
+        return mode
+
     @commands.command(
         aliases=["vr", "ボイスロール", "音声役職", "ぼいすろーる"], extras={
             "headding": {
@@ -164,7 +174,7 @@ class VoiceRole(commands.Cog, DataManager):
         vr"""
         await ctx.trigger_typing()
         try:
-            mode = await self.write(ctx.guild.id, channel.id, role.id)
+            mode = await self.toggle(ctx.guild.id, channel.id, role.id)
         except OverflowError:
             await ctx.reply("VoiceRoleは15個まで設定が可能です。")
         else:
@@ -175,7 +185,7 @@ class VoiceRole(commands.Cog, DataManager):
         await ctx.trigger_typing()
         for channel in ctx.guild.voice_channels:
             try:
-                await self.write(ctx.guild.id, channel.id, role.id)
+                await self.toggle(ctx.guild.id, channel.id, role.id)
             except OverflowError:
                 await ctx.reply(
                     "VoiceRoleは30個まで設定が可能です。\nなので一部は設定されませんでした。"
@@ -184,60 +194,57 @@ class VoiceRole(commands.Cog, DataManager):
         else:
             await ctx.reply("Ok")
 
-    @tasks.loop(seconds=5)
-    async def worker(self):
-        for key in list(self.queue.keys()):
-            for member, roles in list(self.queue[key].items()):
-                # 被りを削除する。
-                new_roles = []
-                for mode, role in roles:
-                    if (mode, role) not in new_roles:
-                        new_roles.append((mode, role))
-                del roles
-                # 役職を付与または削除する。
-                for mode, role in new_roles:
-                    try:
-                        has_role = member.get_role(role.id)
-                        if mode == "join" and not has_role:
-                            await member.add_roles(role)
-                        elif mode == "leave" and has_role:
-                            await member.remove_roles(role)
-                    except Exception as e:
-                        if self.bot.test:
-                            print("Error on VoiceRole:", e)
-                    finally:
-                        self.queue[key][member].remove((mode, role))
-                else:
-                    del self.queue[key][member]
-                    if not self.queue[key]:
-                        del self.queue[key]
-
-    async def on_member(self, mode, member, after):
-        if member.guild and after.channel:
-            row = await self.read(member.guild.id, after.channel.id)
-            if row:
-                role = member.guild.get_role(row[2])
-                if role:
-                    # API制限対策でキューに追加してWorkerが処理する形にする。
-                    if row[1] not in self.queue:
-                        self.queue[row[1]] = {}
-                    if member not in self.queue[row[1]]:
-                        self.queue[row[1]][member] = []
-                    self.queue[row[1]][member].append((mode, role))
+    async def reconcile(self, member: discord.Member, channel_ids: Set[int]) -> None:
+        "接続または切断があったチャンネルの役職を今いるチャンネルに合わせて一度に付け替えます。"
+        targets = set()
+        for channel_id in channel_ids:
+            for role_id in list(self.roles.get(channel_id, ())):
+                if member.guild.get_role(role_id):
+                    targets.add(role_id)
                 else:
                     # もし役職が見つからないなら削除する。
-                    await self.write(*row)
+                    await self.toggle(member.guild.id, channel_id, role_id)
+        wanted = self.roles.get(member.voice.channel.id, set()) \
+            if member.voice and member.voice.channel else set()
+        now = {role.id for role in member.roles if not role.is_default()}
+        if (new := (now - targets) | (targets & wanted)) != now:
+            await member.edit(
+                roles=[discord.Object(role_id) for role_id in new],
+                reason="Voice Role"
+            )
+
+    @tasks.loop(seconds=5)
+    async def worker(self):
+        # 溜まった接続と切断をまとめて処理する。
+        queue, self.queue = self.queue, {}
+        for guild_id, members in queue.items():
+            if (guild := self.bot.get_guild(guild_id)) is None:
+                continue
+            for member_id, channel_ids in members.items():
+                if (member := guild.get_member(member_id)) is None:
+                    continue
+                try:
+                    await self.reconcile(member, channel_ids)
+                except Exception as e:
+                    if self.bot.test:
+                        print("Error on VoiceRole:", e)
+
+    def on_member(self, member, channel):
+        if member.guild and channel and channel.id in self.roles:
+            # API制限対策でキューに追加してWorkerが処理する形にする。
+            self.queue.setdefault(member.guild.id, {}) \
+                .setdefault(member.id, set()).add(channel.id)
 
     def cog_unload(self):
         self.worker.cancel()
 
     @commands.Cog.listener()
     async def on_voice_join(self, member, before, after):
-        await self.on_member("join", member, after)
+        self.on_member(member, after.channel)
 
     @commands.Cog.listener()
     async def on_voice_leave(self, member, before, after):
-        await self.on_member("leave", member, before)
+        self.on_member(member, before.channel)
 
 
 def setup(bot):
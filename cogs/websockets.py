@@ -1,19 +1,67 @@
 # RT - WebSockets
 
-from typing import Union
+from typing import Callable, Union, Any, Dict, Set, List
 
 from discord.ext import commands
 import discord
 
+from collections import defaultdict
+
 from rtlib import RT, websocket
 
 
 DISCORD = "/img/discord.jpg"
+PER_PAGE = 20
+MAX_PER_PAGE = 100
+DEFAULT_FIELDS = ("name", "id", "icon_url")
 
 
 class WebSockets(commands.Cog):
     def __init__(self, bot: RT):
         self.bot = bot
+        # ユーザーIDから参加しているサーバーのIDを引くための索引です。
+        self.user_guilds: Dict[int, Set[int]] = defaultdict(set)
+        for guild in self.bot.guilds:
+            self.index_guild(guild)
+        # サーバーの情報の各項目を作る関数です。必要な項目だけが作られます。
+        self.guild_fields: Dict[str, Callable[[discord.Guild], Any]] = {
+            "name": lambda guild: guild.name,
+            "id": lambda guild: str(guild.id),
+            "icon_url": lambda guild: getattr(guild.icon, "url", DISCORD),
+            "text_channels": lambda guild: self.convert_channels(guild.text_channels),
+            "voice_channels": lambda guild: self.convert_channels(guild.voice_channels),
+            "channels": lambda guild: self.convert_channels(guild.channels),
+            "roles": lambda guild: [self.convert_role(role) for role in guild.roles],
+            "members": lambda guild: [
+                self.convert_user(member) for member in guild.members
+            ]
+        }
+
+    def index_guild(self, guild: discord.Guild) -> None:
+        "サーバーのメンバーを索引に追加します。"
+        for member in guild.members:
+            self.user_guilds[member.id].add(guild.id)
+
+    def unindex(self, user_id: int, guild_id: int) -> None:
+        "索引からメンバーを削除します。"
+        if (guilds := self.user_guilds.get(user_id)) is not None:
+            guilds.discard(guild_id)
+            if not guilds:
+                del self.user_guilds[user_id]
+
+    def get_user_guilds(self, user_id: int) -> List[discord.Guild]:
+        "ユーザーが参加しているサーバーを取得します。"
+        return [
+            guild for guild_id in sorted(self.user_guilds.get(user_id, ()))
+            if (guild := self.bot.get_guild(guild_id))
+        ]
+
+    @staticmethod
+    def paginate(items: list, data: dict) -> tuple:
+        "渡されたリストを`page`と`per_page`で分割します。`(分割したもの, ページ, 総数)`を返します。"
+        per_page = min(max(int(data.get("per_page", PER_PAGE)), 1), MAX_PER_PAGE)
+        page = max(int(data.get("page", 0)), 0)
+        return items[page * per_page:(page + 1) * per_page], page, len(items)
 
     def convert_channel(
         self, channel: Union[
@@ -46,15 +94,11 @@ class WebSockets(commands.Cog):
             )
         }
 
-    def convert_guild(self, guild: discord.Guild) -> dict:
+    def convert_guild(self, guild: discord.Guild, fields: tuple = ()) -> dict:
         return {
-            "name": guild.name, "id": str(guild.id), "icon_url": getattr(
-                guild.icon, "url", DISCORD
-            ), "text_channels": self.convert_channels(guild.text_channels),
-            "voice_channels": self.convert_channels(guild.voice_channels),
-            "channels": self.convert_channels(guild.channels),
-            "roles": [self.convert_role(role) for role in guild.roles],
-            "members": [self.convert_user(member) for member in guild.members]
+            field: self.guild_fields[field](guild)
+            for field in (fields or self.guild_fields)
+            if field in self.guild_fields
         }
 
     @websocket.websocket("/api/guild", auto_connect=True, reconnect=True)
@@ -66,12 +110,54 @@ class WebSockets(commands.Cog):
         await self.guild(ws, None)
 
     @guild.event("fetch_guilds")
-    async def fetch_guilds(self, ws: websocket.WebSocket, user_id: str):
-        user_id = int(user_id)
-        return [
-            self.convert_guild(guild) for guild in self.bot.guilds
-            if any(member.id == user_id for member in guild.members)
-        ]
+    async def fetch_guilds(self, ws: websocket.WebSocket, data: Union[str, dict]):
+        # `data`がユーザーIDの文字列の場合は全ての項目を返す。
+        # 辞書の場合は`user_id`と`fields`、`page`、`per_page`を指定できる。
+        if isinstance(data, str):
+            return [
+                self.convert_guild(guild)
+                for guild in self.get_user_guilds(int(data))
+            ]
+        guilds, page, total = self.paginate(
+            self.get_user_guilds(int(data["user_id"])), data
+        )
+        fields = tuple(data.get("fields", DEFAULT_FIELDS))
+        return {
+            "guilds": [self.convert_guild(guild, fields) for guild in guilds],
+            "page": page, "total": total
+        }
+
+    @guild.event("fetch_members")
+    async def fetch_members(self, ws: websocket.WebSocket, data: dict):
+        # サーバーのメンバーを`page`と`per_page`で分割して返す。
+        if (guild := self.bot.get_guild(int(data["guild_id"]))) is None:
+            return {"members": [], "page": 0, "total": 0}
+        members, page, total = self.paginate(guild.members, data)
+        return {
+            "members": [self.convert_user(member) for member in members],
+            "page": page, "total": total
+        }
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        self.user_guilds[member.id].add(member.guild.id)
+
+    @commands.Cog.listener()
+    async def on_member_update(self, _, after: discord.Member):
+        self.user_guilds[after.id].add(after.guild.id)
+
+    @commands.Cog.listener()
+    async def on_member_remove(self, member: discord.Member):
+        self.unindex(member.id, member.guild.id)
+
+    @commands.Cog.listener()
+    async def on_guild_join(self, guild: discord.Guild):
+        self.index_guild(guild)
+
+    @commands.Cog.listener()
+    async def on_guild_remove(self, guild: discord.Guild):
+        for member in guild.members:
+            self.unindex(member.id, guild.id)
 
 
 def setup(bot):
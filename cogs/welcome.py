@@ -1,14 +1,19 @@
 # RT - Welocme Message
 
-from typing import Literal
+from typing import Literal, List
 
 from discord.ext import commands
 import discord
 
 from rtlib import DatabaseManager, RT, setting
+from rtlib.ext.join_pipeline import JoinContext, join_stage
 from asyncio import sleep
 
 
+# 一つのメッセージに入れるメンションの最大の数です。
+MAX_MENTIONS = 30
+
+
 class DataManager(DatabaseManager):
 
     DB = "Welcome"
@@ -150,9 +155,11 @@ class Welcome(commands.Cog, DataManager):
                         "en": "Welcome has not set yet."}
                     )
                 else:
+                    self.bot.dispatch("join_config_update", ctx.guild.id)
                     await ctx.reply("Ok")
             else:
                 await self.write(ctx.guild.id, ctx.channel.id, content, mode)
+                self.bot.dispatch("join_config_update", ctx.guild.id)
                 await ctx.reply("Ok")
         else:
             await ctx.reply(
@@ -160,21 +167,33 @@ class Welcome(commands.Cog, DataManager):
                  "en": "The only modes available are `join` for joining and `remove` for leaving."}
             )
 
+    def format(self, content: str, members: List[discord.Member]) -> str:
+        "ウェルカムメッセージの内容を作ります。複数人の場合はまとめて一つのメッセージにします。"
+        mentions = ", ".join(member.mention for member in members[:MAX_MENTIONS])
+        names = ", ".join(member.name for member in members[:MAX_MENTIONS])
+        if len(members) > MAX_MENTIONS:
+            mentions += f" +{len(members) - MAX_MENTIONS}"
+            names += f" +{len(members) - MAX_MENTIONS}"
+        return (content
+            .replace("$ment$", mentions)
+            .replace("$name$", names)
+            .replace("$count$", str(len(members[0].guild.members))))
+
     async def on_member_join_remove(self, mode: str, member: discord.Member):
         if self.bot.is_ready():
             if (row := await self.read(member.guild.id, mode)):
-                row[2] = (row[2]
-                    .replace("$ment$", member.mention)
-                    .replace("$name$", member.name)
-                    .replace("$count$", str(len(member.guild.members))))
                 channel = member.guild.get_channel(row[1])
                 if channel:
                     await sleep(3)
-                    await channel.send(row[2])
+                    await channel.send(self.format(row[2], [member]))
 
-    @commands.Cog.listener()
-    async def on_member_join(self, member):
-        await self.on_member_join_remove("join", member)
+    async def read_join(self, guild_id: int) -> tuple:
+        "参加時のウェルカムメッセージの設定を読み込みます。"
+        return await self.read(guild_id, "join")
+
+    @join_stage(40, loader="read_join")
+    async def on_join(self, context: JoinContext, row: tuple):
+        context.welcome(row[1], lambda members: self.format(row[2], members))
 
     @commands.Cog.listener()
     async def on_member_remove(self, member):
@@ -7,16 +7,17 @@ print("RT Discord Bot (C) 2020 RT-Team\nNow loading...")
 
 import discord
 
-from aiohttp import ClientSession
-from ujson import load, dumps
+from ujson import load
 from uvloop import install
+from time import perf_counter
+from asyncio import sleep
 from os import listdir
 from sys import argv
 
 from logging import handlers
 import logging
 
-from rtlib import RT, mysql, setup, websocket
+from rtlib import RT, HTTPManager, MediaRelay, mysql, setup, websocket
 from data import data, is_admin, Colors
 
 
@@ -50,6 +51,16 @@ bot.is_admin = is_admin
 bot.colors = data["colors"]
 bot.Colors = Colors
 bot._load = False
+# 読み込みに時間がかかり起動直後には使われることが少ないエクステンションです。
+# これらとこれらに依存するエクステンションは`full_ready`の後に読み込む。
+DEFERRED_EXTENSIONS = ("music", "tts", "captcha")
+# エクステンションが読み込まれている必要のある他のエクステンションです。
+# コグを取得したりイベントを受け取ったりするものを書きます。依存されているものが先に読み込まれます。
+DEPENDENCIES = {
+    "person": ("history",), "server_tool": ("history",),
+    "url_checker": ("person",), "voice_role": ("tts",),
+    "voice_channel": ("tts",), "delay_lottery": ("server_tool",)
+}
 
 
 # 起動中だと教えられるようにするためのコグを読み込む。
@@ -63,31 +74,117 @@ bot.is_owner = _is_owner
 del is_admin, _is_owner
 
 
+def get_deferred(names: list) -> set:
+    "後回しにするエクステンションとそれに依存するエクステンションを取得します。"
+    deferred, changed = set(DEFERRED_EXTENSIONS), True
+    while changed:
+        changed = False
+        for name in names:
+            if name not in deferred and deferred.intersection(DEPENDENCIES.get(name, ())):
+                deferred.add(name)
+                changed = True
+    return deferred
+
+
+def sort_extensions(names: list) -> list:
+    "エクステンションを依存関係を守る順番に並べます。後回しにするものとそれに依存するものは最後になります。"
+    deferred = get_deferred(names)
+    ordered, visiting = [], set()
+
+    def visit(name: str) -> None:
+        if name in ordered or name not in names:
+            return
+        if name in visiting:
+            raise RuntimeError(f"Circular extension dependency: {name}")
+        visiting.add(name)
+        for dependency in DEPENDENCIES.get(name, ()):
+            visit(dependency)
+        visiting.discard(name)
+        ordered.append(name)
+
+    for name in [name for name in names if name not in deferred] \
+            + [name for name in names if name in deferred]:
+        visit(name)
+    return ordered
+
+
+async def load_extensions(names: list) -> dict:
+    # エクステンションを読み込んで読み込みにかかった時間を記録する。
+    # 一つ読み込むごとにイベントループに処理を譲り、読み込み済みのコマンドは使えるようにする。
+    times = {}
+    for name in names:
+        start = perf_counter()
+        try:
+            bot.load_extension(f"cogs.{name}")
+        except discord.ext.commands.NoEntryPointError as e:
+            if "setup" not in str(e):
+                raise e
+        else:
+            times[name] = perf_counter() - start
+            bot.print("[Extension]", "Loaded", name, f"{times[name]:.3f}s")
+        await sleep(0)
+    return times
+
+
+async def load_deferred_extensions(names: list) -> None:
+    # 後回しにしたエクステンションを`full_ready`の後に読み込む。
+    # ヘルプの作成と`command_add`は`full_ready`で行われるため、追加されたコマンドはここで行う。
+    try:
+        before = set(bot.all_commands)
+        bot.extension_load_times.update(await load_extensions(names))
+        dochelp = bot.cogs["DocHelp"]
+        for command in bot.commands:
+            if command.name not in before:
+                await dochelp.on_command_add(command)
+                bot.dispatch("command_add", command)
+                await dochelp.on_command_add_kari(command)
+    except Exception:
+        await bot.on_error("load_deferred_extensions")
+    else:
+        bot.print("[Extension]", "Loaded deferred", ", ".join(names))
+
+
 @bot.listen()
 async def on_ready():
     bot.print("Connected to discord")
-    bot.session = ClientSession(loop=bot.loop, json_serialize=dumps)
-    bot.unload_extension("cogs._first")
+    if bot._load:
+        return
+    # 外部へのリクエストは一つのセッションを使い回す。
+    bot.http_manager = HTTPManager(loop=bot.loop)
+    bot.session = bot.http_manager.session
+    bot.media = MediaRelay(bot.session)
 
     # 拡張を読み込む。
+    start = perf_counter()
     setup(bot)
     bot.load_extension("jishaku")
     bot.load_extension("cogs._oldrole")
-    for name in listdir("cogs"):
-        if not name.startswith("_"):
-            try:
-                bot.load_extension(
-                    f"cogs.{name[:-3] if name.endswith('.py') else name}"
-                )
-            except discord.ext.commands.NoEntryPointError as e:
-                if "setup" not in str(e):
-                    raise e
-            else:
-                bot.print("[Extension]", "Loaded", name)
-    bot.print("Completed to boot RT")
+    names = [
+        name[:-3] if name.endswith(".py") else name
+        for name in listdir("cogs") if not name.startswith(("_", "."))
+    ]
+    deferred = get_deferred(names)
+    names = sort_extensions(names)
+    times = await load_extensions([name for name in names if name not in deferred])
+    bot.extension_load_times = times
+    bot.unload_extension("cogs._first")
+    bot.print(
+        "[Extension]", "Slowest:", ", ".join(
+            f"{name} {time:.3f}s" for name, time in sorted(
+                times.items(), key=lambda item: item[1], reverse=True
+            )[:5]
+        )
+    )
+    bot.print("Completed to boot RT", f"{perf_counter() - start:.3f}s")
 
     bot.dispatch("full_ready")
     bot._load = True
+    # 後回しにするエクステンションは`full_ready`の後に読み込む。
+    # スラッシュコマンドの同期はこれを待ってから全てのコマンドで行われる。
+    bot.deferred_loading = bot.loop.create_task(
+        load_deferred_extensions([name for name in names if name in deferred]),
+        name="rt.load_deferred_extensions"
+    )
 
 
 # loggingの準備をする。
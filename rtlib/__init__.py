@@ -8,6 +8,8 @@ import discord
 from pymysql.err import OperationalError
 
 from . import mysql_manager as mysql
+from .http_manager import HTTPManager
+from .media import MediaRelay
 from .ext import componesy
 from . import websocket
 from .typed import RT
@@ -51,7 +53,10 @@ discord.ext.easy = componesy
 
 def setup(bot, only: Union[Tuple[str, ...], List[str]] = []):
     "rtlibにあるエクステンションを全てまたは指定されたものだけ読み込みます。"
-    for name in ("embeds", "on_full_reaction", "dochelp", "debug", "on_cog_add"):
+    for name in (
+        "embeds", "on_full_reaction", "dochelp", "monitor", "debug", "on_cog_add",
+        "message_router", "join_pipeline"
+    ):
         if name in only or only == []:
             try:
                 bot.load_extension("rtlib.ext." + name)
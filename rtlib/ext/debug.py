@@ -3,9 +3,10 @@
 from discord.ext import commands
 import discord
 
-from jishaku.functools import executor_function
 from aiofiles import open as async_open, os
+from ujson import dumps
 from functools import wraps
+from io import BytesIO
 import psutil
 
 
@@ -103,7 +104,6 @@ class Debug(commands.Cog):
             self.bot.dispatch("help_reload")
         await ctx.reply("Ok")
 
-    @executor_function
     def make_monitor_embed(self):
         embed = discord.Embed(
             title="RT-Run info",
@@ -116,21 +116,85 @@ class Debug(commands.Cog):
         )
         embed.add_field(
             name="CPU",
-            value=f"{psutil.cpu_percent(interval=1)}%"
+            value=f"{psutil.cpu_percent(interval=None)}%"
         )
         embed.add_field(
             name="Disk",
             value=f"{psutil.disk_usage('/').percent}%"
         )
+
+        if (monitor := self.bot.cogs.get("Monitor")) is None:
+            return embed
+        if (gauges := monitor.gauges()):
+            embed.add_field(
+                name="Process", value=(
+                    f"RSS: {gauges['rss'] / 1048576:.1f}MB\n"
+                    f"CPU: {gauges['cpu']}%\nTasks: {gauges['tasks']}"
+                )
+            )
+            embed.add_field(
+                name="Loop lag", value=(
+                    f"Now: {gauges['lag'] * 1000:.1f}ms\n"
+                    f"Max: {gauges['max_lag'] * 1000:.1f}ms"
+                )
+            )
+        if (pool := monitor.pool()):
+            embed.add_field(
+                name="MySQL pool",
+                value=f"{pool['used']} used / {pool['size']} open / {pool['max']} max"
+            )
+        embed.add_field(
+            name="Voice", value="\n".join(
+                f"{key}: {value}" for key, value in monitor.voice().items()
+            )
+        )
+        for name, histograms in (
+            ("Listeners", monitor.listeners), ("Commands", monitor.commands)
+        ):
+            embed.add_field(
+                name=f"{name} (busy)", value="\n".join(
+                    f"`{key}` {histogram.busy * 1000:.0f}ms / {histogram.count}"
+                    for key, histogram in monitor.top(histograms)
+                ) or "...", inline=False
+            )
         return embed
 
     @debug.command()
     @require_admin
-    async def monitor(self, ctx):
-        await ctx.trigger_typing()
-        await ctx.reply(
-            embed=await self.make_monitor_embed()
+    async def monitor(self, ctx, mode: str = "embed"):
+        if mode in ("json", "prometheus") and "Monitor" in self.bot.cogs:
+            monitor = self.bot.cogs["Monitor"]
+            if mode == "json":
+                data = dumps(monitor.export_json(), indent=2)
+            else:
+                data = monitor.export_prometheus()
+            await ctx.reply(file=discord.File(
+                BytesIO(data.encode()), f"monitor.{'json' if mode == 'json' else 'txt'}"
+            ))
+        else:
+            await ctx.reply(embed=self.make_monitor_embed())
+
+    @debug.command()
+    @require_admin
+    async def http(self, ctx):
+        stats = self.bot.http_manager.stats()
+        embed = discord.Embed(
+            title="RT-HTTP info",
+            description=(
+                f"Requests: {stats['requests']}\n"
+                f"Hit rate: {stats['hit_rate'] * 100:.1f}%\n"
+                f"Cached: {stats['cached']}, In flight: {stats['in_flight']}"
+            ), color=0x0066ff
         )
+        for host, latency in list(stats["hosts"].items())[:25]:
+            embed.add_field(
+                name=host, value=(
+                    f"{latency['count']} requests\n"
+                    f"avg {latency['average'] * 1000:.0f}ms / "
+                    f"max {latency['max'] * 1000:.0f}ms"
+                )
+            )
+        await ctx.reply(embed=embed)
 
 
 def setup(bot):
@@ -53,7 +53,8 @@ def _is_target(function):
 class Embeds:
     """矢印ボタンでページ切り替えが可能なEmbedのリストであるEmbedsを作るためのクラスです。  
     Embedの編集も`message.edit`からではなくこのクラスから行うことができます。  
-    これは`send/reply`に`embeds`の引数で渡すことで作ったEmbedsを送信することができます。
+    これは`send/reply`に`embeds`の引数で渡すことで作ったEmbedsを送信することができます。  
+    `paginate=False`も一緒に渡した場合はページ切り替えをせずにdiscord.pyの通常の複数のEmbedとして送信されます。
 
     Notes
     -----
@@ -347,6 +348,9 @@ class EmbedsCog(commands.Cog):
 
     async def _on_send(self, channel, *args, **kwargs):
         # sendが実行された際に呼び出される。
+        if not kwargs.pop("paginate", True):
+            # ページ切り替えをせずに複数のEmbedをそのまま送信する。
+            return args, kwargs
         embeds = kwargs.pop("embeds", None)
         if embeds is not None:
             # もしリスト形式でEmbedが渡されたならそれでEmbedsを作る。
@@ -0,0 +1,329 @@
+"""メンバーがサーバーに参加した際の処理を決まった順番で実行するためのエクステンションです。
+`bot.load_extension("rtlib.ext.join_pipeline")`で有効化することができます。
+また`rtlib.setup(bot)`でも有効化することができます。
+コグのメソッドに`join_stage`デコレータを付けると`on_member_join`の代わりにそのメソッドが`order`の小さい順に呼ばれます。
+`loader`にサーバーの設定を読み込むコグのメソッドの名前を渡すと、
+全てのステージの設定がサーバーごとに一度だけ読み込まれてキャッシュされます。
+設定が空の場合はそのステージは実行されません。
+設定を変更した際は`bot.dispatch("join_config_update", guild_id)`を実行してキャッシュを消してください。
+短い間に大量のメンバーが参加した場合は一括処理モードになり、
+ウェルカムメッセージは一つにまとめられ、役職の付与はレート制限を守りながら順番に行われます。
+
+# Examples
+```python
+@join_stage(30, loader="read")
+async def on_join(self, context: JoinContext, row: tuple):
+    context.add_roles(row[1])
+```"""
+
+from typing import (
+    TYPE_CHECKING, Callable, Coroutine, Optional, Any, Dict, List, Tuple
+)
+
+from discord.ext import commands
+import discord
+
+from asyncio import Lock, Task, TimerHandle, shield, sleep
+from collections import deque
+from time import time
+
+from rtutil.jobs import Job, RateLimited
+
+if TYPE_CHECKING:
+    from .. import RT
+
+
+# 設定のキャッシュを使う秒数です。
+CONFIG_TTL = 300
+# `BURST_WINDOW`秒以内に`BURST_COUNT`人が参加したら一括処理モードにします。
+BURST_COUNT = 10
+BURST_WINDOW = 10.0
+# 一括処理モードで参加したメンバーを溜めておく秒数です。
+BATCH_DELAY = 10.0
+# 一括処理モードでない時にウェルカムメッセージを送るまで待つ秒数です。
+WELCOME_DELAY = 3
+
+
+Formatter = Callable[[List[discord.Member]], str]
+
+
+class JoinStage:
+    "`join_stage`で設定されたステージです。"
+
+    __slots__ = ("name", "function", "order", "loader")
+
+    def __init__(
+        self, function: Callable[..., Coroutine], order: int,
+        loader: Optional[str]
+    ):
+        self.name, self.function = function.__qualname__, function
+        self.order, self.loader = order, loader
+
+
+class JoinContext:
+    """ステージに渡される参加したメンバーの処理の情報です。
+    役職の付与とウェルカムメッセージの送信は全てのステージが終わった後にまとめて行われます。"""
+
+    __slots__ = ("member", "burst", "roles", "welcomes", "stopped")
+
+    def __init__(self, member: discord.Member, burst: bool):
+        self.member, self.burst = member, burst
+        self.roles: List[int] = []
+        self.welcomes: List[Tuple[int, Formatter]] = []
+        self.stopped = False
+
+    def add_roles(self, *role_ids: int) -> None:
+        "メンバーに付与する役職を追加します。"
+        self.roles.extend(role_ids)
+
+    def welcome(self, channel_id: int, formatter: Formatter) -> None:
+        """ウェルカムメッセージを送信します。
+        `formatter`には参加したメンバーのリストが渡されるので、メッセージの内容を返してください。
+        一括処理モードの場合は複数のメンバーが渡されます。"""
+        self.welcomes.append((channel_id, formatter))
+
+    def stop(self) -> None:
+        "これ以降のステージを実行しないようにします。"
+        self.stopped = True
+
+
+class JoinBatch:
+    "一括処理モードで溜められている参加したメンバーの処理です。"
+
+    __slots__ = ("guild", "roles", "welcomes", "timer")
+
+    def __init__(self, guild: discord.Guild):
+        self.guild = guild
+        self.roles: Dict[int, List[int]] = {}
+        self.welcomes: Dict[int, Tuple[Formatter, List[discord.Member]]] = {}
+        self.timer: Optional[TimerHandle] = None
+
+    def add(self, context: JoinContext) -> None:
+        "参加したメンバーの処理を追加します。"
+        if context.roles:
+            self.roles[context.member.id] = context.roles
+        for channel_id, formatter in context.welcomes:
+            self.welcomes.setdefault(
+                channel_id, (formatter, [])
+            )[1].append(context.member)
+
+
+def join_stage(order: int, loader: Optional[str] = None) -> Callable:
+    """コグのメソッドをメンバーの参加時に実行するステージにするデコレータです。
+    メソッドには`JoinContext`とそのステージのサーバーの設定が渡されます。
+
+    Parameters
+    ----------
+    order : int
+        実行する順番です。小さいものから実行されます。
+    loader : str, optional
+        サーバーのIDを受け取りそのサーバーの設定を返すコグのコルーチン関数の名前です。
+        指定しない場合は設定に`None`が渡されます。"""
+    def decorator(function):
+        function.__rt_join_stage__ = JoinStage(function, order, loader)
+        return function
+    return decorator
+
+
+class JoinPipeline(commands.Cog):
+    def __init__(self, bot: "RT"):
+        self.bot = bot
+        self.stages: List[Tuple[commands.Cog, JoinStage]] = []
+        self.configs: Dict[int, Tuple[float, Dict[str, Any]]] = {}
+        self.loading: Dict[int, Task] = {}
+        self.joins: Dict[int, deque] = {}
+        self.batches: Dict[int, JoinBatch] = {}
+        self.locks: Dict[int, Lock] = {}
+        for cog in self.bot.cogs.values():
+            self.add_stages(cog)
+
+    def add_stages(self, cog: commands.Cog) -> None:
+        "コグにある`join_stage`が付けられたメソッドを登録します。"
+        for name in dir(cog.__class__):
+            if (stage := getattr(
+                getattr(cog.__class__, name), "__rt_join_stage__", None
+            )) is not None:
+                self.stages.append((cog, stage))
+                self.configs.clear()
+        self.stages.sort(key=lambda item: item[1].order)
+
+    def remove_stages(self, cog: commands.Cog) -> None:
+        "コグのステージの登録を解除します。"
+        self.stages = [item for item in self.stages if item[0] is not cog]
+        self.configs.clear()
+
+    @commands.Cog.listener()
+    async def on_cog_add(self, cog: commands.Cog):
+        self.add_stages(cog)
+
+    @commands.Cog.listener()
+    async def on_cog_remove(self, cog: commands.Cog):
+        self.remove_stages(cog)
+
+    @commands.Cog.listener()
+    async def on_join_config_update(self, guild_id: int):
+        self.configs.pop(guild_id, None)
+
+    async def _load_config(self, guild_id: int) -> Dict[str, Any]:
+        # 全てのステージの設定を読み込みます。
+        config, failed = {}, False
+        try:
+            for cog, stage in self.stages:
+                if stage.loader is not None:
+                    try:
+                        config[stage.name] = await getattr(cog, stage.loader)(guild_id)
+                    except Exception:
+                        config[stage.name], failed = None, True
+                        await self.bot.on_error(stage.loader, guild_id)
+            if not failed:
+                self.configs[guild_id] = (time() + CONFIG_TTL, config)
+            return config
+        finally:
+            del self.loading[guild_id]
+
+    async def get_config(self, guild_id: int) -> Dict[str, Any]:
+        """サーバーの設定を取得します。
+        同時に取得しようとした場合は一度だけ読み込まれます。"""
+        if (cache := self.configs.get(guild_id)) is not None and cache[0] > time():
+            return cache[1]
+        if guild_id not in self.loading:
+            self.loading[guild_id] = self.bot.loop.create_task(
+                self._load_config(guild_id)
+            )
+        return await shield(self.loading[guild_id])
+
+    def is_burst(self, guild_id: int) -> bool:
+        "参加を記録して一括処理モードにするべきかどうかを返します。"
+        now = time()
+        if (joins := self.joins.get(guild_id)) is None:
+            joins = self.joins[guild_id] = deque(maxlen=BURST_COUNT)
+        joins.append(now)
+        return guild_id in self.batches or (
+            len(joins) == BURST_COUNT and now - joins[0] <= BURST_WINDOW
+        )
+
+    async def _add_roles(self, context: JoinContext) -> None:
+        # 役職を付与します。
+        roles = [discord.Object(role_id) for role_id in dict.fromkeys(context.roles)]
+        try:
+            await context.member.add_roles(*roles)
+        except discord.NotFound:
+            # 処理中にメンバーが抜けた場合など。
+            pass
+        except discord.HTTPException:
+            # 付与できない役職があった場合は付与できるものだけ付与する。
+            for role in roles:
+                try:
+                    await context.member.add_roles(role)
+                except discord.NotFound:
+                    break
+                except discord.HTTPException:
+                    pass
+
+    async def apply(self, context: JoinContext) -> None:
+        """一括処理モードでない時に役職の付与とウェルカムメッセージの送信を行います。
+        どれかが失敗しても残りの処理は行われます。"""
+        if context.roles:
+            try:
+                await self._add_roles(context)
+            except Exception:
+                await self.bot.on_error("join_pipeline.add_roles", context.member)
+        if context.welcomes:
+            await sleep(WELCOME_DELAY)
+            for channel_id, formatter in context.welcomes:
+                if (channel := context.member.guild.get_channel(channel_id)):
+                    try:
+                        await channel.send(formatter([context.member]))
+                    except discord.HTTPException:
+                        pass
+                    except Exception:
+                        await self.bot.on_error(
+                            "join_pipeline.welcome", context.member
+                        )
+
+    def add_batch(self, context: JoinContext) -> None:
+        "一括処理モードで参加したメンバーの処理を溜めておきます。"
+        guild = context.member.guild
+        if (batch := self.batches.get(guild.id)) is None:
+            batch = self.batches[guild.id] = JoinBatch(guild)
+            batch.timer = self.bot.loop.call_later(
+                BATCH_DELAY, self.flush, guild.id
+            )
+        batch.add(context)
+
+    def flush(self, guild_id: int) -> None:
+        "溜まっている処理を実行します。"
+        if (batch := self.batches.pop(guild_id, None)) is not None:
+            batch.timer.cancel()
+            self.bot.loop.create_task(
+                self._run_batch(batch), name=f"rtlib.join_pipeline: {guild_id}"
+            )
+
+    def make_action(self, batch: JoinBatch) -> Callable[[int], Coroutine]:
+        "メンバーごとに役職を付与する処理を作ります。"
+        async def action(member_id: int) -> None:
+            if (member := batch.guild.get_member(member_id)) is None:
+                return
+            try:
+                await member.add_roles(*(
+                    discord.Object(role_id)
+                    for role_id in dict.fromkeys(batch.roles[member_id])
+                ))
+            except discord.HTTPException as e:
+                if e.status == 429:
+                    raise RateLimited(float(
+                        e.response.headers.get("Retry-After", 1)
+                    ))
+                raise
+        return action
+
+    async def _run_batch(self, batch: JoinBatch) -> None:
+        # まとめたウェルカムメッセージを送信してから役職を付与します。
+        for channel_id, (formatter, members) in batch.welcomes.items():
+            if (channel := batch.guild.get_channel(channel_id)):
+                try:
+                    await channel.send(formatter(members))
+                except discord.HTTPException:
+                    pass
+                except Exception:
+                    await self.bot.on_error("join_pipeline.welcome", batch.guild)
+        if batch.roles:
+            # 同じサーバーの役職の付与は同時に行わないようにする。
+            async with self.locks.setdefault(batch.guild.id, Lock()):
+                await Job(
+                    sorted(batch.roles), self.make_action(batch)
+                ).run()
+
+    @commands.Cog.listener()
+    async def on_member_join(self, member: discord.Member):
+        if not self.bot.is_ready() or not self.stages:
+            return
+        context = JoinContext(member, self.is_burst(member.guild.id))
+        config = await self.get_config(member.guild.id)
+        for cog, stage in self.stages:
+            if context.stopped:
+                break
+            if stage.loader is not None and not config.get(stage.name):
+                continue
+            try:
+                await stage.function(cog, context, config.get(stage.name))
+            except discord.HTTPException:
+                # メンバーが抜けた場合や権限がない場合などはそのステージだけ飛ばす。
+                pass
+            except Exception:
+                # 想定していないエラーは記録して次のステージに進む。
+                await self.bot.on_error(stage.name, member)
+        if context.stopped:
+            return
+        if context.burst:
+            self.add_batch(context)
+        else:
+            await self.apply(context)
+
+    def cog_unload(self):
+        for guild_id in list(self.batches):
+            self.flush(guild_id)
+
+
+def setup(bot):
+    bot.add_cog(JoinPipeline(bot))
@@ -0,0 +1,192 @@
+"""メッセージを条件に合うリスナーだけに渡すためのエクステンションです。
+`bot.load_extension("rtlib.ext.message_router")`で有効化することができます。
+また`rtlib.setup(bot)`でも有効化することができます。
+コグのメソッドに`route`デコレータを付けると`on_message`の代わりにそのメソッドが呼ばれます。
+サーバーのメッセージかどうかやBotかどうかなどのよく使われる条件はメッセージごとに一度だけ確認され、
+条件に合わないリスナーのコルーチンは作られません。
+それぞれのリスナーの処理時間は`MessageRouter.timings`に記録されます。
+
+# Examples
+```python
+@route(topic="rt>autopublic")
+async def on_message(self, message):
+    ...
+
+@route(guilds="cache", prefixed=True)
+async def on_message(self, message):
+    ...
+```"""
+
+from typing import (
+    TYPE_CHECKING, Callable, Coroutine, Optional, Pattern, Union, Dict, List,
+    Tuple
+)
+
+from discord.ext import commands
+import discord
+
+from collections import defaultdict
+
+from rtutil.timing import Histogram, measure
+
+if TYPE_CHECKING:
+    from .. import RT
+
+
+class Route:
+    "`route`で設定された条件です。"
+
+    __slots__ = (
+        "name", "function", "guild_only", "bots", "prefixed",
+        "topic", "prefix", "regex", "guilds", "channels"
+    )
+
+    def __init__(
+        self, function: Callable[..., Coroutine], guild_only: bool,
+        bots: bool, prefixed: bool, topic: Optional[Tuple[str, ...]],
+        prefix: Optional[Tuple[str, ...]], regex: Optional[Pattern],
+        guilds: Optional[str], channels: Optional[str]
+    ):
+        self.name, self.function = function.__qualname__, function
+        self.guild_only, self.bots, self.prefixed = guild_only, bots, prefixed
+        self.topic, self.prefix, self.regex = topic, prefix, regex
+        self.guilds, self.channels = guilds, channels
+
+    def check(
+        self, cog: commands.Cog, message: discord.Message, state: "MessageState"
+    ) -> bool:
+        "メッセージが条件に合うかどうかを確認します。"
+        if self.guild_only and message.guild is None:
+            return False
+        if not self.bots and message.author.bot:
+            return False
+        if not self.prefixed and state.is_command:
+            return False
+        if self.guilds is not None and (
+            message.guild is None
+            or message.guild.id not in getattr(cog, self.guilds)
+        ):
+            return False
+        if self.channels is not None \
+                and message.channel.id not in getattr(cog, self.channels):
+            return False
+        if self.topic is not None and not any(
+            line.startswith(self.topic) for line in state.topic_lines
+        ):
+            return False
+        if self.prefix is not None and not message.content.startswith(self.prefix):
+            return False
+        if self.regex is not None and self.regex.search(message.content) is None:
+            return False
+        return True
+
+
+class MessageState:
+    "全てのリスナーで使うメッセージの情報をまとめて一度だけ計算するためのクラスです。"
+
+    __slots__ = ("is_command", "topic_lines")
+
+    def __init__(self, bot: "RT", message: discord.Message):
+        prefixes = bot.command_prefix
+        self.is_command = isinstance(prefixes, (list, tuple, str)) \
+            and message.content.startswith(
+                prefixes if isinstance(prefixes, str) else tuple(prefixes)
+            )
+        self.topic_lines = (
+            getattr(message.channel, "topic", None) or ""
+        ).splitlines()
+
+
+def route(
+    guild_only: bool = True, bots: bool = False, prefixed: bool = False,
+    topic: Optional[Union[str, Tuple[str, ...]]] = None,
+    prefix: Optional[Union[str, Tuple[str, ...]]] = None,
+    regex: Optional[Pattern] = None, guilds: Optional[str] = None,
+    channels: Optional[str] = None
+) -> Callable:
+    """コグのメソッドをメッセージを受け取るリスナーにするデコレータです。
+
+    Parameters
+    ----------
+    guild_only : bool, default True
+        サーバーのメッセージのみを受け取るかどうかです。
+    bots : bool, default False
+        Botのメッセージも受け取るかどうかです。
+    prefixed : bool, default False
+        コマンドのプリフィックスで始まるメッセージも受け取るかどうかです。
+    topic : Union[str, Tuple[str, ...]], optional
+        チャンネルのトピックにこれで始まる行がある場合のみ受け取ります。
+    prefix : Union[str, Tuple[str, ...]], optional
+        メッセージの内容がこれで始まる場合のみ受け取ります。
+    regex : Pattern, optional
+        メッセージの内容がこの正規表現に一致する場合のみ受け取ります。
+    guilds : str, optional
+        サーバーのIDが入っているコグの属性の名前です。
+        その属性にサーバーのIDがある場合のみ受け取ります。
+    channels : str, optional
+        チャンネルのIDが入っているコグの属性の名前です。
+        その属性にチャンネルのIDがある場合のみ受け取ります。"""
+    def decorator(function):
+        function.__rt_route__ = Route(
+            function, guild_only, bots, prefixed,
+            (topic,) if isinstance(topic, str) else topic,
+            (prefix,) if isinstance(prefix, str) else prefix,
+            regex, guilds, channels
+        )
+        return function
+    return decorator
+
+
+class MessageRouter(commands.Cog):
+    def __init__(self, bot: "RT"):
+        self.bot = bot
+        self.routes: List[Tuple[commands.Cog, Route]] = []
+        self.timings: Dict[str, Histogram] = defaultdict(Histogram)
+        for cog in self.bot.cogs.values():
+            self.add_routes(cog)
+
+    def add_routes(self, cog: commands.Cog) -> None:
+        "コグにある`route`が付けられたメソッドを登録します。"
+        for name in dir(cog.__class__):
+            if (route := getattr(
+                getattr(cog.__class__, name), "__rt_route__", None
+            )) is not None:
+                self.routes.append((cog, route))
+
+    def remove_routes(self, cog: commands.Cog) -> None:
+        "コグのリスナーの登録を解除します。"
+        self.routes = [item for item in self.routes if item[0] is not cog]
+
+    @commands.Cog.listener()
+    async def on_cog_add(self, cog: commands.Cog):
+        self.add_routes(cog)
+
+    @commands.Cog.listener()
+    async def on_cog_remove(self, cog: commands.Cog):
+        self.remove_routes(cog)
+
+    async def _run(
+        self, cog: commands.Cog, route: Route, message: discord.Message
+    ) -> None:
+        # リスナーを実行して処理時間を記録します。
+        try:
+            await measure(
+                route.function(cog, message),
+                self.timings[route.name].observe
+            )
+        except Exception:
+            await self.bot.on_error(route.name, message)
+
+    @commands.Cog.listener()
+    async def on_message(self, message: discord.Message):
+        state = MessageState(self.bot, message)
+        for cog, route in self.routes:
+            if route.check(cog, message, state):
+                self.bot.loop.create_task(
+                    self._run(cog, route, message),
+                    name=f"rtlib.route: {route.name}"
+                )
+
+
+def setup(bot):
+    bot.add_cog(MessageRouter(bot))
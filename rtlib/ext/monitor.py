@@ -0,0 +1,184 @@
+"""Botの動作状況を計測するためのエクステンションです。
+`bot.load_extension("rtlib.ext.monitor")`で有効化することができます。
+また`rtlib.setup(bot)`でも有効化することができます。
+イベントループの遅延やタスク数、メモリ使用量を定期的に記録し、
+イベントのリスナーとコマンドの処理時間をヒストグラムとして集計します。
+集計したデータは`Monitor.export_json`や`Monitor.export_prometheus`で出力できます。
+
+# Examples
+```python
+monitor = bot.cogs["Monitor"]
+print(monitor.export_prometheus())
+```"""
+
+from typing import Optional, Any, Dict, List
+
+from discord.ext import commands, tasks
+
+from asyncio import all_tasks
+from collections import defaultdict, deque
+from functools import wraps
+from copy import copy
+import psutil
+
+from rtutil.timing import BUCKETS, Histogram, measure
+
+
+def escape_label(value: Any) -> str:
+    "Prometheusのラベルの値に使えるようにエスケープします。"
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+class Monitor(commands.Cog):
+
+    INTERVAL = 5.0
+    SAMPLES = 120
+
+    def __init__(self, bot):
+        self.bot = bot
+        self.process = psutil.Process()
+        self.listeners: Dict[str, Histogram] = defaultdict(Histogram)
+        self.commands: Dict[str, Histogram] = defaultdict(Histogram)
+        self.samples: deque = deque(maxlen=self.SAMPLES)
+        self._before: Optional[float] = None
+
+        self._default_schedule_event = copy(self.bot._schedule_event)
+        self._default_invoke = copy(self.bot.invoke)
+        self.bot._schedule_event = self._schedule_event
+        self.bot.invoke = self._invoke
+        self.sampler.start()
+
+    def _schedule_event(self, coro, event_name, *args, **kwargs):
+        # イベントのリスナーの処理時間を計るようにします。
+        histogram = self.listeners[getattr(coro, "__qualname__", event_name)]
+
+        @wraps(coro)
+        async def new_coro(*args, **kwargs):
+            return await measure(coro(*args, **kwargs), histogram.observe)
+        return self._default_schedule_event(new_coro, event_name, *args, **kwargs)
+
+    async def _invoke(self, ctx: commands.Context):
+        # コマンドの処理時間を計るようにします。
+        if ctx.command is None:
+            return await self._default_invoke(ctx)
+        return await measure(
+            self._default_invoke(ctx),
+            self.commands[ctx.command.qualified_name].observe
+        )
+
+    @tasks.loop(seconds=INTERVAL)
+    async def sampler(self):
+        # イベントループの遅延などを定期的に記録する。
+        now = self.bot.loop.time()
+        lag = 0.0 if self._before is None else max(
+            now - self._before - self.INTERVAL, 0.0
+        )
+        self._before = now
+        self.samples.append({
+            "lag": lag, "tasks": len(all_tasks()),
+            "rss": self.process.memory_info().rss,
+            "cpu": self.process.cpu_percent(None)
+        })
+
+    def pool(self) -> Dict[str, int]:
+        "データベースのプールの状態を取得します。"
+        pool = getattr(getattr(self.bot, "mysql", None), "pool", None)
+        if pool is None:
+            return {}
+        return {
+            "size": pool.size, "free": pool.freesize,
+            "used": pool.size - pool.freesize,
+            "min": pool.minsize, "max": pool.maxsize
+        }
+
+    def voice(self) -> Dict[str, int]:
+        "ボイスチャンネルへの接続数を取得します。"
+        return {
+            "total": len(self.bot.voice_clients),
+            "tts": len(getattr(self.bot.cogs.get("TTS"), "now", ())),
+            "music": len(getattr(self.bot.cogs.get("MusicNormal"), "now", ()))
+        }
+
+    def gauges(self) -> Dict[str, float]:
+        "最新の計測結果と直近の最大の遅延を取得します。"
+        if not self.samples:
+            return {}
+        return {
+            **self.samples[-1],
+            "max_lag": max(sample["lag"] for sample in self.samples)
+        }
+
+    @staticmethod
+    def top(histograms: Dict[str, Histogram], length: int = 5) -> List[tuple]:
+        "イベントループを占有していた時間が長い順に並べます。"
+        return sorted(
+            histograms.items(), key=lambda item: item[1].busy, reverse=True
+        )[:length]
+
+    def export_json(self) -> dict:
+        "計測結果を辞書で出力します。"
+        return {
+            "gauges": self.gauges(), "pool": self.pool(), "voice": self.voice(),
+            "extensions": getattr(self.bot, "extension_load_times", {}),
+            "listeners": {
+                name: histogram.to_dict()
+                for name, histogram in self.listeners.items()
+            },
+            "commands": {
+                name: histogram.to_dict()
+                for name, histogram in self.commands.items()
+            },
+            "routes": {
+                name: histogram.to_dict()
+                for name, histogram in getattr(
+                    self.bot.cogs.get("MessageRouter"), "timings", {}
+                ).items()
+            }
+        }
+
+    def export_prometheus(self) -> str:
+        "計測結果をPrometheusのテキスト形式で出力します。"
+        lines = []
+        for key, value in self.gauges().items():
+            lines.append(f"# TYPE rt_{key} gauge")
+            lines.append(f"rt_{key} {value}")
+        for metric, label, values in (
+            ("rt_mysql_pool", "state", self.pool()),
+            ("rt_voice_clients", "kind", self.voice())
+        ):
+            lines.append(f"# TYPE {metric} gauge")
+            for key, value in values.items():
+                lines.append(f'{metric}{{{label}="{escape_label(key)}"}} {value}')
+        for metric, label, histograms in (
+            ("rt_listener_seconds", "listener", self.listeners),
+            ("rt_command_seconds", "command", self.commands)
+        ):
+            lines.append(f"# TYPE {metric} histogram")
+            for name, histogram in histograms.items():
+                name, cumulative = escape_label(name), 0
+                for bucket, count in zip(
+                    [str(bucket) for bucket in BUCKETS] + ["+Inf"],
+                    histogram.counts
+                ):
+                    cumulative += count
+                    lines.append(
+                        f'{metric}_bucket{{{label}="{name}",le="{bucket}"}} {cumulative}'
+                    )
+                lines.append(f'{metric}_sum{{{label}="{name}"}} {histogram.total}')
+                lines.append(f'{metric}_count{{{label}="{name}"}} {histogram.count}')
+            # イベントループを占有していた時間は累計なので別のカウンターにする。
+            busy = metric.replace("_seconds", "_busy_seconds_total")
+            lines.append(f"# TYPE {busy} counter")
+            for name, histogram in histograms.items():
+                lines.append(f'{busy}{{{label}="{escape_label(name)}"}} {histogram.busy}')
+        lines.append("")
+        return "\n".join(lines)
+
+    def cog_unload(self):
+        self.sampler.cancel()
+        self.bot._schedule_event = self._default_schedule_event
+        self.bot.invoke = self._default_invoke
+
+
+def setup(bot):
+    bot.add_cog(Monitor(bot))
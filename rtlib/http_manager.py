@@ -0,0 +1,253 @@
+# RT Lib - HTTP Manager
+
+from typing import (
+    Optional, Callable, Hashable, Union, Any, Dict, Tuple
+)
+
+from asyncio import AbstractEventLoop, Future, get_event_loop, shield
+from concurrent.futures import Executor, ThreadPoolExecutor
+from collections import OrderedDict, defaultdict
+from urllib.parse import urlparse
+from functools import partial
+from time import time
+
+from aiohttp import ClientSession, TCPConnector
+from ujson import loads, dumps
+
+
+def freeze(value: Any) -> Hashable:
+    "辞書やリストをキーに使えるようにタプルにします。"
+    if isinstance(value, dict):
+        return tuple(sorted((key, freeze(item)) for key, item in value.items()))
+    if isinstance(value, (list, tuple, set)):
+        return tuple(freeze(item) for item in value)
+    return value
+
+
+class ResponseCache:
+    """期限付きのレスポンスのキャッシュです。
+    期限切れになった後も`stale`秒の間は古いデータとして取り出すことができます。
+
+    Parameters
+    ----------
+    max_size : int, default 1024
+        キャッシュする最大の数です。超えた場合は古いものから削除されます。"""
+
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self.data: "OrderedDict[Hashable, Tuple[Any, float, float]]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Tuple[Optional[Any], bool, bool]:
+        """キャッシュを取り出します。
+        `(データ, 見つかったかどうか, 期限切れかどうか)`を返します。"""
+        if key in self.data:
+            value, expire, stale = self.data[key]
+            now = time()
+            if now < stale:
+                self.data.move_to_end(key)
+                return value, True, expire <= now
+            del self.data[key]
+        return None, False, False
+
+    def set(self, key: Hashable, value: Any, ttl: float, stale: float = 0) -> None:
+        "キャッシュを設定します。"
+        now = time()
+        self.data[key] = (value, now + ttl, now + ttl + stale)
+        self.data.move_to_end(key)
+        while len(self.data) > self.max_size:
+            self.data.popitem(last=False)
+
+    def remove(self, key: Hashable) -> None:
+        "キャッシュを削除します。"
+        self.data.pop(key, None)
+
+    def clear(self) -> None:
+        "キャッシュを全て削除します。"
+        self.data.clear()
+
+
+class HTTPManager:
+    """Botの外部へのHTTPリクエストをまとめて管理するクラスです。
+    一つの`ClientSession`をホストごとの接続数の制限付きで使い回し、
+    レスポンスのキャッシュと同じリクエストのまとめを行います。
+    HTMLのパースなどの重い処理はワーカープールで実行されます。
+
+    Parameters
+    ----------
+    loop : asyncio.AbstractEventLoop, optional
+        イベントループです。
+    limit : int, default 100
+        全体の同時接続数の上限です。
+    limit_per_host : int, default 10
+        ホストごとの同時接続数の上限です。
+    cache_size : int, default 1024
+        キャッシュするレスポンスの最大の数です。
+    executor : concurrent.futures.Executor, optional
+        パーサーを実行するワーカープールです。
+        指定しない場合はスレッドプールが使われます。
+        プロセスプールを使う場合はパーサーをモジュールの直下に定義してください。"""
+
+    def __init__(
+        self, loop: Optional[AbstractEventLoop] = None, limit: int = 100,
+        limit_per_host: int = 10, cache_size: int = 1024,
+        executor: Optional[Executor] = None
+    ):
+        self.loop = loop or get_event_loop()
+        self.session = ClientSession(
+            loop=self.loop, json_serialize=dumps,
+            connector=TCPConnector(
+                loop=self.loop, limit=limit, limit_per_host=limit_per_host
+            )
+        )
+        self.cache = ResponseCache(cache_size)
+        self.executor = executor or ThreadPoolExecutor(
+            4, thread_name_prefix="rtlib_http"
+        )
+        self.requests: Dict[Hashable, Future] = {}
+
+        self.counts: Dict[str, int] = defaultdict(int)
+        # ホストごとの`[リクエスト数, 合計時間, 最大時間]`です。
+        self.latencies: Dict[str, list] = defaultdict(lambda: [0, 0.0, 0.0])
+
+    @staticmethod
+    def make_key(
+        method: str, url: str, data: Union[dict, str, None] = None,
+        params: Optional[dict] = None,
+        parser: Optional[Callable[[str], Any]] = None, json: bool = False,
+        headers: Optional[dict] = None
+    ) -> Hashable:
+        """キャッシュやリクエストのまとめに使うキーを作ります。
+        パーサーが違うと返り値が違い、ヘッダーが違うとレスポンスが違うことがあるのでそれらも含めます。"""
+        return (
+            method.upper(), url, freeze(data), freeze(params), parser, json,
+            freeze({key.lower(): value for key, value in headers.items()})
+            if headers else None
+        )
+
+    async def _request(
+        self, key: Hashable, method: str, url: str, ttl: float,
+        stale: float, parser: Optional[Callable[[str], Any]],
+        json: bool, **kwargs
+    ) -> Any:
+        # 実際にリクエストを行いパースをしてキャッシュします。
+        host, start = urlparse(url).netloc, time()
+        try:
+            async with self.session.request(method, url, **kwargs) as r:
+                status, text = r.status, await r.text()
+        except Exception:
+            self.counts["errors"] += 1
+            raise
+        finally:
+            elapsed = time() - start
+            latency = self.latencies[host]
+            latency[0] += 1
+            latency[1] += elapsed
+            latency[2] = max(latency[2], elapsed)
+
+        if json:
+            value = loads(text)
+        elif parser is None:
+            value = text
+        else:
+            value = await self.loop.run_in_executor(
+                self.executor, parser, text
+            )
+        if ttl and status < 400:
+            self.cache.set(key, value, ttl, stale)
+        return value
+
+    def _start(self, key: Hashable, *args, **kwargs) -> Future:
+        # リクエストを開始します。既に同じリクエストが実行中ならそれを返します。
+        if key in self.requests:
+            self.counts["coalesced"] += 1
+            return self.requests[key]
+        future = self.loop.create_task(self._request(key, *args, **kwargs))
+        future.add_done_callback(lambda _: self.requests.pop(key, None))
+        # 誰も待たずに失敗した場合に警告が出ないようにする。
+        future.add_done_callback(
+            lambda f: f.cancelled() or f.exception()
+        )
+        self.requests[key] = future
+        return future
+
+    async def fetch(
+        self, method: str, url: str, *, ttl: float = 60.0,
+        stale: float = 0.0, parser: Optional[Callable[[str], Any]] = None,
+        json: bool = False, data: Union[dict, str, None] = None,
+        params: Optional[dict] = None, **kwargs
+    ) -> Any:
+        """リクエストを行います。キャッシュがある場合はそれを返します。
+
+        Parameters
+        ----------
+        method : str
+            HTTPメソッドです。
+        url : str
+            リクエスト先のURLです。
+        ttl : float, default 60.0
+            レスポンスをキャッシュする秒数です。`0`の場合はキャッシュしません。
+        stale : float, default 0.0
+            期限切れの後に古いキャッシュを返しつつ裏で更新を行う秒数です。
+        parser : Callable[[str], Any], optional
+            レスポンスの文字列を渡すパーサーです。ワーカープールで実行されます。
+            キャッシュされるのはこのパーサーの返り値です。
+        json : bool, default False
+            レスポンスをJSONとして読み込むかどうかです。
+        data : Union[dict, str], optional
+            送信するデータです。
+        params : dict, optional
+            クエリパラメータです。
+        **kwargs
+            `aiohttp.ClientSession.request`に渡すキーワード引数です。"""
+        key = self.make_key(
+            method, url, data, params, parser, json, kwargs.get("headers")
+        )
+        value, found, expired = self.cache.get(key)
+        args = (method, url, ttl, stale, parser, json)
+        kwargs.update(data=data, params=params)
+        if found:
+            if expired:
+                # 古いキャッシュを返しつつ裏で更新をする。
+                self.counts["stale"] += 1
+                self._start(key, *args, **kwargs)
+            else:
+                self.counts["hits"] += 1
+            return value
+        self.counts["misses"] += 1
+        return await shield(self._start(key, *args, **kwargs))
+
+    def get(self, url: str, **kwargs) -> Any:
+        "GETリクエストを行います。引数は`HTTPManager.fetch`と同じです。"
+        return self.fetch("GET", url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> Any:
+        "POSTリクエストを行います。引数は`HTTPManager.fetch`と同じです。"
+        return self.fetch("POST", url, **kwargs)
+
+    def parse(self, parser: Callable[..., Any], *args) -> Future:
+        "渡されたパーサーをワーカープールで実行します。"
+        return self.loop.run_in_executor(self.executor, partial(parser, *args))
+
+    def stats(self) -> dict:
+        "キャッシュのヒット率とホストごとの通信時間の統計を返します。"
+        total = self.counts["hits"] + self.counts["stale"] + self.counts["misses"]
+        return {
+            "requests": total,
+            "hit_rate": (
+                (self.counts["hits"] + self.counts["stale"]) / total
+                if total else 0.0
+            ),
+            **self.counts, "cached": len(self.cache.data),
+            "in_flight": len(self.requests),
+            "hosts": {
+                host: {
+                    "count": count, "average": total_time / count,
+                    "max": max_time
+                } for host, (count, total_time, max_time) in self.latencies.items()
+            }
+        }
+
+    async def close(self) -> None:
+        "セッションとワーカープールを閉じます。"
+        await self.session.close()
+        self.executor.shutdown(wait=False)
@@ -0,0 +1,163 @@
+# RT Lib - Media Relay
+
+from typing import (
+    AsyncIterator, Iterable, Optional, Dict, List, Tuple
+)
+
+from asyncio import Semaphore, gather
+from contextlib import asynccontextmanager
+from collections import defaultdict
+from tempfile import mkstemp
+from io import BytesIO
+from os import remove
+
+from aiohttp import ClientSession
+import discord
+
+
+# 添付ファイルのアップロードの上限のバイト数のデフォルトです。ブーストされていないサーバーの上限です。
+DEFAULT_LIMIT = 8 * 1024 * 1024
+# これ以下の大きさのファイルはメモリに置き、これより大きいファイルは一時ファイルに書き込みます。
+SPOOL_SIZE = 512 * 1024
+# 一度に読み込むバイト数です。
+CHUNK_SIZE = 64 * 1024
+
+
+def append_urls(
+    content: str, attachments: Iterable[discord.Attachment], spoiler: bool = False
+) -> str:
+    "ダウンロードしなかった添付ファイルのURLをメッセージの最後に追加します。"
+    for attachment in attachments:
+        content += f"\n||{attachment.url}||" if spoiler else f"\n{attachment.url}"
+    return content
+
+
+class MediaTooLarge(Exception):
+    "ダウンロードしたファイルが添付ファイルの大きさより大きかった際に発生します。"
+
+
+class Media:
+    """ダウンロードした添付ファイルです。
+    `to_file`で何度でも`discord.File`にすることができます。"""
+
+    __slots__ = ("filename", "spoiler", "data", "path")
+
+    def __init__(
+        self, filename: str, spoiler: bool, data: Optional[bytes] = None,
+        path: Optional[str] = None
+    ):
+        self.filename, self.spoiler = filename, spoiler
+        self.data, self.path = data, path
+
+    def to_file(self, spoiler: Optional[bool] = None) -> discord.File:
+        """`discord.File`を作ります。
+        一時ファイルの場合は送信する際に少しずつ読み込まれます。"""
+        return discord.File(
+            BytesIO(self.data) if self.path is None else self.path,
+            self.filename, spoiler=self.spoiler if spoiler is None else spoiler
+        )
+
+    def close(self) -> None:
+        "一時ファイルを削除します。"
+        if self.path is not None:
+            try:
+                remove(self.path)
+            except FileNotFoundError:
+                pass
+            self.path = None
+
+
+class MediaRelay:
+    """添付ファイルを再送信するためにダウンロードするクラスです。
+    送信できない大きさの添付ファイルはダウンロードせず、
+    ダウンロードは少しずつ行い大きいものは一時ファイルに書き込むので、
+    画像が大量に送られてもメモリの使用量は増えません。
+    また同じサーバーの添付ファイルの同時ダウンロード数は`per_guild`までに制限されます。
+
+    Parameters
+    ----------
+    session : aiohttp.ClientSession
+        ダウンロードに使うセッションです。
+    per_guild : int, default 3
+        サーバーごとの同時ダウンロード数の上限です。"""
+
+    def __init__(
+        self, session: ClientSession, per_guild: int = 3
+    ):
+        self.session = session
+        self.semaphores: Dict[int, Semaphore] = defaultdict(
+            lambda: Semaphore(per_guild)
+        )
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    async def _read(self, attachment: discord.Attachment, write) -> None:
+        # 添付ファイルを少しずつ読み込みます。
+        size = 0
+        async with self.session.get(attachment.url) as r:
+            r.raise_for_status()
+            async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                if (size := size + len(chunk)) > attachment.size:
+                    raise MediaTooLarge(attachment.url)
+                write(chunk)
+
+    async def download(
+        self, attachment: discord.Attachment, guild_id: int
+    ) -> Media:
+        "添付ファイルをダウンロードします。"
+        async with self.semaphores[guild_id]:
+            spoiler = attachment.is_spoiler()
+            if attachment.size <= SPOOL_SIZE:
+                data = BytesIO()
+                await self._read(attachment, data.write)
+                self.counts["memory"] += 1
+                return Media(attachment.filename, spoiler, data=data.getvalue())
+            fd, path = mkstemp(prefix="rt_media_")
+            try:
+                with open(fd, "wb") as f:
+                    await self._read(attachment, f.write)
+            except BaseException:
+                remove(path)
+                raise
+            self.counts["spooled"] += 1
+            return Media(attachment.filename, spoiler, path=path)
+
+    @asynccontextmanager
+    async def fetch(
+        self, attachments: Iterable[discord.Attachment], guild_id: int,
+        limit: int = DEFAULT_LIMIT
+    ) -> AsyncIterator[Tuple[List[Media], List[discord.Attachment]]]:
+        """添付ファイルをまとめてダウンロードします。
+        `async with`で使い、`(ダウンロードしたもの, ダウンロードしなかった添付ファイル)`を返します。
+        合計の大きさが`limit`を超える添付ファイルとダウンロードに失敗した添付ファイルはダウンロードしなかったものに入ります。
+        `async with`を抜けると一時ファイルは削除されます。
+
+        Parameters
+        ----------
+        attachments : Iterable[discord.Attachment]
+            添付ファイルです。
+        guild_id : int
+            添付ファイルが送信されたサーバーのIDです。
+        limit : int, default DEFAULT_LIMIT
+            アップロードできる合計のバイト数です。"""
+        targets, skipped, total = [], [], 0
+        for attachment in attachments:
+            if total + attachment.size <= limit:
+                total += attachment.size
+                targets.append(attachment)
+            else:
+                skipped.append(attachment)
+        self.counts["skipped"] += len(skipped)
+        medias = []
+        try:
+            for attachment, result in zip(targets, await gather(*(
+                self.download(attachment, guild_id) for attachment in targets
+            ), return_exceptions=True)):
+                if isinstance(result, Media):
+                    medias.append(result)
+                else:
+                    self.counts["errors"] += 1
+                    skipped.append(attachment)
+            yield medias, skipped
+        finally:
+            for media in medias:
+                media.close()
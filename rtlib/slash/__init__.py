@@ -9,16 +9,30 @@ from .types import (
 from .application_command import ApplicationCommand
 from typing import Type, List, Dict
 
+from aiofiles import open as async_open
 from .executor import executor
+from ujson import loads, dumps
 from inspect import signature
+from hashlib import sha256
 from .option import Option
+from asyncio import sleep
 from copy import copy
 
 
 Route = discord.http.Route
+# 比較に使うキーとその省略された時の値です。
+COMMAND_KEYS = ("type", "name", "description", "options", "default_permission")
+OPTION_KEYS = ("type", "name", "description", "required", "choices", "options")
+DEFAULTS = {"required": False, "options": [], "choices": [], "default_permission": True}
 
 
 class SlashCommand(commands.Cog):
+
+    HASH_PATH = "data/slash_commands.json"
+    BULK_THRESHOLD = 5
+    # 起動後に追加されたコマンドをまとめて登録するまで待つ秒数です。
+    SYNC_DELAY = 5
+
     def __init__(self, bot):
         self.bot = bot
         # discord.pyが用意している簡単にリクエストをするためのもの。
@@ -27,65 +41,60 @@ class SlashCommand(commands.Cog):
         self.now_commands: List[ApplicationCommandType] = []
         # スラッシュコマンドのコマンドを入れるためのリストです。
         self.commands: Dict[int, ApplicationCommand] = {}
-        # queue
-        self.queue: List[Type[commands.Command]] = []
-
-    def check_list_same(
-            self, former: dict, latter: dict,
-            ignore: List[str], defaults: dict) -> bool:
-        # 渡された二つのリストが同じかどうかを調べます。
-        if len(former) < len(latter):
-            # もしもしformerの方が数が少ないなら入れ替える。
-            cache = former
-            former = latter
-            latter = cache
-            del cache
-        for data in former:
-            dictionary = isinstance(data, dict)
-            is_list = isinstance(data, list)
-            for latter_data in latter:
-                if dictionary and isinstance(latter_data, dict) and self.check_dictionary_same(
-                    data, latter_data, ignore, defaults
-                ):
-                    break
-                elif is_list and isinstance(latter_dat, dict) and self.check_list_same(
-                    data, latter_data, ignore, defaults
-                ):
-                    break
-                elif data == latter_data:
-                    break
-            else:
-                return False
-        return True
-
-    def check_dictionary_same(
-            self, former: dict, latter: dict, ignore: List[str],
-            defaults: dict
-        ) -> bool:
-        # 渡された二つの辞書が同じかどうかを調べます。
-        for key in former:
-            if key not in ignore:
-                if isinstance(former[key], dict):
-                    if isinstance((latter_cache := latter.get(key)), dict):
-                        if not self.check_dictionary_same(
-                            former[key], latter_cache, ignore, defaults
-                            ):
-                            return False
-                    else:
-                        return False
-                elif isinstance(former[key], list):
-                    if isinstance((latter_cache := latter.get(key)), list):
-                        if not self.check_list_same(
-                            former[key], latter_cache, ignore, defaults
-                        ):
-                            return False
-                    else:
-                        return False
-                elif former[key] != latter.get(key, defaults.get(key, None)):
-                    return False
-                elif key not in latter:
-                    return False
-        return True
+        # 起動後に追加されて登録を待っているコマンドです。
+        self.queue: Dict[str, Type[commands.Command]] = {}
+        # 全てのエクステンションが読み込まれて一度全体を同期したかどうかです。
+        self.synced = False
+
+    @staticmethod
+    def _canonicalize(data: dict, keys: tuple = COMMAND_KEYS) -> dict:
+        # 比較に必要なキーだけを取り出しデフォルト値を省いた辞書にします。
+        canonical = {}
+        for key in keys:
+            value = data.get(key, DEFAULTS.get(key))
+            if key in DEFAULTS and value == DEFAULTS[key]:
+                continue
+            if key == "options":
+                value = [
+                    SlashCommand._canonicalize(option, OPTION_KEYS)
+                    for option in value
+                ]
+            elif key == "choices":
+                value = [
+                    {"name": choice["name"], "value": choice["value"]}
+                    for choice in value
+                ]
+            canonical[key] = value
+        return canonical
+
+    @classmethod
+    def make_hash(cls, data: dict) -> str:
+        "アプリケーションコマンドのデータから比較用のハッシュを作ります。"
+        return sha256(
+            dumps(
+                cls._canonicalize(data), sort_keys=True,
+                ensure_ascii=False, escape_forward_slashes=False
+            ).encode()
+        ).hexdigest()
+
+    async def _load_registered(self) -> dict:
+        # 前回登録したコマンドのハッシュとデータを読み込みます。
+        try:
+            async with async_open(self.HASH_PATH, "r") as f:
+                registered = loads(await f.read())
+        except (FileNotFoundError, ValueError):
+            return {}
+        if registered.get("application_id") != str(self.bot.user.id):
+            return {}
+        return registered.get("commands", {})
+
+    async def _save_registered(self, registered: dict) -> None:
+        # 登録したコマンドのハッシュとデータを保存します。
+        async with async_open(self.HASH_PATH, "w") as f:
+            await f.write(dumps(
+                {"application_id": str(self.bot.user.id),
+                 "commands": registered}
+            ))
 
     def _get_data_from_command(
         self, command: Type[commands.Command], id_: int = None,
@@ -164,44 +173,93 @@ class SlashCommand(commands.Cog):
 
         return data
 
+    async def _sync_commands(
+        self, datas: Dict[str, dict], complete: bool = True
+    ) -> Dict[str, dict]:
+        # Discordに登録されているコマンドと比較して変更があったものだけ登録します。
+        # `complete`が`False`の場合は`datas`が全てのコマンドではないので削除と一括上書きはしない。
+        if complete or not self.now_commands:
+            await self._update_now_commands()
+        remote = {data["name"]: data for data in self.now_commands}
+        changed = [
+            data for name, data in datas.items()
+            if name not in remote
+            or self.make_hash(remote[name]) != self.make_hash(data)
+        ]
+        removed = [
+            data for name, data in remote.items() if name not in datas
+        ] if complete else []
+        if not changed and not removed:
+            return remote
+
+        if complete and len(changed) + len(removed) > self.BULK_THRESHOLD:
+            # 変更が多い場合は一括で上書きする。
+            self.now_commands = await self.request(
+                Route("PUT", f"/applications/{self.bot.user.id}/commands"),
+                json=list(datas.values())
+            )
+            return {data["name"]: data for data in self.now_commands}
+
+        for data in changed:
+            remote[data["name"]] = await self.request(
+                Route("POST", f"/applications/{self.bot.user.id}/commands"),
+                json=data
+            )
+        for data in removed:
+            await self.request(Route(
+                "DELETE", "/applications/{application_id}/commands/{command_id}",
+                application_id=self.bot.user.id, command_id=data["id"]
+            ))
+            del remote[data["name"]]
+        self.now_commands = list(remote.values())
+        return remote
+
     async def _update_commands(
-            self, commands: List[Type[commands.Command]]
+            self, commands: List[Type[commands.Command]],
+            complete: bool = True
         ) -> None:
-        # コマンドのデータを作りアップデートが必要ならスラッシュコマンドが更新する。
-        change_command = False
+        # コマンドのデータを作り前回の登録から変更があった場合のみスラッシュコマンドを更新する。
+        # `complete`が`True`の場合は渡されたコマンドが全てのコマンドとして扱われ、ないコマンドは削除される。
+        datas = {
+            command.name: self._get_data_from_command(command)
+            for command in commands
+        }
+        hashes = {name: self.make_hash(data) for name, data in datas.items()}
+
+        registered = await self._load_registered()
+        if complete and {
+            name: data["hash"] for name, data in registered.items()
+        } == hashes:
+            # 前回から何も変わっていないならDiscordへのリクエストを省く。
+            remote = {name: data["data"] for name, data in registered.items()}
+            self.now_commands = list(remote.values())
+        elif not complete and all(
+            registered.get(name, {}).get("hash") == hash_
+            for name, hash_ in hashes.items()
+        ):
+            remote = {data["name"]: data for data in self.now_commands}
+            remote.update(
+                (name, registered[name]["data"]) for name in datas
+                if name not in remote
+            )
+        else:
+            remote = await self._sync_commands(datas, complete)
+            entries = {
+                name: {"hash": hashes[name], "data": remote[name]}
+                for name in datas
+            }
+            if not complete:
+                # 全てのコマンドではないので前回の登録に追加する。
+                registered.update(entries)
+                entries = registered
+            await self._save_registered(entries)
 
         for command in commands:
-            data = self._get_data_from_command(command)
-            update = False
-
-            for already_command in self.now_commands:
-                # 既に登録されているコマンドと違うコマンドがあるなら更新フラグを立てる。
-                if already_command["name"] == command.name:
-                    check_target = copy(already_command)
-                    update = not self.check_dictionary_same(
-                        check_target, data, ("id", "version"),
-                        {"required": False, "options": []}
-                    )
-                    break
-            else:
-                # もしコマンドが登録されていないなら更新フラグを立てる。
-                update = True
-
-            # 更新フラグが立っているならスラッシュコマンドを登録する。
-            if update and False:
-                print(data)
-                already_command: ApplicationCommandType = await self.request(
-                    Route("POST", f"/applications/{self.bot.user.id}/commands"),
-                    json=data
-                )
             # コマンドにSlashCommandのインスタンスをコマンドにくっつける。
             command.application_command = ApplicationCommand(
-                self.bot, command, already_command
+                self.bot, command, copy(remote[command.name])
             )
             self.commands[command.application_command.name] = command.application_command
-            change_command = True
-        if change_command:
-            await self._update_now_commands()
 
     @commands.Cog.listener()
     async def on_interaction(self, interaction: discord.Interaction):
@@ -230,21 +288,45 @@ class SlashCommand(commands.Cog):
             Route("GET", f"/applications/{self.bot.user.id}/commands")
         )
 
+    @staticmethod
+    def is_application_command(command: Type[commands.Command]) -> bool:
+        "スラッシュコマンドなどとして登録するコマンドかどうかを返します。"
+        return command.parent is None and any(
+            word in command.__original_kwargs__
+            for word in (
+                "slash_command", "user_command",
+                "message_command"
+            )
+        )
+
     @commands.Cog.listener()
     async def on_full_ready(self, command=None):
-        # 既に登録されているスラッシュコマンドを取得する。
-        await self._update_now_commands()
-        # Botに登録されているコマンドをすべて取得する。
-        await self._update_commands(self.queue)
+        # 全てのエクステンションが読み込まれた後にBotに登録されているコマンドを全て取得して必要なら登録する。
+        # 読み込み中のコマンドだけで同期すると後から読み込まれるコマンドが削除されてしまうため。
+        # `full_ready`の後に読み込まれるエクステンションがある場合はそれも待つ。
+        if (task := getattr(self.bot, "deferred_loading", None)) is not None:
+            await task
+        self.queue.clear()
+        await self._update_commands([
+            command for command in self.bot.commands
+            if self.is_application_command(command)
+        ])
+        self.synced = True
+
+    async def _sync_queue(self) -> None:
+        # 起動後に追加されたコマンドを少し待ってからまとめて登録します。
+        await sleep(self.SYNC_DELAY)
+        queue, self.queue = self.queue, {}
+        await self._update_commands(list(queue.values()), False)
 
     @commands.Cog.listener()
     async def on_command_add(self, command: Type[commands.Command]):
-        if any(word in command.__original_kwargs__
-                for word in (
-                    "slash_command", "user_command",
-                    "message_command"
-                )):
-            self.queue.append(command)
+        # 起動後にエクステンションが読み込まれた場合などに追加されたコマンドを登録する。
+        # この時はコマンドの削除はしない。
+        if self.synced and self.is_application_command(command):
+            if not self.queue:
+                self.bot.loop.create_task(self._sync_queue())
+            self.queue[command.name] = command
 
 
 def setup(bot):
@@ -1,12 +1,16 @@
 # RT Lib - Typed
 
-from typing import List
+from typing import List, Dict
+
+from asyncio import Task
 
 from discord.ext import commands
 
 from aiohttp import ClientSession
 from aiomysql import Pool
 
+from .http_manager import HTTPManager
+from .media import MediaRelay
 from .mysql_manager import MySQLManager
 from data import data, Colors, is_admin
 
@@ -18,6 +22,10 @@ class RT(commands.AutoShardedBot):
     data: data
     admins: List[int]
     session: ClientSession
+    http_manager: HTTPManager
+    media: MediaRelay
+    extension_load_times: Dict[str, float]
+    deferred_loading: Task
     secret: dict
     is_admin: is_admin
     colors: dict
@@ -35,5 +43,7 @@ class RT(commands.AutoShardedBot):
     async def close(self) -> None:
         self.print("Closing...")
         self.dispatch("close", self.loop)
+        if hasattr(self, "http_manager"):
+            await self.http_manager.close()
         await super().close()
         self.print("Bye")
\ No newline at end of file
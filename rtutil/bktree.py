@@ -0,0 +1,145 @@
+# RT Util - BK-Tree
+
+from typing import Callable, Iterable, Optional, Dict, List, Tuple
+
+from time import perf_counter
+
+
+def damerau_levenshtein(a: str, b: str) -> int:
+    """隣同士の文字の入れ替えを一回と数える編集距離を計算します。
+    入れ替えた後の文字の間も編集することができる制限のないものなので距離の公理を満たし、BK-木に使うことができます。"""
+    if a == b:
+        return 0
+    if not a or not b:
+        return len(a) + len(b)
+    infinity = len(a) + len(b)
+    # 一行目と一列目は番兵です。
+    table = [[infinity] * (len(b) + 2)]
+    table.extend([infinity, i] + [0] * len(b) for i in range(len(a) + 1))
+    table[1][1:] = range(len(b) + 1)
+    # 文字ごとに最後に出てきた`a`の位置です。
+    last: Dict[str, int] = {}
+    for i, ca in enumerate(a, 1):
+        matched = 0
+        for j, cb in enumerate(b, 1):
+            k, l = last.get(cb, 0), matched
+            if ca == cb:
+                cost, matched = 0, j
+            else:
+                cost = 1
+            table[i + 1][j + 1] = min(
+                table[i][j] + cost, table[i + 1][j] + 1, table[i][j + 1] + 1,
+                table[k][l] + (i - k - 1) + 1 + (j - l - 1)
+            )
+        last[ca] = i
+    return table[-1][-1]
+
+
+def get_tolerance(word: str) -> int:
+    "短い文字列ほど許容する編集距離を小さくします。"
+    return 1 if len(word) <= 4 else 2
+
+
+class BKTree:
+    """編集距離が近い文字列を素早く探すための木です。
+
+    Parameters
+    ----------
+    words : Iterable[str], optional
+        最初に追加しておく文字列です。
+    distance : Callable[[str, str], int], default damerau_levenshtein
+        編集距離を計算する関数です。
+        三角不等式を満たさない関数を使うと近い文字列が見つからないことがあります。"""
+
+    def __init__(
+        self, words: Iterable[str] = (),
+        distance: Callable[[str, str], int] = damerau_levenshtein
+    ):
+        self.distance = distance
+        self.root: Optional[Tuple[str, Dict[int, tuple]]] = None
+        self.length = 0
+        for word in words:
+            self.add(word)
+
+    def add(self, word: str) -> None:
+        "文字列を追加します。"
+        if self.root is None:
+            self.root = (word, {})
+            self.length += 1
+            return
+        node = self.root
+        while (distance := self.distance(word, node[0])):
+            if distance in node[1]:
+                node = node[1][distance]
+            else:
+                node[1][distance] = (word, {})
+                self.length += 1
+                break
+
+    def search(self, word: str, tolerance: int) -> List[Tuple[int, str]]:
+        "編集距離が`tolerance`以下の文字列を`(編集距離, 文字列)`の近い順で返します。"
+        if self.root is None:
+            return []
+        results, nodes = [], [self.root]
+        while nodes:
+            target, children = nodes.pop()
+            distance = self.distance(word, target)
+            if distance <= tolerance:
+                results.append((distance, target))
+            for key in range(distance - tolerance, distance + tolerance + 1):
+                if key in children:
+                    nodes.append(children[key])
+        results.sort()
+        return results
+
+    def __len__(self) -> int:
+        return self.length
+
+
+def benchmark(words: List[str], queries: List[str]) -> dict:
+    """全ての文字列と比べる方法と比べてどれだけ速いかを計ります。
+    一回の検索にかかったミリ秒の平均を返します。"""
+    start = perf_counter()
+    tree = BKTree(words)
+    build = perf_counter() - start
+
+    start = perf_counter()
+    for query in queries:
+        tree.search(query, get_tolerance(query))
+    indexed = (perf_counter() - start) / len(queries)
+
+    start = perf_counter()
+    for query in queries:
+        sorted(
+            (distance, word) for word in words
+            if (distance := damerau_levenshtein(query, word)) <= get_tolerance(query)
+        )
+    linear = (perf_counter() - start) / len(queries)
+    return {
+        "words": len(words), "build_ms": build * 1000,
+        "indexed_ms": indexed * 1000, "linear_ms": linear * 1000
+    }
+
+
+if __name__ == "__main__":
+    from random import choice, randint, seed
+    from pathlib import Path
+    import re
+
+    # コグのコマンドの関数名をコマンドの名前の代わりにする。
+    seed(0)
+    words = list({
+        name.strip("_") for path in Path("../cogs").glob("**/*.py")
+        for name in re.findall(
+            r"async def (\w+)\(self, ctx", path.read_text("utf-8")
+        )
+    })
+
+    def typo(word: str) -> str:
+        # 隣同士の文字を入れ替えるか一文字消す。
+        i = randint(0, max(len(word) - 2, 0))
+        if randint(0, 1) and len(word) > 1:
+            return word[:i] + word[i + 1] + word[i] + word[i + 2:]
+        return word[:i] + word[i + 1:]
+
+    print(benchmark(words, [typo(choice(words)) for _ in range(1000)]))
@@ -0,0 +1,128 @@
+# RT Util - Deadline Heap
+
+from typing import (
+    Callable, Coroutine, Optional, Hashable, Any, Dict, List, Tuple
+)
+
+from asyncio import AbstractEventLoop, Event, TimeoutError, get_event_loop, wait_for
+from heapq import heappush, heappop
+from traceback import print_exc
+from itertools import count
+from time import time
+
+
+Item = Tuple[Hashable, Any]
+
+
+class DeadlineHeap:
+    """期限が来たものを処理するためのクラスです。
+    期限を順番に並べておき、一番早い期限まで待ちます。
+    なので期限が来ていないものを定期的に確認する必要はありません。
+    保存は使う側で行い、起動時に保存されているものを`push`で追加してください。
+
+    Parameters
+    ----------
+    callback : Callable[[List[Tuple[Hashable, Any]]], Coroutine]
+        期限が来たものを処理するコルーチン関数です。
+        同時に期限が来たものは`(キー, データ)`のリストでまとめて渡されます。
+    loop : asyncio.AbstractEventLoop, optional
+        イベントループです。
+    on_error : Callable[..., Coroutine], optional
+        処理でエラーが発生した際に`bot.on_error`と同じように`(名前, 期限が来たもの)`で呼ばれるコルーチン関数です。
+        指定しない場合はトレースバックが出力されます。
+        エラーが発生した場合、期限が来たものは`RETRY_AFTER`秒後にもう一度処理されます。"""
+
+    RETRY_AFTER = 60.0
+
+    def __init__(
+        self, callback: Callable[[List[Item]], Coroutine],
+        loop: Optional[AbstractEventLoop] = None,
+        on_error: Optional[Callable[..., Coroutine]] = None
+    ):
+        self.callback, self.loop = callback, loop or get_event_loop()
+        self.on_error = on_error
+        self.heap: List[Tuple[float, int, Hashable]] = []
+        self.items: Dict[Hashable, Tuple[float, int, Any]] = {}
+        self._counter = count()
+        self._changed = Event()
+        self._task = None
+
+    def push(self, key: Hashable, deadline: float, value: Any = None) -> None:
+        """追加します。既にある場合は期限が変更されます。
+
+        Parameters
+        ----------
+        key : Hashable
+            キーです。
+        deadline : float
+            期限のUNIX時間です。
+        value : Any
+            処理に使うデータです。"""
+        number = next(self._counter)
+        self.items[key] = (deadline, number, value)
+        heappush(self.heap, (deadline, number, key))
+        if self.heap[0][1] == number:
+            # 一番早い期限が変わった場合は待つ時間を計算し直す。
+            self._changed.set()
+
+    def remove(self, key: Hashable) -> None:
+        "削除します。ヒープからは期限が来た時に取り除かれます。"
+        self.items.pop(key, None)
+
+    def _pop_due(self, now: float) -> List[Item]:
+        # 期限が来たものを取り出します。
+        due = []
+        while self.heap and self.heap[0][0] <= now:
+            _, number, key = heappop(self.heap)
+            if (item := self.items.get(key)) is not None and item[1] == number:
+                del self.items[key]
+                due.append((key, item[2]))
+        return due
+
+    async def _call(self, due: List[Item]) -> None:
+        # 期限が来たものを処理します。失敗した場合は少し後にもう一度処理します。
+        try:
+            await self.callback(due)
+        except Exception:
+            if self.on_error is None:
+                print_exc()
+            else:
+                await self.on_error("DeadlineHeap", due)
+            deadline = time() + self.RETRY_AFTER
+            for key, value in due:
+                # 処理している間に追加し直されたものはそちらを優先する。
+                if key not in self.items:
+                    self.push(key, deadline, value)
+
+    async def _run(self) -> None:
+        while True:
+            self._changed.clear()
+            if not self.heap:
+                await self._changed.wait()
+                continue
+            if (delay := self.heap[0][0] - time()) > 0:
+                try:
+                    await wait_for(self._changed.wait(), delay)
+                except TimeoutError:
+                    pass
+                else:
+                    continue
+            if (due := self._pop_due(time())):
+                self.loop.create_task(self._call(due))
+
+    def start(self) -> None:
+        "処理を開始します。"
+        if self._task is None:
+            self._task = self.loop.create_task(self._run())
+
+    def close(self) -> None:
+        "処理を停止します。"
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def __len__(self) -> int:
+        return len(self.items)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self.items
@@ -0,0 +1,144 @@
+# RT Util - Jobs
+
+from typing import (
+    Callable, Coroutine, Optional, List, Tuple
+)
+
+from asyncio import Event, gather, sleep
+from time import monotonic
+
+
+class RateLimited(Exception):
+    """レート制限に引っかかった際に処理から発生させる例外です。
+    discord.pyは429を内部で再試行するので、再試行しきれなかった場合に使います。
+
+    Parameters
+    ----------
+    retry_after : float
+        再試行までに待つ秒数です。"""
+
+    def __init__(self, retry_after: float):
+        self.retry_after = retry_after
+        super().__init__(f"Rate limited, retry after {retry_after}s.")
+
+
+class Job:
+    """大量の処理を一定の同時実行数で行うためのクラスです。
+    レート制限に引っかかった場合は全ての処理を指定された秒数だけ止めてから再試行します。
+    処理する対象は昇順に並んでいる必要があり、
+    全て終わった対象の中で一番大きいものが`cursor`として記録されます。
+    この`cursor`を保存しておけば再起動した後に続きから実行することができます。
+
+    Parameters
+    ----------
+    items : List[int]
+        処理する対象のIDのリストです。昇順である必要があります。
+    action : Callable[[int], Coroutine]
+        対象ごとに実行するコルーチン関数です。
+        レート制限に引っかかった場合は`RateLimited`を発生させてください。
+    cursor : int, default 0
+        前回どこまで実行したかです。これより大きい対象のみ処理されます。
+    concurrency : int, default 5
+        同時実行数です。
+    on_progress : Callable[[Job], Coroutine], optional
+        進捗を通知するコルーチン関数です。
+    interval : float, default 5.0
+        `on_progress`を呼び出す最小の間隔です。"""
+
+    def __init__(
+        self, items: List[int], action: Callable[[int], Coroutine],
+        cursor: int = 0, concurrency: int = 5,
+        on_progress: Optional[Callable[["Job"], Coroutine]] = None,
+        interval: float = 5.0
+    ):
+        self.items = [item for item in items if item > cursor]
+        self.action, self.cursor = action, cursor
+        self.concurrency = concurrency
+        self.on_progress, self.interval = on_progress, interval
+        self.failed: List[Tuple[int, str]] = []
+        self.state = "running"
+        self.processed = self.limited = 0
+
+        self._running = Event()
+        self._running.set()
+        self._next, self._watermark = 0, 0
+        self._done = [False] * len(self.items)
+        self._last_progress = self._blocked_until = 0.0
+
+    @property
+    def total(self) -> int:
+        "処理する対象の数です。"
+        return len(self.items)
+
+    def pause(self) -> None:
+        "一時停止します。"
+        if self.state == "running":
+            self.state = "paused"
+            self._running.clear()
+
+    def resume(self) -> None:
+        "一時停止を解除します。"
+        if self.state == "paused":
+            self.state = "running"
+            self._running.set()
+
+    def cancel(self) -> None:
+        "中止します。実行中の処理は終わるまで待たれます。"
+        if self.state in ("running", "paused"):
+            self.state = "cancelled"
+            self._running.set()
+
+    def _finish(self, index: int) -> None:
+        # 処理済みの印をつけて`cursor`を進めます。
+        self._done[index] = True
+        self.processed += 1
+        while self._watermark < len(self._done) and self._done[self._watermark]:
+            self.cursor = self.items[self._watermark]
+            self._watermark += 1
+
+    async def _progress(self, force: bool = False) -> None:
+        # 一定間隔ごとに進捗を通知します。
+        if self.on_progress is not None and (
+            force or monotonic() - self._last_progress >= self.interval
+        ):
+            self._last_progress = monotonic()
+            await self.on_progress(self)
+
+    async def _wait(self) -> None:
+        # レート制限に引っかかっている間は待ちます。
+        while (delay := self._blocked_until - monotonic()) > 0:
+            await sleep(delay)
+
+    async def _worker(self) -> None:
+        # 対象を一つずつ取り出して処理します。
+        while self.state != "cancelled" and self._next < len(self.items):
+            await self._running.wait()
+            await self._wait()
+            if self.state == "cancelled" or self._next >= len(self.items):
+                break
+            index, self._next = self._next, self._next + 1
+            while True:
+                try:
+                    await self.action(self.items[index])
+                except RateLimited as e:
+                    # 全てのワーカーを止めてから再試行する。
+                    self.limited += 1
+                    self._blocked_until = max(
+                        self._blocked_until, monotonic() + e.retry_after
+                    )
+                    await self._wait()
+                    continue
+                except Exception as e:
+                    self.failed.append((self.items[index], str(e)))
+                break
+            self._finish(index)
+            await self._progress()
+
+    async def run(self) -> "Job":
+        "処理を実行します。"
+        await gather(*(self._worker() for _ in range(self.concurrency)))
+        if self.state == "running":
+            self.state = "done"
+        await self._progress(True)
+        return self
+
@@ -1,105 +1,172 @@
 # Mine Sweeper Game Engin
 # by tasuren
 
-from random import randrange
+from typing import List, Tuple
+
+from collections import deque
+from time import perf_counter
+
+import numpy as np
+
+
+# 周りのマスのオフセットです。
+NEIGHBORS = tuple(
+    (dy, dx) for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dy or dx
+)
+DIGITS = np.array(list("012345678"))
 
 
 class Ms:
-    def __init__(self, mx, my, bomb, log=False):
-        self.reset(mx, my, bomb)
+    """NumPyを使ったマインスイーパーのゲームエンジンです。
+    周りの爆弾の数は`reset`の時に一度だけ畳み込みで計算され、
+    空白のマスの展開はキューを使って行われます。
+    残りの安全なマスの数を数えておくことで勝利判定を定数時間で行います。"""
 
-        self.check = lambda x, y: (
-            (x - 1, y + 1), (x, y + 1), (x + 1, y + 1),
-            (x - 1, y), (x, y), (x + 1, y),
-            (x - 1, y - 1), (x, y - 1), (x + 1, y - 1)
-        )
-        self.check_end = lambda n: self.mx * self.my - \
-            self.bomb == len(
-                sum([[x for x in y if x not in self.objs]for y in n], []))
-        self.get_raw = lambda: self.now
-        self.get_raw_answer = lambda: self.b
+    def __init__(self, mx: int, my: int, bomb: int, log: bool = False):
+        self.reset(mx, my, bomb, log)
+
+        self.get_raw = lambda: self._render_cells(False).tolist()
+        self.get_raw_answer = lambda: self._render_cells(True).tolist()
 
-    def reset(self, mx, my, bomb, log=False):
+    def reset(self, mx: int, my: int, bomb: int, log: bool = False) -> None:
+        "ゲームをリセットします。"
         self.log = log
         self.objs = ['#', '-', '%']
-        self.now = [['-'for x in range(mx)]for y in range(mx)]
-        self.b = [['-'for x in range(mx)]for y in range(mx)]
-        self.bomb, self.mx, self.my = bomb, mx, my
-        for i in range(bomb):
-            while True:
-                x = randrange(mx)
-                y = randrange(my)
-                if self.b[y][x] != self.objs[0]:
-                    break
-            self.b[y][x] = self.objs[0]
-
-    def back_get(self, l, margin):
-        r = " " + margin * 2 + \
-            margin.join(["0" * (len(str(self.mx)) - len(str(x))) + str(x + 1) for x in range(self.mx)]) + "\n"
-        for y in range(len(l)):
-            r += margin + ("0" * (len(str(self.my)) - len(str(y)))) + str(y + 1)
-            for x in l[y]:
-                r += margin + x
-            r += "\n"
-        return r
-
-    def get(self, margin=""):
-        return self.back_get(self.now, margin)
-
-    def get_answer(self, margin=""):
-        return self.back_get(self.b, margin)
-
-    def rep(self, x, y, z, mode=0):
-        c, bombs = self.check(x, y), 0
-        for i in range(2):
-            for cx, cy in c:
-                if cx == -1 or cy == -1:
-                    continue
-                if self.log:
-                    print(f"  Set {cx} {cy}")
-                try:
-                    if self.b[cy][cx] == self.objs[0]:
-                        bombs += 1
-                    self.now[y][x] = str(
-                        (self.objs[2] if self.now[y][x] != self.objs[2] else "-") if z else int(bombs / 2))
-                    self.b[y][x] = str(
-                        (self.objs[2] if self.b[y][x] != self.objs[2] else "-") if z else int(bombs / 2))
-                except IndexError:
-                    continue
-            if bombs == 0 and bombs != self.objs[2]:
-                for cx, cy in c:
-                    if self.log:
-                        print(f"  Set {cx} {cy}")
-                    if cx == -1 or cy == -1 or self.my <= cy or self.mx <= cx or [cx, cy] in self.did:
-                        continue
-                    self.did.append([cx, cy])
-                    self.rep(cx, cy, False, mode=1)
-
-    def set(self, x, y, z=False):
-        self.did = []
+        self.bomb, self.mx, self.my = min(max(bomb, 0), mx * my), mx, my
+
+        # 爆弾を配置する。
+        self.mines = np.zeros(mx * my, dtype=bool)
+        self.mines[np.random.choice(mx * my, self.bomb, replace=False)] = True
+        self.mines = self.mines.reshape(my, mx)
+        # 周りの爆弾の数を畳み込みで計算しておく。
+        padded = np.pad(self.mines, 1).astype(np.uint8)
+        self.counts = sum(
+            padded[1 + dy:1 + dy + my, 1 + dx:1 + dx + mx]
+            for dy, dx in NEIGHBORS
+        ).astype(np.uint8)
+
+        self.opened = np.zeros((my, mx), dtype=bool)
+        self.flags = np.zeros((my, mx), dtype=bool)
+        self.exploded: Tuple[int, int] = None
+        # 勝利判定のために残りの安全なマスの数を数えておく。
+        self.remaining = mx * my - self.bomb
+
+    def check_end(self, *_) -> bool:
+        "全ての安全なマスが開かれたかどうかを返します。"
+        return self.remaining == 0
+
+    def _render_cells(self, answer: bool) -> np.ndarray:
+        # 盤面を文字の配列にします。
+        cells = np.where(
+            self.opened, DIGITS[self.counts],
+            np.where(self.flags, self.objs[2], self.objs[1])
+        )
+        if answer:
+            cells[self.mines] = self.objs[0]
+        elif self.exploded is not None:
+            cells[self.exploded] = self.objs[0]
+        return cells
+
+    def back_get(self, cells: np.ndarray, margin: str) -> str:
+        "渡された盤面をDiscordに送信する文字列にします。"
+        xw, yw = len(str(self.mx)), len(str(self.my))
+        lines = [" " + margin * 2 + margin.join(
+            str(x + 1).zfill(xw) for x in range(self.mx)
+        )]
+        lines.extend(
+            margin + str(y + 1).zfill(yw) + margin + margin.join(row)
+            for y, row in enumerate(cells.tolist())
+        )
+        lines.append("")
+        return "\n".join(lines)
+
+    def get(self, margin: str = "") -> str:
+        "現在の盤面を文字列で取得します。"
+        return self.back_get(self._render_cells(False), margin)
+
+    def get_answer(self, margin: str = "") -> str:
+        "爆弾の位置を含めた盤面を文字列で取得します。"
+        return self.back_get(self._render_cells(True), margin)
+
+    def rep(self, x: int, y: int) -> int:
+        "指定されたマスを開きます。周りに爆弾がない場合は繋がっている所を全て開きます。"
+        queue, count = deque(((y, x),)), 0
+        self.opened[y, x] = True
+        while queue:
+            cy, cx = queue.popleft()
+            count += 1
+            if self.log:
+                print(f"  Set {cx} {cy}")
+            if self.counts[cy, cx]:
+                continue
+            for dy, dx in NEIGHBORS:
+                ny, nx = cy + dy, cx + dx
+                if (0 <= ny < self.my and 0 <= nx < self.mx
+                        and not self.opened[ny, nx]
+                        and not self.flags[ny, nx]):
+                    self.opened[ny, nx] = True
+                    queue.append((ny, nx))
+        self.remaining -= count
+        return count
+
+    def set(self, x: int, y: int, z: bool = False) -> int:
+        """マスを開くまたは旗を立てます。
+        続行の場合は`200`、勝利の場合は`301`、爆弾を開いた場合は`410`を返します。"""
         x, y = int(x) - 1, int(y) - 1
+        if not (0 <= x < self.mx and 0 <= y < self.my) or self.opened[y, x]:
+            return 200
 
-        if len(self.b) <= y:
+        if z:
+            self.flags[y, x] = not self.flags[y, x]
             return 200
-        if len(self.b[0]) <= x:
+        if self.flags[y, x]:
             return 200
-
-        sl = self.b[y][x]
-        if sl == self.objs[1]:
-            self.rep(x, y, z)
-            if self.check_end(self.b) and not z:
-                return 301
-            else:
-                return 200
-        elif sl == self.objs[0] and not z:
-            self.now[y][x] = self.objs[0]
-            self.now
+        if self.mines[y, x]:
+            self.exploded = (y, x)
             return 410
-        else:
-            return 200
+
+        self.rep(x, y)
+        return 301 if self.check_end() else 200
+
+
+def benchmark(
+    sizes: List[Tuple[int, int]] = ((50, 50), (100, 100)),
+    rate: float = 0.15, games: int = 20
+) -> None:
+    "指定された大きさの盤面でゲームを最後まで進めるのにかかる時間を計測します。"
+    for mx, my in sizes:
+        resets, moves, renders, times = 0.0, 0.0, 0.0, 0
+        for _ in range(games):
+            start = perf_counter()
+            ms = Ms(mx, my, int(mx * my * rate))
+            resets += perf_counter() - start
+
+            safe = np.argwhere(~ms.mines)
+            np.random.shuffle(safe)
+            start = perf_counter()
+            for y, x in safe.tolist():
+                times += 1
+                if ms.set(x + 1, y + 1) == 301:
+                    break
+            moves += perf_counter() - start
+
+            start = perf_counter()
+            ms.get(" ")
+            renders += perf_counter() - start
+        print(
+            f"{mx}x{my}: reset {resets / games * 1000:.3f}ms, "
+            f"move {moves / times * 1000000:.3f}us, "
+            f"render {renders / games * 1000:.3f}ms"
+        )
 
 
 if __name__ == "__main__":
+    from sys import argv
+
+    if "bench" in argv:
+        benchmark()
+        raise SystemExit
+
     x, y, z = input('x y bomb>').split()
     ms = Ms(int(x), int(y), int(z))
     kek = 200
@@ -122,4 +189,4 @@ if __name__ == "__main__":
             break
         if kek == 301:
             print(ms.get_answer(" ") + '\nGAME OVER\nYou won !')
-            break
\ No newline at end of file
+            break
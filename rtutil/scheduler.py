@@ -0,0 +1,182 @@
+# RT Util - Scheduler
+
+from typing import (
+    Callable, Coroutine, Optional, Hashable, Iterable, Any, Dict, List, Tuple
+)
+
+from asyncio import (
+    AbstractEventLoop, Event, TimeoutError, get_event_loop, gather,
+    wait_for, Semaphore
+)
+from datetime import datetime, timedelta, timezone
+from bisect import bisect_left
+from time import time
+
+from aiofiles import open as async_open
+from ujson import loads, dumps
+
+
+JST = timezone(timedelta(hours=9))
+DAY = 1440
+STATE_PATH = "data/scheduler_{}.json"
+
+
+Item = Tuple[Hashable, Any]
+
+
+def parse_time(text: str) -> int:
+    "`HH:MM`の文字列を一日の何分目かにします。"
+    hour, minute = map(int, text.split(":"))
+    if not (0 <= hour < 24 and 0 <= minute < 60):
+        raise ValueError("時刻が正しくありません。")
+    return hour * 60 + minute
+
+
+class Scheduler:
+    """毎日決まった時刻に通知を行うためのクラスです。
+    通知先は一日の何分目かごとにまとめて持っておき、次に通知先がある時刻まで待ちます。
+    最後に通知した時刻は保存され、再起動中に過ぎてしまった時刻の通知は再起動後に一度だけ行われます。
+
+    Parameters
+    ----------
+    name : str
+        最後に通知した時刻を保存するファイルの名前に使われます。
+    callback : Callable[[datetime, List[Tuple[Hashable, Any]]], Coroutine]
+        通知を行うコルーチン関数です。
+        時刻と`(キー, データ)`のリストが渡されます。
+    loop : asyncio.AbstractEventLoop, optional
+        イベントループです。
+    concurrency : int, default 10
+        `Scheduler.run_all`で同時に実行する数です。
+    replay : int, default 60
+        再起動後に何分前までの通知をやり直すかです。
+    tz : datetime.timezone, default JST
+        時刻のタイムゾーンです。"""
+
+    def __init__(
+        self, name: str,
+        callback: Callable[[datetime, List[Item]], Coroutine],
+        loop: Optional[AbstractEventLoop] = None, concurrency: int = 10,
+        replay: int = 60, tz: timezone = JST
+    ):
+        self.name, self.callback = name, callback
+        self.loop, self.replay, self.tz = loop or get_event_loop(), replay, tz
+        self.semaphore = Semaphore(concurrency)
+        self.buckets: Dict[int, Dict[Hashable, Any]] = {}
+        self.keys: Dict[Hashable, int] = {}
+        self.occupied: List[int] = []
+        self._changed = Event()
+        self._task = None
+
+    def add(self, minute: int, key: Hashable, value: Any = None) -> None:
+        """通知先を追加します。既にある場合は時刻が変更されます。
+
+        Parameters
+        ----------
+        minute : int
+            一日の何分目に通知するかです。`parse_time`で作ることができます。
+        key : Hashable
+            通知先のキーです。
+        value : Any
+            通知に使うデータです。"""
+        self.remove(key)
+        if minute not in self.buckets:
+            self.buckets[minute] = {}
+            self.occupied.insert(bisect_left(self.occupied, minute), minute)
+        self.buckets[minute][key] = value
+        self.keys[key] = minute
+        self._changed.set()
+
+    def remove(self, key: Hashable) -> None:
+        "通知先を削除します。"
+        if (minute := self.keys.pop(key, None)) is not None:
+            del self.buckets[minute][key]
+            if not self.buckets[minute]:
+                del self.buckets[minute]
+                self.occupied.remove(minute)
+            self._changed.set()
+
+    def _minute_of_day(self, epoch_minute: int) -> int:
+        # UNIX時間の分から一日の何分目かにします。
+        return int(
+            (epoch_minute + self.tz.utcoffset(None).total_seconds() // 60) % DAY
+        )
+
+    def next_after(self, epoch_minute: int) -> Optional[int]:
+        "指定された時刻より後で通知先がある一番近い時刻をUNIX時間の分で取得します。"
+        if not self.occupied:
+            return None
+        start = self._minute_of_day(epoch_minute + 1)
+        index = bisect_left(self.occupied, start)
+        minute = self.occupied[index % len(self.occupied)]
+        return epoch_minute + 1 + (minute - start) % DAY
+
+    async def _load_last(self) -> Optional[int]:
+        # 最後に通知した時刻を読み込みます。
+        try:
+            async with async_open(STATE_PATH.format(self.name), "r") as f:
+                return loads(await f.read())["last"]
+        except (FileNotFoundError, ValueError, KeyError):
+            return None
+
+    async def _save_last(self, epoch_minute: int) -> None:
+        # 最後に通知した時刻を保存します。
+        async with async_open(STATE_PATH.format(self.name), "w") as f:
+            await f.write(dumps({"last": epoch_minute}))
+
+    async def _dispatch(self, epoch_minute: int) -> None:
+        # 通知を行います。同じ時刻で二回通知しないように先に記録しておく。
+        await self._save_last(epoch_minute)
+        if (bucket := self.buckets.get(self._minute_of_day(epoch_minute))):
+            self.loop.create_task(self.callback(
+                datetime.fromtimestamp(epoch_minute * 60, self.tz),
+                list(bucket.items())
+            ))
+
+    async def _run(self) -> None:
+        now = int(time() // 60)
+        last = await self._load_last()
+        if last is None:
+            last = now - 1
+        # 再起動中に過ぎてしまった時刻の通知を行う。
+        last = max(last, now - self.replay)
+        while (epoch_minute := self.next_after(last)) is not None \
+                and epoch_minute <= now:
+            await self._dispatch(last := epoch_minute)
+        last = max(last, now)
+
+        while True:
+            self._changed.clear()
+            if (epoch_minute := self.next_after(last)) is None:
+                await self._changed.wait()
+                continue
+            try:
+                # 通知先が変更された場合は次の時刻を計算し直す。
+                await wait_for(
+                    self._changed.wait(), max(epoch_minute * 60 - time(), 0)
+                )
+            except TimeoutError:
+                await self._dispatch(last := epoch_minute)
+
+    def start(self) -> None:
+        "通知を開始します。通知先を追加してから実行してください。"
+        if self._task is None:
+            self._task = self.loop.create_task(self._run())
+
+    def close(self) -> None:
+        "通知を停止します。"
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def run_all(
+        self, function: Callable[[Item], Coroutine], items: Iterable[Item]
+    ) -> None:
+        "同時に実行する数を制限しながら通知先それぞれに対して関数を実行します。"
+        async def run(item: Item):
+            async with self.semaphore:
+                try:
+                    await function(item)
+                except Exception as e:
+                    print(f"Error on {self.name}'s notification:", e)
+        await gather(*map(run, items))
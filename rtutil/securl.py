@@ -1,10 +1,13 @@
 # RT Util - Sec URL
 
-from typing import TypedDict
+from typing import TYPE_CHECKING, TypedDict, Union
 
 from aiohttp import ClientSession
 from ujson import loads
 
+if TYPE_CHECKING:
+    from rtlib import HTTPManager
+
 
 HEADERS = {
     "Connection": "keep-alive",
@@ -41,16 +44,17 @@ class SecURLData(TypedDict, total=False):
 
 
 async def check(
-    session: ClientSession, url: str, wait_time: int = 1,
+    session: Union[ClientSession, "HTTPManager"], url: str, wait_time: int = 1,
     browser_width: int = 965, browser_height: int = 683,
-    headers: dict = HEADERS
+    headers: dict = HEADERS, ttl: float = 600.0
 ) -> SecURLData:
     """渡されたURLをSecURLでチェックします。
 
     Parameters
     ----------
-    session : aiohttp.ClientSession
+    session : Union[aiohttp.ClientSession, rtlib.HTTPManager]
         通信に使うsessionです。
+        `rtlib.HTTPManager`を渡した場合は結果がキャッシュされます。
     url : str
         チェックするURLです。
     wait_time : int, default 1
@@ -61,16 +65,24 @@ async def check(
         ブラウザのサイズです。
     headers : dict, default HEADERS
         通信に使うヘッダーです。通常は変更しなくても大丈夫です。
+    ttl : float, default 600.0
+        `rtlib.HTTPManager`を使う場合に結果をキャッシュする秒数です。
 
     Raises
     ------
     ValueError : URLにアクセスできなかった際などの失敗時に発生します。"""
+    data = {
+        "url": url, 'waitTime': str(wait_time),
+        'browserWidth': str(browser_width),
+        'browserHeight': str(browser_height), 'from': ''
+    }
+    if not isinstance(session, ClientSession):
+        return await session.post(
+            "https://securl.nu/jx/get_page_jx.php", data=data,
+            headers=headers, json=True, ttl=ttl
+        )
     async with session.post(
-        "https://securl.nu/jx/get_page_jx.php", data={
-            "url": url, 'waitTime': str(wait_time),
-            'browserWidth': str(browser_width),
-            'browserHeight': str(browser_height), 'from': ''
-        }, headers=headers
+        "https://securl.nu/jx/get_page_jx.php", data=data, headers=headers
     ) as r:
         return loads(await r.text())
 
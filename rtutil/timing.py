@@ -0,0 +1,69 @@
+# RT Util - Timing
+
+from typing import Callable, Coroutine, Any, List
+
+from bisect import bisect_left
+from time import perf_counter
+from types import coroutine
+
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """処理時間のヒストグラムです。
+    `total`は待機中を含めた時間で、`busy`はイベントループを実際に占有していた時間です。"""
+
+    __slots__ = ("counts", "count", "total", "busy", "max_busy")
+
+    def __init__(self):
+        self.counts: List[int] = [0] * (len(BUCKETS) + 1)
+        self.count, self.total, self.busy, self.max_busy = 0, 0.0, 0.0, 0.0
+
+    def observe(self, elapsed: float, busy: float = 0.0) -> None:
+        "計測した時間を記録します。"
+        self.counts[bisect_left(BUCKETS, elapsed)] += 1
+        self.count += 1
+        self.total += elapsed
+        self.busy += busy
+        self.max_busy = max(self.max_busy, busy)
+
+    def to_dict(self) -> dict:
+        "辞書にします。"
+        return {
+            "count": self.count, "total": self.total, "busy": self.busy,
+            "max_busy": self.max_busy, "buckets": dict(zip(
+                [str(bucket) for bucket in BUCKETS] + ["+Inf"], self.counts
+            ))
+        }
+
+
+@coroutine
+def measure(coro: Coroutine, callback: Callable[[float, float], Any]):
+    """コルーチンを実行してイベントループを占有していた時間と全体の時間を計ります。
+    `await measure(coro, histogram.observe)`のように使います。
+
+    Parameters
+    ----------
+    coro : Coroutine
+        実行するコルーチンです。
+    callback : Callable[[float, float], Any]
+        終わった際に`(全体の時間, 占有していた時間)`で呼ばれる関数です。"""
+    start, busy, value, error = perf_counter(), 0.0, None, None
+    while True:
+        before = perf_counter()
+        try:
+            yielded = coro.throw(error) if error else coro.send(value)
+        except StopIteration as e:
+            busy += perf_counter() - before
+            callback(perf_counter() - start, busy)
+            return e.value
+        except BaseException:
+            busy += perf_counter() - before
+            callback(perf_counter() - start, busy)
+            raise
+        busy += perf_counter() - before
+        try:
+            value, error = (yield yielded), None
+        except BaseException as e:
+            value, error = None, e
@@ -0,0 +1,218 @@
+# RT Util - Translator
+
+from typing import (
+    Callable, Optional, Hashable, Dict, List, Tuple
+)
+
+from asyncio import (
+    AbstractEventLoop, Future, TimerHandle, get_event_loop, gather, shield
+)
+from concurrent.futures import Executor
+from collections import defaultdict
+from functools import partial
+from time import sleep
+import re
+
+from rtlib.http_manager import ResponseCache
+
+
+Backend = Callable[[str, str], str]
+NOT_LINGUISTIC = re.compile(
+    r"<a?:\w+:\d+>|<(?:@[!&]?|#)\d+>|https?://\S+"
+)
+
+
+def google_backend(text: str, target: str) -> str:
+    "Google翻訳で翻訳します。"
+    import deep_translator
+    return deep_translator.GoogleTranslator(target=target).translate(text)
+
+
+def stub_backend(text: str, target: str, latency: float = 0.2) -> str:
+    "翻訳をせずに少し待ってから言語コードを付けて返します。ベンチマーク用です。"
+    sleep(latency)
+    return "\n".join(f"[{target}] {line}" for line in text.split("\n"))
+
+
+def normalize(text: str) -> str:
+    "キャッシュのキーにするために余計な空白を消します。"
+    return "\n".join(
+        " ".join(line.split()) for line in text.strip().splitlines()
+    )
+
+
+def is_linguistic(text: str) -> bool:
+    "絵文字やメンション、URLを除いて翻訳できる文字があるかどうかを調べます。"
+    return any(char.isalpha() for char in NOT_LINGUISTIC.sub("", text))
+
+
+class Translator:
+    """翻訳のキャッシュと同じ翻訳のまとめ、短い間に来た翻訳の一括処理を行うクラスです。
+    同じ言語への翻訳が`window`秒以内に複数来た場合は改行で繋げて一度に翻訳します。
+
+    Parameters
+    ----------
+    backend : Callable[[str, str], str], default google_backend
+        `(翻訳する文字列, 言語コード)`を受け取り翻訳結果を返す関数です。
+        ワーカープールで実行されます。
+    loop : asyncio.AbstractEventLoop, optional
+        イベントループです。
+    cache_size : int, default 4096
+        キャッシュする翻訳結果の最大の数です。
+    ttl : float, default 86400
+        翻訳結果をキャッシュする秒数です。
+    window : float, default 0.1
+        翻訳をまとめるために待つ秒数です。
+    max_batch : int, default 10
+        一度にまとめる翻訳の最大の数です。
+    max_length : int, default 4500
+        一度に翻訳する文字数の上限です。
+    executor : concurrent.futures.Executor, optional
+        `backend`を実行するワーカープールです。"""
+
+    def __init__(
+        self, backend: Backend = google_backend,
+        loop: Optional[AbstractEventLoop] = None, cache_size: int = 4096,
+        ttl: float = 86400, window: float = 0.1, max_batch: int = 10,
+        max_length: int = 4500, executor: Optional[Executor] = None
+    ):
+        self.backend, self.loop = backend, loop or get_event_loop()
+        self.cache, self.ttl = ResponseCache(cache_size), ttl
+        self.window, self.max_batch = window, max_batch
+        self.max_length, self.executor = max_length, executor
+        self.requests: Dict[Hashable, Future] = {}
+        self.batches: Dict[str, List[Tuple[str, Future]]] = defaultdict(list)
+        self.timers: Dict[str, TimerHandle] = {}
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    async def translate(self, text: str, target: str) -> str:
+        """翻訳をします。翻訳する必要のない文字列はそのまま返します。
+
+        Parameters
+        ----------
+        text : str
+            翻訳する文字列です。
+        target : str
+            翻訳先の言語コードです。"""
+        if not is_linguistic(text):
+            self.counts["skipped"] += 1
+            return text
+
+        key = (text := normalize(text), target)
+        value, found, _ = self.cache.get(key)
+        if found:
+            self.counts["hits"] += 1
+            return value
+        if key in self.requests:
+            # 同じ翻訳が実行中の場合はそれを待つ。
+            self.counts["coalesced"] += 1
+            return await shield(self.requests[key])
+        self.counts["misses"] += 1
+
+        self.requests[key] = future = self.loop.create_future()
+        if "\n" in text or len(text) >= self.max_length:
+            # 改行を含むものは分割できないのでまとめない。
+            self.loop.create_task(self._run(target, [(text, future)]))
+        else:
+            batch = self.batches[target]
+            if batch and sum(len(text) + 1 for text, _ in batch) \
+                    + len(text) > self.max_length:
+                self._flush(target)
+            self.batches[target].append((text, future))
+            if len(self.batches[target]) >= self.max_batch:
+                self._flush(target)
+            elif target not in self.timers:
+                self.timers[target] = self.loop.call_later(
+                    self.window, self._flush, target
+                )
+        return await shield(future)
+
+    def _flush(self, target: str) -> None:
+        # 溜まっている翻訳を実行します。
+        if (timer := self.timers.pop(target, None)) is not None:
+            timer.cancel()
+        if (batch := self.batches.pop(target, None)):
+            self.loop.create_task(self._run(target, batch))
+
+    async def _call(self, text: str, target: str) -> str:
+        # 翻訳をワーカープールで実行します。
+        self.counts["upstream"] += 1
+        return await self.loop.run_in_executor(
+            self.executor, partial(self.backend, text, target)
+        )
+
+    async def _run(self, target: str, batch: List[Tuple[str, Future]]) -> None:
+        # 翻訳を実行して結果をキャッシュします。
+        texts = [text for text, _ in batch]
+        try:
+            if len(texts) == 1:
+                results = [await self._call(texts[0], target)]
+            else:
+                results = (
+                    await self._call("\n".join(texts), target)
+                ).split("\n")
+                if len(results) != len(texts):
+                    # 改行の数が変わってしまった場合は一つずつ翻訳する。
+                    results = await gather(*(
+                        self._call(text, target) for text in texts
+                    ))
+        except Exception as e:
+            for text, future in batch:
+                self.requests.pop((text, target), None)
+                if not future.done():
+                    future.set_exception(e)
+                    # 誰も待っていない場合に警告が出ないようにする。
+                    future.exception()
+        else:
+            for (text, future), result in zip(batch, results):
+                self.cache.set((text, target), result, self.ttl)
+                self.requests.pop((text, target), None)
+                if not future.done():
+                    future.set_result(result)
+
+    def stats(self) -> Dict[str, int]:
+        "キャッシュのヒット数などを取得します。"
+        return dict(self.counts, cached=len(self.cache.data))
+
+
+if __name__ == "__main__":
+    from random import choice, random, seed
+    from asyncio import run, sleep as asleep
+    from time import perf_counter
+
+    PHRASES = [
+        "Hello!", "Good morning", "How are you?", "lol", "Thank you so much",
+        "<:pepe:123456789012345678>", "👍", "https://example.com",
+        "I wanna be the guy!", "See you tomorrow", "What time is it?"
+    ] + [f"Unique message number {i}" for i in range(40)]
+
+    async def bench(translate: Callable, length: int = 300) -> float:
+        # メッセージが少しずつ送られてくる状況を再現する。
+        seed(0)
+        start, tasks = perf_counter(), []
+        for _ in range(length):
+            tasks.append(get_event_loop().create_task(
+                translate(choice(PHRASES), "ja")
+            ))
+            await asleep(random() * 0.005)
+        await gather(*tasks)
+        return perf_counter() - start
+
+    async def main():
+        loop = get_event_loop()
+        naive = {"upstream": 0}
+
+        async def naive_translate(text, target):
+            naive["upstream"] += 1
+            return await loop.run_in_executor(
+                None, partial(stub_backend, text, target)
+            )
+
+        print(f"naive : {await bench(naive_translate):.2f}s, {naive}")
+        translator = Translator(stub_backend, loop)
+        print(
+            f"cached: {await bench(translator.translate):.2f}s, "
+            f"{translator.stats()}"
+        )
+
+    run(main())
@@ -0,0 +1,45 @@
+from random import Random
+
+import pytest
+
+from rtutil.bktree import BKTree, damerau_levenshtein
+
+
+def brute_force(words, word, tolerance):
+    return sorted(
+        (distance, target) for target in set(words)
+        if (distance := damerau_levenshtein(word, target)) <= tolerance
+    )
+
+
+def test_transposition_is_found():
+    # 制限付きの編集距離だと三角不等式を満たさず、この`acb`が見つからなかった。
+    tree = BKTree(["acab", "cbcb", "ba", "acb", "bcba", "cccb"])
+    assert tree.search("abc", 1) == [(1, "acb")]
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_search_matches_brute_force(seed):
+    random = Random(seed)
+    words = [
+        "".join(random.choices("abcd", k=random.randint(1, 7)))
+        for _ in range(300)
+    ]
+    tree = BKTree(words)
+    for _ in range(100):
+        word = "".join(random.choices("abcd", k=random.randint(1, 7)))
+        tolerance = random.randint(0, 3)
+        assert tree.search(word, tolerance) == brute_force(words, word, tolerance)
+
+
+def test_triangle_inequality():
+    random = Random(0)
+    words = [
+        "".join(random.choices("abc", k=random.randint(0, 5)))
+        for _ in range(60)
+    ]
+    for a in words:
+        for b in words:
+            for c in words[:20]:
+                assert damerau_levenshtein(a, c) <= \
+                    damerau_levenshtein(a, b) + damerau_levenshtein(b, c)
@@ -0,0 +1,50 @@
+from asyncio import get_running_loop, run, sleep
+from time import time
+
+from rtutil.deadline import DeadlineHeap
+
+
+def test_due_items_are_passed_in_order():
+    async def main():
+        done = []
+
+        async def callback(items):
+            done.extend(key for key, _ in items)
+
+        heap = DeadlineHeap(callback, get_running_loop())
+        heap.start()
+        now = time()
+        heap.push("b", now + 0.02)
+        heap.push("a", now + 0.01)
+        heap.push("c", now + 0.03)
+        heap.remove("c")
+        await sleep(0.1)
+        heap.close()
+        return done, len(heap)
+
+    assert run(main()) == (["a", "b"], 0)
+
+
+def test_failed_items_are_retried():
+    async def main():
+        calls, errors = [], []
+
+        async def callback(items):
+            calls.append(items)
+            if len(calls) == 1:
+                raise ValueError("failed")
+
+        async def on_error(event, items):
+            errors.append((event, items))
+
+        heap = DeadlineHeap(callback, get_running_loop(), on_error)
+        heap.RETRY_AFTER = 0.01
+        heap.start()
+        heap.push("a", time(), 1)
+        await sleep(0.1)
+        heap.close()
+        return calls, errors
+
+    calls, errors = run(main())
+    assert calls == [[("a", 1)], [("a", 1)]]
+    assert errors == [("DeadlineHeap", [("a", 1)])]
@@ -0,0 +1,68 @@
+from asyncio import run, sleep
+from random import Random
+from time import monotonic
+
+from rtutil.jobs import Job, RateLimited
+
+
+class FakeHTTP:
+    "一定時間に一定回数を超えると429を返す偽物のHTTPクライアントです。"
+
+    def __init__(self, limit: int = 10, per: float = 0.2, seed: int = 0):
+        self.limit, self.per, self.random = limit, per, Random(seed)
+        self.window, self.count, self.rejected = monotonic(), 0, 0
+        self.done, self.in_flight, self.max_in_flight = [], 0, 0
+
+    async def request(self, item: int) -> None:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await sleep(0.001 + self.random.random() * 0.004)
+            if (now := monotonic()) - self.window >= self.per:
+                self.window, self.count = now, 0
+            if self.count >= self.limit:
+                self.rejected += 1
+                raise RateLimited(self.per - (now - self.window))
+            self.count += 1
+            self.done.append(item)
+        finally:
+            self.in_flight -= 1
+
+
+def test_job_retries_rate_limited_items():
+    http = FakeHTTP()
+    job = run(Job(list(range(1, 41)), http.request, concurrency=4).run())
+    assert job.state == "done"
+    assert sorted(http.done) == list(range(1, 41))
+    assert http.rejected > 0 and job.limited == http.rejected
+    assert http.max_in_flight <= 4
+    assert job.cursor == 40 and not job.failed
+
+
+def test_job_resumes_from_cursor_and_records_failures():
+    done = []
+
+    async def action(item: int) -> None:
+        if item == 7:
+            raise Exception("failed")
+        done.append(item)
+
+    job = run(Job(list(range(1, 11)), action, cursor=5).run())
+    assert sorted(done) == [6, 8, 9, 10]
+    assert job.failed == [(7, "failed")]
+    assert job.processed == job.total == 5 and job.cursor == 10
+
+
+def test_job_cancel_keeps_cursor_at_finished_items():
+    async def main():
+        async def action(item: int) -> None:
+            if item == 3:
+                job.cancel()
+            await sleep(0)
+
+        job = Job(list(range(1, 101)), action, concurrency=1)
+        return await job.run()
+
+    job = run(main())
+    assert job.state == "cancelled"
+    assert job.cursor == 3 and job.processed == 3
@@ -0,0 +1,73 @@
+from asyncio import get_running_loop, run, sleep
+from types import SimpleNamespace
+
+from discord.ext import commands
+
+from rtlib.ext.message_router import MessageRouter, route
+
+
+class Handlers(commands.Cog):
+    def __init__(self):
+        self.channel_ids = {2}
+        self.received = []
+
+    @route()
+    async def on_any(self, message):
+        self.received.append(("any", message.content))
+
+    @route(prefix="rt!", prefixed=True)
+    async def on_prefixed(self, message):
+        self.received.append(("prefixed", message.content))
+
+    @route(channels="channel_ids", topic="rt>test")
+    async def on_topic(self, message):
+        self.received.append(("topic", message.content))
+
+    @route(bots=True, guild_only=False)
+    async def on_failure(self, message):
+        raise ValueError(message.content)
+
+
+def make_message(content, bot=False, guild=True, channel_id=2, topic=None):
+    return SimpleNamespace(
+        content=content, author=SimpleNamespace(bot=bot),
+        guild=SimpleNamespace(id=1) if guild else None,
+        channel=SimpleNamespace(id=channel_id, topic=topic)
+    )
+
+
+def dispatch(*messages):
+    handlers, errors = Handlers(), []
+
+    async def on_error(event, *args):
+        errors.append(event)
+
+    async def main():
+        bot = SimpleNamespace(
+            command_prefix=["rt!"], cogs={"Handlers": handlers},
+            loop=get_running_loop(), on_error=on_error
+        )
+        router = MessageRouter(bot)
+        for message in messages:
+            await router.on_message(message)
+        await sleep(0.01)
+        return router
+
+    return handlers, errors, run(main())
+
+
+def test_route_filters_messages():
+    handlers, errors, router = dispatch(
+        make_message("hello", topic="rt>test\nabout"),
+        make_message("rt!help"),
+        make_message("from bot", bot=True),
+        make_message("dm", guild=False),
+        make_message("other", channel_id=3, topic="rt>test")
+    )
+    assert sorted(handlers.received) == [
+        ("any", "hello"), ("any", "other"),
+        ("prefixed", "rt!help"), ("topic", "hello")
+    ]
+    assert errors == ["Handlers.on_failure"] * 4
+    assert router.timings["Handlers.on_any"].count == 2
+    assert router.timings["Handlers.on_failure"].count == 4
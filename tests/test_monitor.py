@@ -0,0 +1,5 @@
+from rtlib.ext.monitor import escape_label
+
+
+def test_escape_label():
+    assert escape_label('a\\b"c\nd') == 'a\\\\b\\"c\\nd'
@@ -0,0 +1,44 @@
+from asyncio import run, sleep
+
+import pytest
+
+from rtutil.timing import BUCKETS, Histogram, measure
+
+
+def test_measure_awaits_and_records():
+    async def work():
+        await sleep(0.01)
+        return "done"
+
+    histogram = Histogram()
+
+    async def main():
+        return await measure(work(), histogram.observe)
+
+    assert run(main()) == "done"
+    assert histogram.count == 1
+    assert histogram.total >= 0.01 > histogram.busy
+
+
+def test_measure_records_and_raises_errors():
+    async def work():
+        await sleep(0)
+        raise ValueError("failed")
+
+    histogram = Histogram()
+
+    async def main():
+        await measure(work(), histogram.observe)
+
+    with pytest.raises(ValueError):
+        run(main())
+    assert histogram.count == 1
+
+
+def test_histogram_buckets():
+    histogram = Histogram()
+    histogram.observe(0.0005)
+    histogram.observe(100.0)
+    buckets = histogram.to_dict()["buckets"]
+    assert buckets[str(BUCKETS[0])] == 1
+    assert buckets["+Inf"] == 1